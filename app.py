@@ -1,61 +1,221 @@
 import os
-from datetime import datetime, timedelta
-from flask import Flask, render_template, redirect, url_for, flash, request
-from models import db
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your_super_secret_key_here')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///parking.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login' 
+import click
+from datetime import datetime
+from flask import Flask, render_template, redirect, url_for
+from config import CONFIGS, DEFAULT_SECRET_KEY, engine_options, shard_binds
+from models import db, init_db, init_migrations
+from services.sql_metrics import init_sql_metrics
+from services.page_cache import init_page_cache, cache_anonymous
+from flask_login import LoginManager, current_user
 
+# Every model, so the metadata is complete for `flask db` and db.create_all()
 from models.user import User
 from models.lot import ParkingLot
 from models.slot import ParkingSlot
 from models.reservation import Reservation
+from models.lot_occupancy import LotOccupancy
+from models.reservation_archive import ReservationArchive
+from models.user_summary import UserSummary
+from models.analytics import LotHourlyOccupancy, LotDailyRevenue, AnalyticsWatermark
+from services.events import configure_broker
+from services.export import EXPORT_FORMATS
+from services.user_cache import user_cache
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
 
-# --- Blueprints Registration ---
-from controllers.auth_controller import auth_bp
-from controllers.main_controller import main_bp
+def create_app(config_name=None, cli=True, **overrides):
+    """Build the application.
 
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(main_bp, url_prefix='/')
+    ``config_name`` picks a class from ``config.CONFIGS`` and defaults to the
+    APP_CONFIG environment variable ('development' if unset); ``overrides``
+    are applied on top. ``cli=False`` leaves out Flask-Migrate and the
+    management commands, which a WSGI worker never uses (wsgi.py).
+    """
+    config_name = config_name or os.environ.get('APP_CONFIG', 'development')
+    if config_name not in CONFIGS:
+        raise RuntimeError(f"Unknown APP_CONFIG {config_name!r}, expected one of: {', '.join(CONFIGS)}.")
 
-@app.context_processor
-def inject_globals():
-    return dict(current_user=current_user, now=datetime.utcnow)
+    app = Flask(__name__)
+    app.config.from_object(CONFIGS[config_name])
+    app.config['APP_CONFIG'] = config_name
+    app.config.update(overrides)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    app.config.setdefault('SQLALCHEMY_BINDS', shard_binds(app.config))
+    if app.config['SECRET_KEY_REQUIRED'] and app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+        raise RuntimeError('Set SECRET_KEY in the environment; the built-in default is only for development.')
+
+    init_db(app)
+    init_sql_metrics(app)
+    init_page_cache(app)
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+    login_manager.login_view = 'auth.login'
+
+    configure_broker(app.config)
+    user_cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return user_cache.get(int(user_id))
+
+    # --- Blueprints Registration ---
+    from controllers.auth_controller import auth_bp
+    from controllers.main_controller import main_bp
+    from controllers.api_controller import api_bp
+
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(main_bp, url_prefix='/')
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    @app.context_processor
+    def inject_globals():
+        return dict(current_user=current_user, now=datetime.utcnow)
+
+    # --- Routes ---
+    @app.route('/')
+    @cache_anonymous
+    def index():
+        if current_user.is_authenticated:
+            return redirect(url_for('main.dashboard'))
+        return render_template('index.html')
+
+    if cli:
+        init_migrations(app)
+        register_commands(app)
+    return app
+
+
+def register_commands(app):
+    """Management commands (`flask --app app <command>`).
+
+    Services only the commands use are imported when the command runs, so
+    loading the app for one command does not import all of them.
+    """
+
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Apply migrations, create the first admin and the lot counters (safe to repeat)."""
+        from services.bootstrap import bootstrap
+        for line in bootstrap(app):
+            print(line)
+
+    @app.cli.command('rebuild-occupancy')
+    def rebuild_occupancy():
+        """Recompute the per-lot dashboard counters from scratch."""
+        LotOccupancy.rebuild()
+        print("Lot occupancy counters rebuilt.")
+
+    @app.cli.command('sync-shards')
+    def sync_shards_command():
+        """Copy every user and lot from the main database into the other shards."""
+        from models.shards import sync_replicas
+        counts = sync_replicas()
+        print(f"{counts['user']} users and {counts['parking_lot']} lots copied to "
+              f"{app.config['SHARD_COUNT'] - 1} shards.")
+
+    @app.cli.command('add-slots')
+    @click.argument('lot_id', type=int)
+    @click.argument('slot_range')
+    def add_slots_command(lot_id, slot_range):
+        """Add a range of slots to a lot, e.g. add-slots 3 L1-001..L1-500."""
+        from services.provisioning import expand_slot_range, bulk_add_slots, ProvisioningError
+        from models.shards import use_shard, lot_shard
+        with use_shard(lot_shard(lot_id)):
+            lot = db.session.get(ParkingLot, lot_id)
+            if lot is None:
+                raise click.ClickException(f'Parking lot {lot_id} does not exist.')
+            try:
+                added, skipped = bulk_add_slots(lot, expand_slot_range(slot_range))
+            except ProvisioningError as e:
+                raise click.ClickException(str(e))
+        print(f"{added} slots added to {lot.name}, {skipped} already existed.")
+
+    @app.cli.command('import-lots')
+    @click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+    def import_lots_command(csv_file):
+        """Create lots and slots from a CSV file in one transaction."""
+        from services.provisioning import import_lots_csv, ProvisioningError
+        try:
+            created, added, skipped = import_lots_csv(csv_file)
+        except ProvisioningError as e:
+            raise click.ClickException(str(e))
+        print(f"{created} lots created, {added} slots added, {skipped} existing slots skipped.")
+
+    @app.cli.command('export-reservations')
+    @click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+    @click.option('--status', default=None, help='Only reservations with this status.')
+    @click.option('--lot-id', type=int, default=None)
+    @click.option('--from', 'date_from', type=click.DateTime(['%Y-%m-%d']), default=None, help='Start date (inclusive).')
+    @click.option('--to', 'date_to', type=click.DateTime(['%Y-%m-%d']), default=None, help='End date (inclusive).')
+    @click.option('--output', type=click.File('w', encoding='utf-8'), default='-')
+    def export_reservations_command(fmt, status, lot_id, date_from, date_to, output):
+        """Stream reservations to CSV or JSON Lines."""
+        from services.export import reservation_rows, iter_export
+        rows = reservation_rows(status=status, lot_id=lot_id, date_from=date_from, date_to=date_to)
+        for chunk in iter_export(fmt, rows):
+            output.write(chunk)
+
+    @app.cli.command('audit-costs')
+    @click.option('--lot-id', type=int, default=None, help='Only reservations in this lot.')
+    @click.option('--apply', is_flag=True, help='Write recomputed costs (default is a dry run).')
+    def audit_costs_command(lot_id, apply):
+        """Recompute completed/paid reservation costs with the current tariff."""
+        from services.tariff import Tariff, audit_costs
+        report = audit_costs(Tariff.from_config(app.config), lot_id=lot_id, apply=apply)
+        print(f"Checked {report['checked']} reservations, {report['different']} differ from the tariff.")
+        print(f"Stored total: {report['stored_total']:,.2f}  Recomputed total: {report['recomputed_total']:,.2f}")
+        for sample in report['samples']:
+            print(f"  reservation {sample['id']}: stored {sample['stored']} -> {sample['recomputed']:.2f}")
+        if apply and report['different']:
+            # Lifetime spend includes the old costs; rebuild totals lazily
+            UserSummary.invalidate()
+        print("Costs updated." if apply else "Dry run, nothing written. Use --apply to update.")
+
+    @app.cli.command('refresh-analytics')
+    def refresh_analytics_command():
+        """Update occupancy/revenue rollups for reservations changed since the last run."""
+        from services.analytics import refresh_rollups
+        rebuilt = refresh_rollups()
+        print(f"Analytics rollups refreshed ({rebuilt} lot-days recomputed).")
+
+    @app.cli.command('expire-bookings')
+    def expire_bookings_command():
+        """Cancel advance bookings whose window ended without a check-in."""
+        from services.booking import expire_missed_bookings
+        print(f"{expire_missed_bookings()} missed advance bookings cancelled.")
+
+    @app.cli.command('archive-reservations')
+    @click.option('--older-than-days', type=int, default=None,
+                  help='Age since the last change (default: ARCHIVE_AFTER_DAYS).')
+    @click.option('--batch-size', type=int, default=None, help='Rows per transaction (default: ARCHIVE_BATCH_SIZE).')
+    def archive_reservations_command(older_than_days, batch_size):
+        """Move old paid/cancelled reservations into the archive table."""
+        from services.archive import archive_reservations
+        days = older_than_days if older_than_days is not None else app.config['ARCHIVE_AFTER_DAYS']
+        moved = archive_reservations(days, batch_size=batch_size or app.config['ARCHIVE_BATCH_SIZE'])
+        print(f"{moved} reservations older than {days} days archived.")
+
+    @app.cli.command('seed-data')
+    @click.option('--users', type=int, default=100)
+    @click.option('--lots', type=int, default=10)
+    @click.option('--slots-per-lot', type=int, default=50)
+    @click.option('--reservations', type=int, default=5000, help='Past (paid/completed/cancelled) stays.')
+    @click.option('--occupancy', type=float, default=0.35, help='Share of slots with an active stay.')
+    @click.option('--days', type=int, default=90, help='How far back past stays go.')
+    @click.option('--seed', type=int, default=42, help='Random seed; the same seed gives the same data.')
+    def seed_data_command(users, lots, slots_per_lot, reservations, occupancy, days, seed):
+        """Add synthetic users, lots, slots and reservations for testing and benchmarks."""
+        from services.seed import seed_demo_data
+        from services.tariff import Tariff
+        counts = seed_demo_data(users=users, lots=lots, slots_per_lot=slots_per_lot, reservations=reservations,
+                                occupancy=occupancy, days=days, seed=seed, tariff=Tariff.from_config(app.config))
+        print(f"Seeded {counts['users']} users, {counts['lots']} lots, {counts['slots']} slots, "
+              f"{counts['reservations']} reservations. Seeded users log in with password 'password'.")
 
-# --- Routes ---
-@app.route('/')
-def index():
-    if current_user.is_authenticated:
-        return redirect(url_for('main.dashboard'))
-    return render_template('index.html')
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        # Admin user
-        if not User.query.filter_by(role='admin').first():
-            admin_user = User(
-                name='Admin',
-                email='admin@example.com',
-                password=generate_password_hash('adminpassword', method='pbkdf2:sha256'),
-                role='admin'
-            )
-            db.session.add(admin_user)
-            db.session.commit()
-            print("Admin user created: admin@example.com / adminpassword")
-
-    app.run(debug=True)
\ No newline at end of file
+    # Development server; production runs wsgi.py under gunicorn (see README)
+    app = create_app()
+    from services.bootstrap import bootstrap
+    for line in bootstrap(app):
+        print(line)
+    app.run(debug=app.config['DEBUG'])
@@ -0,0 +1,103 @@
+"""Multi-threaded load test for the booking engine.
+
+Many threads race to book the same small set of slots, both by slot id and
+through "any free slot in this lot". Afterwards every slot must have at most
+one active reservation and the slot/reservation/counter tables must agree.
+
+    python -m benchmarks.booking_contention --threads 32 --slots 20 --attempts 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from app import create_app
+from models import db
+from models.user import User
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.lot_occupancy import LotOccupancy
+from services.booking import claim_slot, claim_any_slot, SlotUnavailable
+
+
+def make_app(path):
+    return create_app('testing', SQL_REPEAT_RAISE=False, SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+
+
+def seed(app, slots, threads):
+    with app.app_context():
+        db.create_all()
+        lot = ParkingLot(name='Contention Lot', location='Bench', price=10.0)
+        lot.occupancy = LotOccupancy()
+        db.session.add(lot)
+        db.session.add_all(User(name=f'u{i}', email=f'u{i}@bench', password='x') for i in range(threads))
+        db.session.flush()
+        db.session.add_all(ParkingSlot(lot_id=lot.id, slot_number=f'S{i:03d}', status='available') for i in range(slots))
+        db.session.commit()
+        LotOccupancy.rebuild()
+        return lot.id, [s.id for s in ParkingSlot.query.all()]
+
+
+def run(args):
+    path = os.path.join(tempfile.mkdtemp(), 'contention.db')
+    app = make_app(path)
+    lot_id, slot_ids = seed(app, args.slots, args.threads)
+    results = {'booked': 0, 'rejected': 0}
+    lock = threading.Lock()
+    start = threading.Barrier(args.threads)
+
+    def worker(user_id):
+        rng = random.Random(user_id)
+        with app.app_context():
+            start.wait()
+            for attempt in range(args.attempts):
+                plate = f'MH{user_id:04d}{attempt:05d}'
+                try:
+                    if rng.random() < 0.5:
+                        claim_slot(rng.choice(slot_ids), user_id, plate)
+                    else:
+                        claim_any_slot(lot_id, user_id, plate)
+                    outcome = 'booked'
+                except SlotUnavailable:
+                    outcome = 'rejected'
+                finally:
+                    db.session.remove()
+                with lock:
+                    results[outcome] += 1
+
+    began = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i + 1,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    with app.app_context():
+        double_booked = db.session.query(Reservation.slot_id).filter(
+            Reservation.status == 'active'
+        ).group_by(Reservation.slot_id).having(db.func.count(Reservation.id) > 1).count()
+        active = Reservation.query.filter_by(status='active').count()
+        occupied = ParkingSlot.query.filter_by(status='occupied').count()
+        counters = db.session.get(LotOccupancy, lot_id)
+        counter_ok = counters.reservations_active == active and counters.slots_occupied == occupied
+
+    total = args.threads * args.attempts
+    print(f'{total} attempts by {args.threads} threads in {elapsed:.2f}s ({total / elapsed:,.0f}/s)')
+    print(f'booked={results["booked"]} rejected={results["rejected"]} active={active} occupied={occupied}')
+    print(f'double-booked slots: {double_booked}; counters consistent: {counter_ok}')
+    ok = double_booked == 0 and active == occupied == results['booked'] and counter_ok
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--slots', type=int, default=20)
+    parser.add_argument('--attempts', type=int, default=50)
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,132 @@
+"""Read throughput on view_parking while book_slot writes are in flight.
+
+Runs the same workload twice, once with SQLite's rollback journal and once
+with the WAL configuration from config.py, each against a fresh database:
+
+    python -m benchmarks.concurrent_reads --readers 8 --writers 2 --duration 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+MODES = ('DELETE', 'WAL')
+
+
+def run_mode(args):
+    path = os.path.join(tempfile.mkdtemp(), 'reads.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['SQLITE_JOURNAL_MODE'] = args.mode
+
+    from app import create_app
+    from flask_migrate import upgrade
+    from models import db
+    from models.user import User
+    from models.lot import ParkingLot
+    from models.slot import ParkingSlot
+    from models.reservation import Reservation
+    from models.lot_occupancy import LotOccupancy
+
+    app = create_app('testing', SQL_REPEAT_RAISE=False)
+
+    clients = args.readers + args.writers
+    with app.app_context():
+        upgrade()
+        for i in range(clients):
+            user = User(name=f'bench{i}', email=f'bench{i}@example.com', role='user')
+            user.set_password('bench')
+            db.session.add(user)
+        for l in range(args.lots):
+            lot = ParkingLot(name=f'Lot {l}', location='Bench', price=40.0)
+            lot.slots = [ParkingSlot(slot_number=f'{l}-{s:03d}', status='available') for s in range(args.slots)]
+            db.session.add(lot)
+        db.session.commit()
+        LotOccupancy.rebuild()
+        slot_ids = [slot_id for (slot_id,) in db.session.query(ParkingSlot.id).order_by(ParkingSlot.id)]
+
+    def logged_in(i):
+        client = app.test_client()
+        client.post('/auth/login', data={'email': f'bench{i}@example.com', 'password': 'bench'})
+        return client
+
+    counts = {'reads': 0, 'writes': 0}
+    lock = threading.Lock()
+    deadline = [0.0]
+    ready = threading.Barrier(clients + 1)
+
+    def reader(i):
+        client = logged_in(i)
+        ready.wait()
+        done = 0
+        while time.perf_counter() < deadline[0]:
+            assert client.get('/view_parking').status_code == 200
+            done += 1
+        with lock:
+            counts['reads'] += done
+
+    def writer(i):
+        client = logged_in(args.readers + i)
+        own_slots = slot_ids[i::args.writers]
+        ready.wait()
+        done = 0
+        while time.perf_counter() < deadline[0]:
+            slot_id = own_slots[done % len(own_slots)]
+            client.post(f'/book_slot/{slot_id}', data={'vehicle_number': f'BENCH{i}'})
+            with app.app_context():
+                reservation_id = db.session.query(Reservation.id).filter_by(slot_id=slot_id, status='active').scalar()
+            client.get(f'/release_slot/{reservation_id}')
+            client.post(f'/pay/{reservation_id}')
+            done += 1
+        with lock:
+            counts['writes'] += done
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    for t in threads:
+        t.start()
+    deadline[0] = time.perf_counter() + 3600
+    ready.wait()
+    deadline[0] = time.perf_counter() + args.duration
+    for t in threads:
+        t.join()
+
+    print(json.dumps({
+        'mode': args.mode,
+        'reads_per_sec': counts['reads'] / args.duration,
+        'write_cycles_per_sec': counts['writes'] / args.duration,
+    }))
+
+
+def main(args):
+    results = []
+    for mode in MODES:
+        cmd = [sys.executable, '-m', 'benchmarks.concurrent_reads', '--mode', mode,
+               '--readers', str(args.readers), '--writers', str(args.writers),
+               '--duration', str(args.duration), '--lots', str(args.lots), '--slots', str(args.slots)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.duration}s, '
+          f'{args.lots} lots x {args.slots} slots')
+    for r in results:
+        print(f"  journal_mode={r['mode']:<7} view_parking {r['reads_per_sec']:8.1f} req/s   "
+              f"book/release/pay {r['write_cycles_per_sec']:6.1f} cycles/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--lots', type=int, default=20)
+    parser.add_argument('--slots', type=int, default=50)
+    parser.add_argument('--mode', choices=MODES, help='run a single mode in this process')
+    args = parser.parse_args()
+    if args.mode:
+        run_mode(args)
+    else:
+        main(args)
@@ -0,0 +1,101 @@
+"""Slots free for a window: the interval index against a SQL overlap query.
+
+Seeds one lot whose slots each carry many back-to-back advance bookings,
+then times "which slots are free between T1 and T2" both through
+services.schedule (one bisect per slot) and as a NOT EXISTS query over the
+reservation table. The index is also timed with a booking committed before
+each query, which its commit hook applies without reloading the lot:
+
+    python -m benchmarks.free_slots --slots 500 --bookings 40 --queries 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def run(args):
+    from app import create_app
+    from models import db
+    from models.lot import ParkingLot
+    from models.slot import ParkingSlot
+    from models.reservation import Reservation
+    from models.lot_occupancy import LotOccupancy
+    from services.bootstrap import bootstrap
+    from services.booking import holding_reservations, book_ahead
+    from services.schedule import slot_schedule
+
+    path = os.path.join(tempfile.mkdtemp(), 'free_slots.db')
+    app = create_app('testing', SQL_REPEAT_RAISE=False, SQL_METRICS_ENABLED=False,
+                     SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    bootstrap(app)
+    rng = random.Random(args.seed)
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+
+    with app.app_context():
+        lot = ParkingLot(name='Free Slots Bench', location='Bench', price=40.0)
+        lot.occupancy = LotOccupancy()
+        db.session.add(lot)
+        db.session.flush()
+        db.session.execute(db.insert(ParkingSlot), [
+            {'lot_id': lot.id, 'slot_number': f'S-{n:04d}', 'status': 'available'} for n in range(args.slots)])
+        slot_ids = [slot_id for (slot_id,) in db.session.query(ParkingSlot.id).filter_by(lot_id=lot.id)]
+        bookings = []
+        for slot_id in slot_ids:
+            start = now + timedelta(minutes=rng.randint(0, 120))
+            for _ in range(args.bookings):
+                end = start + timedelta(minutes=rng.randint(30, 240))
+                bookings.append({'user_id': 1, 'slot_id': slot_id, 'vehicle_number': f'FS{len(bookings)}',
+                                 'start_time': start, 'end_time': end, 'status': 'scheduled'})
+                start = end + timedelta(minutes=rng.randint(0, 180))
+        db.session.execute(db.insert(Reservation), bookings)
+        db.session.commit()
+        LotOccupancy.rebuild()
+        lot_id = lot.id
+        horizon = max(row['end_time'] for row in bookings) - now
+
+        windows = []
+        for _ in range(args.queries):
+            start = now + timedelta(minutes=rng.randint(0, int(horizon.total_seconds() // 60)))
+            windows.append((start, start + timedelta(minutes=rng.randint(30, 240))))
+
+        def sql_free(start, end):
+            return [slot_id for (slot_id,) in db.session.query(ParkingSlot.id).filter(
+                ParkingSlot.lot_id == lot_id, ParkingSlot.status != 'maintenance',
+                ~db.exists().where(Reservation.slot_id == ParkingSlot.id, holding_reservations(start, end, now))
+            ).order_by(ParkingSlot.id)]
+
+        def index_free(start, end):
+            return [slot_id for slot_id, _, _ in slot_schedule.free_slots(lot_id, start, end, now)]
+
+        assert index_free(*windows[0]) == sql_free(*windows[0])
+        print(f'{args.slots} slots x {args.bookings} bookings, {args.queries} window queries')
+        for label, query in (('interval index', index_free), ('SQL NOT EXISTS', sql_free)):
+            began = time.perf_counter()
+            for start, end in windows:
+                query(start, end)
+            elapsed = time.perf_counter() - began
+            print(f'  {label:<15} {elapsed / len(windows) * 1000:8.2f} ms/query')
+
+        # Past every seeded booking, so each one succeeds
+        later = now + horizon + timedelta(days=1)
+        elapsed = 0.0
+        for n, (start, end) in enumerate(windows):
+            slot_id = slot_ids[n % len(slot_ids)]
+            book_ahead(slot_id, 1, f'FSW{n}', later + timedelta(hours=n), later + timedelta(hours=n, minutes=30), now)
+            began = time.perf_counter()
+            index_free(start, end)
+            elapsed += time.perf_counter() - began
+        assert index_free(*windows[0]) == sql_free(*windows[0])
+        print(f'  {"index + writes":<15} {elapsed / len(windows) * 1000:8.2f} ms/query')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slots', type=int, default=500)
+    parser.add_argument('--bookings', type=int, default=40, help='advance bookings per slot')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    run(parser.parse_args())
@@ -0,0 +1,68 @@
+"""Gate event throughput of POST /api/gate/events by batch size.
+
+Seeds a temporary database, then for each batch size sends waves of entry
+events followed by the matching exit events through the Flask test client,
+spread over every lot, and reports events per second and SQL statements
+per batch:
+
+    python -m benchmarks.gate_batch --sizes 1 10 100 1000 --events 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import event
+
+
+def run(args):
+    from app import create_app
+    from models import db
+    from models.lot import ParkingLot
+    from services.bootstrap import bootstrap
+    from services.seed import seed_demo_data
+
+    path = os.path.join(tempfile.mkdtemp(), 'gate.db')
+    app = create_app('testing', SQL_REPEAT_RAISE=False, SQL_METRICS_ENABLED=False,
+                     SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    bootstrap(app)
+    with app.app_context():
+        seed_demo_data(users=10, lots=args.lots, slots_per_lot=args.slots, reservations=args.lots * args.slots,
+                       occupancy=0.0)
+        lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+        engine = db.engine
+
+    statements = [0]
+    event.listen(engine, 'before_cursor_execute', lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': app.config['ADMIN_EMAIL'], 'password': app.config['ADMIN_PASSWORD']})
+
+    print(f'{args.lots} lots x {args.slots} slots, {args.events} events per batch size')
+    for size in args.sizes:
+        plates = [f'GATE{size}X{n}' for n in range(args.events // 2)]
+        waves = [[{'type': kind, 'vehicle_number': plate, 'lot_id': lot_ids[n % len(lot_ids)]}
+                  for n, plate in enumerate(plates)] for kind in ('entry', 'exit')]
+        batches = [wave[i:i + size] for wave in waves for i in range(0, len(wave), size)]
+        statements[0] = 0
+        outcomes = {}
+        began = time.perf_counter()
+        for batch in batches:
+            response = client.post('/api/gate/events', json={'events': batch})
+            assert response.status_code == 200, response.get_data(as_text=True)
+            for outcome, count in response.get_json()['summary'].items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+        elapsed = time.perf_counter() - began
+        events = sum(len(batch) for batch in batches)
+        assert outcomes == {'parked': events // 2, 'exited': events // 2}, outcomes
+        print(f'  batch {size:>5}: {events / elapsed:9,.0f} events/s   '
+              f'{statements[0] / len(batches):6.1f} statements/batch   {len(batches):>5} requests')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--lots', type=int, default=10)
+    parser.add_argument('--slots', type=int, default=200)
+    run(parser.parse_args())
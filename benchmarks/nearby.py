@@ -0,0 +1,76 @@
+"""Nearest-available-lot queries against the in-memory k-d tree.
+
+Loads N random lots spread over a metropolitan area (a share of them full),
+checks the tree against a brute-force numpy scan and reports per-query
+latency, plus the cost of moving lots the way ``edit_lot`` does:
+
+    python -m benchmarks.nearby --lots 50000 --full 0.7
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from services.nearby import LotLocator, unit_vector, chord_to_km
+
+
+def _brute_force(points, ids, free, latitude, longitude, k):
+    query = np.array(unit_vector(latitude, longitude))
+    chords = np.sqrt(((points - query) ** 2).sum(axis=1))
+    chords[~free] = np.inf
+    best = np.argsort(chords)[:k]
+    return [(int(ids[i]), chord_to_km(chords[i])) for i in best if np.isfinite(chords[i])]
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    coords = {lot_id: (rng.gauss(19.07, args.spread), rng.gauss(72.88, args.spread)) for lot_id in range(1, args.lots + 1)}
+    free = {lot_id: 0 if rng.random() < args.full else rng.randint(1, 50) for lot_id in coords}
+
+    locator = LotLocator()
+    began = time.perf_counter()
+    locator.load(coords)
+    print(f'{args.lots:,} lots: tree built in {(time.perf_counter() - began) * 1e3:.1f} ms')
+
+    ids = np.array(list(coords))
+    points = np.array([unit_vector(*coords[lot_id]) for lot_id in ids])
+    free_mask = np.array([free[lot_id] > 0 for lot_id in ids])
+    accept = lambda lot_id: free[lot_id] > 0
+    queries = [(rng.gauss(19.07, args.spread), rng.gauss(72.88, args.spread)) for _ in range(args.queries)]
+
+    for latitude, longitude in queries[:50]:
+        got = locator.nearest(latitude, longitude, args.k, accept=accept)
+        expected = _brute_force(points, ids, free_mask, latitude, longitude, args.k)
+        assert [lot_id for lot_id, _ in got] == [lot_id for lot_id, _ in expected], (got, expected)
+
+    timings = []
+    for latitude, longitude in queries:
+        began = time.perf_counter()
+        locator.nearest(latitude, longitude, args.k, accept=accept)
+        timings.append((time.perf_counter() - began) * 1e6)
+    brute = []
+    for latitude, longitude in queries[:200]:
+        began = time.perf_counter()
+        _brute_force(points, ids, free_mask, latitude, longitude, args.k)
+        brute.append((time.perf_counter() - began) * 1e6)
+    print(f'k={args.k}, {args.full:.0%} of lots full: k-d tree p50 {np.percentile(timings, 50):.0f} us  '
+          f'p99 {np.percentile(timings, 99):.0f} us   numpy scan p50 {np.percentile(brute, 50):.0f} us')
+
+    began = time.perf_counter()
+    for lot_id in rng.sample(list(coords), args.moves):
+        coords[lot_id] = (rng.gauss(19.07, args.spread), rng.gauss(72.88, args.spread))
+        locator._apply([(lot_id, *coords[lot_id])])
+    print(f'{args.moves} single-lot edits applied in {(time.perf_counter() - began) * 1e3:.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, default=50000)
+    parser.add_argument('--full', type=float, default=0.7, help='Share of lots without a free slot.')
+    parser.add_argument('--spread', type=float, default=0.15, help='Standard deviation of lot positions in degrees.')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--moves', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    run(parser.parse_args())
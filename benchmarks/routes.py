@@ -0,0 +1,381 @@
+"""Latency percentiles and SQL query counts for every route.
+
+Seeds a fresh SQLite database with services.seed, drives each blueprint
+route through the Flask test client and reports p50/p90/p99 latency and
+the number of SQL statements per request. Results can be saved as a JSON
+baseline and compared against a later run:
+
+    python -m benchmarks.routes --output baseline.json
+    python -m benchmarks.routes --compare baseline.json
+
+Any route registered on the app but missing here is reported, so new
+routes do not silently go unmeasured.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from models import db
+from models.user import User
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from services.booking import holding_reservations
+
+# Routes that never finish a response (event streams) cannot be timed here
+SKIPPED = {
+    'static': 'static files',
+    'api.lot_events': 'endless event stream',
+    'api.lots_events': 'endless event stream',
+}
+
+
+class Context:
+    """Clients, ids and helpers shared by the route scenarios."""
+
+    def __init__(self, app, user_email):
+        self.app = app
+        self.counter = itertools.count()
+        self.anonymous = app.test_client()
+        self.admin = self.login('admin@example.com', 'adminpassword')
+        self.user = self.login(user_email, 'password')
+        with app.app_context():
+            self.lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+        self.lot_id = self.lot_ids[0]
+        self.checked_in = None   # reservation the check-in scenario last checked in
+        self.gate_parked = []    # (plate, lot_id) entered by the last gate batch
+        # A lot without a capacity limit for the slot add/delete scenarios
+        self.admin.post('/admin/add_lot', data={'name': 'Benchmark Scratch', 'location': 'Bench', 'price': '40'})
+        with app.app_context():
+            self.scratch_lot_id = db.session.query(ParkingLot.id).filter_by(name='Benchmark Scratch').scalar()
+
+    def login(self, email, password):
+        client = self.app.test_client()
+        response = client.post('/auth/login', data={'email': email, 'password': password})
+        assert response.status_code == 302, f'login failed for {email}'
+        return client
+
+    def next(self):
+        return next(self.counter)
+
+    def free_slot(self):
+        with self.app.app_context():
+            slot_id = db.session.query(ParkingSlot.id).filter(
+                ParkingSlot.status == 'available',
+                ParkingSlot.lot_id.in_(self.lot_ids),
+                ~db.exists().where(Reservation.slot_id == ParkingSlot.id, holding_reservations(datetime.utcnow()))
+            ).order_by(ParkingSlot.id).limit(1).scalar()
+        assert slot_id, 'no free slots left; seed more slots or run fewer iterations'
+        return slot_id
+
+    def booked_reservation(self):
+        """Book a free slot as the benchmark user and return the reservation id."""
+        slot_id = self.free_slot()
+        self.user.post(f'/book_slot/{slot_id}', data={'vehicle_number': f'BENCH{self.next():06d}'})
+        with self.app.app_context():
+            return db.session.query(Reservation.id).filter_by(slot_id=slot_id, status='active').scalar()
+
+    def plate(self):
+        with self.app.app_context():
+            return db.session.query(Reservation.vehicle_number).filter_by(status='active').limit(1).scalar()
+
+    def window(self, hours_ahead=None):
+        """A one-hour advance booking window, a different hour each call."""
+        start = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(
+            hours=1 + self.next() % 600 if hours_ahead is None else hours_ahead)
+        return {'start': start.strftime('%Y-%m-%dT%H:%M'), 'end': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M')}
+
+    def scheduled_reservation(self):
+        """Book a window starting now and return the reservation id, ready to check in.
+
+        Lots are taken in turn, and the stay checked in after the previous
+        call is released first so the scenario does not fill a lot.
+        """
+        if self.checked_in is not None:
+            self.user.get(f'/release_slot/{self.checked_in}')
+        plate = f'BENCH{self.next():06d}'
+        lot_id = self.lot_ids[self.next() % len(self.lot_ids)]
+        self.user.post(f'/book_ahead/{lot_id}', data={'vehicle_number': plate, **self.window(hours_ahead=0)})
+        with self.app.app_context():
+            reservation_id = db.session.query(Reservation.id).filter_by(vehicle_number=plate, status='scheduled').scalar()
+        assert reservation_id, f'no slot in lot {lot_id} free to book from now; seed more slots or run fewer iterations'
+        self.checked_in = reservation_id
+        return reservation_id
+
+    def completed_reservation(self):
+        reservation_id = self.booked_reservation()
+        self.user.get(f'/release_slot/{reservation_id}')
+        return reservation_id
+
+    def scratch_slot(self):
+        number = f'X{self.next():06d}'
+        self.admin.post(f'/admin/add_slot/{self.scratch_lot_id}', data={'slot_number': number})
+        with self.app.app_context():
+            return db.session.query(ParkingSlot.id).filter_by(
+                lot_id=self.scratch_lot_id, slot_number=number).scalar()
+
+    def scratch_lot(self):
+        name = f'Benchmark Lot {self.next()}'
+        self.admin.post('/admin/add_lot', data={'name': name, 'location': 'Bench', 'price': '40'})
+        with self.app.app_context():
+            return db.session.query(ParkingLot.id).filter_by(name=name).scalar()
+
+    def slot_range(self):
+        n = self.next()
+        return f'R{n}-001..R{n}-050'
+
+    def scratch_range(self):
+        spec = self.slot_range()
+        self.admin.post(f'/admin/bulk_add_slots/{self.scratch_lot_id}', data={'slot_range': spec})
+        return spec
+
+    def gate_batch(self, size=10):
+        """Exits for the previous batch's vehicles plus ``size`` new entries, spread over the lots."""
+        events = [{'type': 'exit', 'vehicle_number': plate, 'lot_id': lot_id} for plate, lot_id in self.gate_parked]
+        self.gate_parked = [(f'GATE{self.next():06d}', self.lot_ids[i % len(self.lot_ids)]) for i in range(size)]
+        events += [{'type': 'entry', 'vehicle_number': plate, 'lot_id': lot_id} for plate, lot_id in self.gate_parked]
+        return {'events': events}
+
+    def etag(self, url):
+        return self.user.get(url).headers['ETag']
+
+
+def _lot_form(name):
+    return {'name': name, 'location': 'Bench', 'price': '40', 'address': '1 Bench Road',
+            'pin_code': '400001', 'maximum_number_of_spots': ''}
+
+
+# (label, endpoint, prepare). prepare(ctx) runs untimed and returns
+# (client, method, url, kwargs) for the one request that is measured.
+SCENARIOS = [
+    ('GET index', 'index', lambda c: (c.anonymous, 'GET', '/', {})),
+    ('GET auth.login', 'auth.login', lambda c: (c.anonymous, 'GET', '/auth/login', {})),
+    ('POST auth.login', 'auth.login', lambda c: (
+        c.app.test_client(), 'POST', '/auth/login',
+        {'data': {'email': 'admin@example.com', 'password': 'adminpassword'}})),
+    ('GET auth.register', 'auth.register', lambda c: (c.anonymous, 'GET', '/auth/register', {})),
+    ('POST auth.register', 'auth.register', lambda c: (
+        c.app.test_client(), 'POST', '/auth/register',
+        {'data': {'name': 'Bench', 'email': f'bench{c.next()}@bench.example', 'password': 'bench'}})),
+    ('GET auth.logout', 'auth.logout', lambda c: (c.login('admin@example.com', 'adminpassword'), 'GET', '/auth/logout', {})),
+
+    ('GET main.dashboard (user)', 'main.dashboard', lambda c: (c.user, 'GET', '/dashboard', {})),
+    ('GET main.dashboard (admin)', 'main.dashboard', lambda c: (c.admin, 'GET', '/dashboard', {})),
+    ('GET main.view_parking', 'main.view_parking', lambda c: (c.user, 'GET', '/view_parking', {})),
+    ('GET main.book_slot', 'main.book_slot', lambda c: (c.user, 'GET', f'/book_slot/{c.free_slot()}', {})),
+    ('POST main.book_slot', 'main.book_slot', lambda c: (
+        c.user, 'POST', f'/book_slot/{c.free_slot()}', {'data': {'vehicle_number': f'BENCH{c.next():06d}'}})),
+    ('GET main.book_any_slot', 'main.book_any_slot', lambda c: (c.user, 'GET', f'/book_any/{c.lot_id}', {})),
+    ('POST main.book_any_slot', 'main.book_any_slot', lambda c: (
+        c.user, 'POST', f'/book_any/{c.lot_ids[c.next() % len(c.lot_ids)]}', {'data': {'vehicle_number': f'BENCH{c.next():06d}'}})),
+    ('GET main.book_ahead', 'main.book_ahead', lambda c: (c.user, 'GET', f'/book_ahead/{c.lot_id}', {})),
+    ('POST main.book_ahead', 'main.book_ahead', lambda c: (
+        c.user, 'POST', f'/book_ahead/{c.lot_ids[c.next() % len(c.lot_ids)]}',
+        {'data': {'vehicle_number': f'BENCH{c.next():06d}', **c.window()}})),
+    ('GET main.check_in_reservation', 'main.check_in_reservation', lambda c: (
+        c.user, 'GET', f'/check_in/{c.scheduled_reservation()}', {})),
+    ('GET main.release_slot', 'main.release_slot', lambda c: (c.user, 'GET', f'/release_slot/{c.booked_reservation()}', {})),
+    ('GET main.pay', 'main.pay', lambda c: (c.user, 'GET', f'/pay/{c.completed_reservation()}', {})),
+    ('POST main.pay', 'main.pay', lambda c: (c.user, 'POST', f'/pay/{c.completed_reservation()}', {})),
+    ('GET main.cancel_reservation', 'main.cancel_reservation', lambda c: (
+        c.user, 'GET', f'/cancel_reservation/{c.booked_reservation()}', {})),
+
+    ('GET main.admin_lots', 'main.admin_lots', lambda c: (c.admin, 'GET', '/admin/lots', {})),
+    ('GET main.add_lot', 'main.add_lot', lambda c: (c.admin, 'GET', '/admin/add_lot', {})),
+    ('POST main.add_lot', 'main.add_lot', lambda c: (
+        c.admin, 'POST', '/admin/add_lot', {'data': _lot_form(f'Benchmark Lot {c.next()}')})),
+    ('GET main.edit_lot', 'main.edit_lot', lambda c: (c.admin, 'GET', f'/admin/edit_lot/{c.scratch_lot_id}', {})),
+    ('POST main.edit_lot', 'main.edit_lot', lambda c: (
+        c.admin, 'POST', f'/admin/edit_lot/{c.scratch_lot_id}', {'data': _lot_form('Benchmark Scratch')})),
+    ('POST main.delete_lot', 'main.delete_lot', lambda c: (c.admin, 'POST', f'/admin/delete_lot/{c.scratch_lot()}', {})),
+    ('GET main.admin_slots', 'main.admin_slots', lambda c: (c.admin, 'GET', f'/admin/slots/{c.lot_id}', {})),
+    ('POST main.add_slot', 'main.add_slot', lambda c: (
+        c.admin, 'POST', f'/admin/add_slot/{c.scratch_lot_id}', {'data': {'slot_number': f'A{c.next():06d}'}})),
+    ('POST main.bulk_add_slots_view', 'main.bulk_add_slots_view', lambda c: (
+        c.admin, 'POST', f'/admin/bulk_add_slots/{c.scratch_lot_id}',
+        {'data': {'slot_range': c.slot_range()}})),
+    ('POST main.update_slot_status', 'main.update_slot_status', lambda c: (
+        c.admin, 'POST', f'/admin/update_slot_status/{c.scratch_slot()}', {'data': {'status': 'maintenance'}})),
+    ('POST main.delete_slot', 'main.delete_slot', lambda c: (c.admin, 'POST', f'/admin/delete_slot/{c.scratch_slot()}', {})),
+    ('POST main.bulk_slot_status', 'main.bulk_slot_status', lambda c: (
+        c.admin, 'POST', f'/admin/bulk_slot_status/{c.scratch_lot_id}',
+        {'data': {'slot_range': '', 'status': ('maintenance', 'available')[c.next() % 2]}})),
+    ('POST main.bulk_delete_slots', 'main.bulk_delete_slots', lambda c: (
+        c.admin, 'POST', f'/admin/bulk_delete_slots/{c.scratch_lot_id}', {'data': {'slot_range': c.scratch_range()}})),
+    ('POST main.import_lots', 'main.import_lots', lambda c: (
+        c.admin, 'POST', '/admin/import_lots',
+        {'data': {'csv_file': (io.BytesIO(f'name,location,price,slots\nImported {c.next()},Bench,30,I-001..I-050\n'.encode()),
+                               'lots.csv')},
+         'content_type': 'multipart/form-data'})),
+    ('GET main.admin_reservations', 'main.admin_reservations', lambda c: (c.admin, 'GET', '/admin/reservations', {})),
+    ('GET main.admin_reservations (filtered)', 'main.admin_reservations', lambda c: (
+        c.admin, 'GET', f'/admin/reservations?status=paid&lot_id={c.lot_id}', {})),
+    ('GET main.export_reservations', 'main.export_reservations', lambda c: (
+        c.admin, 'GET', f'/admin/reservations/export?format=csv&lot_id={c.lot_id}', {})),
+    ('GET main.admin_analytics', 'main.admin_analytics', lambda c: (c.admin, 'GET', '/admin/analytics', {})),
+    ('GET main.admin_analytics_json', 'main.admin_analytics_json', lambda c: (
+        c.admin, 'GET', '/admin/analytics.json?granularity=hour', {})),
+    ('POST main.refresh_analytics', 'main.refresh_analytics', lambda c: (c.admin, 'POST', '/admin/analytics/refresh', {})),
+    ('GET main.admin_user_cache_json', 'main.admin_user_cache_json', lambda c: (c.admin, 'GET', '/admin/user_cache.json', {})),
+    ('GET main.admin_page_cache_json', 'main.admin_page_cache_json', lambda c: (c.admin, 'GET', '/admin/page_cache.json', {})),
+    ('GET main.admin_metrics', 'main.admin_metrics', lambda c: (c.admin, 'GET', '/admin/metrics', {})),
+    ('GET main.admin_metrics_json', 'main.admin_metrics_json', lambda c: (c.admin, 'GET', '/admin/metrics.json', {})),
+    ('POST main.reset_metrics', 'main.reset_metrics', lambda c: (c.admin, 'POST', '/admin/metrics/reset', {})),
+
+    ('GET api.lot_availability', 'api.lot_availability', lambda c: (
+        c.user, 'GET', f'/api/lots/{c.lot_id}/availability', {})),
+    ('GET api.lot_availability (304)', 'api.lot_availability', lambda c: (
+        c.user, 'GET', f'/api/lots/{c.lot_id}/availability',
+        {'headers': {'If-None-Match': c.etag(f'/api/lots/{c.lot_id}/availability')}})),
+    ('GET api.lots_availability', 'api.lots_availability', lambda c: (c.user, 'GET', '/api/lots/availability', {})),
+    ('GET api.lots_availability (304)', 'api.lots_availability', lambda c: (
+        c.user, 'GET', '/api/lots/availability', {'headers': {'If-None-Match': c.etag('/api/lots/availability')}})),
+    ('GET api.nearest_lots', 'api.nearest_lots', lambda c: (c.user, 'GET', '/api/lots/nearest?lat=19.07&lon=72.88&k=5', {})),
+    ('GET api.lot_free_slots', 'api.lot_free_slots', lambda c: (
+        c.user, 'GET', f'/api/lots/{c.lot_id}/free_slots', {'query_string': c.window()})),
+    ('POST api.gate_events', 'api.gate_events', lambda c: (c.admin, 'POST', '/api/gate/events', {'json': c.gate_batch()})),
+    ('GET api.vehicle_search', 'api.vehicle_search', lambda c: (c.admin, 'GET', '/api/vehicles?q=MH1', {})),
+    ('GET api.vehicle_lookup', 'api.vehicle_lookup', lambda c: (c.admin, 'GET', f'/api/vehicles/{c.plate()}', {})),
+]
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    path = os.path.join(tempfile.mkdtemp(), 'routes.db')
+
+    from sqlalchemy import event
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from flask_migrate import upgrade
+    from services.seed import seed_demo_data
+
+    # Passed to the factory: Config read DATABASE_URL when models was imported
+    app = create_app('testing', SQL_REPEAT_RAISE=False, SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    with app.app_context():
+        upgrade()
+        db.session.add(User(name='Admin', email='admin@example.com', role='admin',
+                            password=generate_password_hash('adminpassword', method='pbkdf2:sha256')))
+        db.session.commit()
+        counts = seed_demo_data(users=args.users, lots=args.lots, slots_per_lot=args.slots_per_lot,
+                                reservations=args.reservations, seed=args.seed)
+        user_email = db.session.query(User.email).filter(User.email.like('%@seed.example')).order_by(User.id).first()[0]
+        engine = db.engine
+
+    ctx = Context(app, user_email)
+    registered = {rule.endpoint for rule in app.url_map.iter_rules()}
+    covered = {endpoint for _, endpoint, _ in SCENARIOS}
+    missing = sorted(registered - covered - set(SKIPPED))
+
+    queries = [0]
+    event.listen(engine, 'before_cursor_execute', lambda *a: queries.__setitem__(0, queries[0] + 1))
+
+    results = {}
+    for label, endpoint, prepare in SCENARIOS:
+        if args.only and args.only not in label:
+            continue
+        timings, query_counts = [], []
+        for i in range(args.warmup + args.iterations):
+            client, method, url, kwargs = prepare(ctx)
+            queries[0] = 0
+            began = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+            elapsed = time.perf_counter() - began
+            assert response.status_code < 400, f'{label}: {url} returned {response.status_code}'
+            if i >= args.warmup:
+                timings.append(elapsed * 1000)
+                query_counts.append(queries[0])
+        results[label] = {
+            'endpoint': endpoint,
+            'p50_ms': round(_percentile(timings, 50), 3),
+            'p90_ms': round(_percentile(timings, 90), 3),
+            'p99_ms': round(_percentile(timings, 99), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': _percentile(query_counts, 50),
+            'queries_max': max(query_counts),
+        }
+        print(f"{label:<42} p50 {results[label]['p50_ms']:8.2f} ms  p90 {results[label]['p90_ms']:8.2f} ms  "
+              f"p99 {results[label]['p99_ms']:8.2f} ms  queries {results[label]['queries']:>3}"
+              f"{'' if results[label]['queries_max'] == results[label]['queries'] else '-' + str(results[label]['queries_max'])}")
+
+    for endpoint in missing:
+        print(f'NOT BENCHMARKED: {endpoint}')
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'iterations': args.iterations,
+            'seed': args.seed,
+            'dataset': counts,
+        },
+        'routes': results,
+        'not_benchmarked': missing,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print per-route changes; return the labels that regressed."""
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} (threshold {threshold:.0%}):")
+    for label, now in current['routes'].items():
+        before = baseline['routes'].get(label)
+        if before is None:
+            print(f'  {label:<42} new')
+            continue
+        change = (now['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0.0
+        more_queries = now['queries'] > before['queries']
+        flag = 'REGRESSION' if change > threshold or more_queries else ''
+        if flag:
+            regressions.append(label)
+        print(f"  {label:<42} p50 {before['p50_ms']:8.2f} -> {now['p50_ms']:8.2f} ms ({change:+.0%})  "
+              f"queries {before['queries']} -> {now['queries']}  {flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--lots', type=int, default=20)
+    parser.add_argument('--slots-per-lot', type=int, default=100)
+    parser.add_argument('--reservations', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', help='only routes whose label contains this text')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='p50 slowdown that counts as a regression (default 0.25 = 25%%)')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), report, args.threshold)
+        sys.exit(1 if regressed else 0)
@@ -0,0 +1,113 @@
+"""Booking throughput with one SQLite file versus slots spread over shards.
+
+Forks writer processes that each run book-any/release/pay cycles through the
+Flask test client, spread over every lot, against a fresh seeded database
+per shard count:
+
+    python -m benchmarks.shards --writers 4 --shards 1 2 4 --duration 5
+
+With one file every commit waits for the single write lock; with several
+shards only writers on the same shard do, so the gain shows when commits
+rather than CPU are the limit: several cores, or ``--synchronous FULL`` on a
+disk where each fsync is slow.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def run_count(args):
+    directory = tempfile.mkdtemp()
+
+    from app import create_app
+    from models import db
+    from models.user import User
+    from models.lot import ParkingLot
+    from models.reservation import Reservation
+    from models.shards import use_shard, lot_shard
+    from services.bootstrap import bootstrap
+    from services.seed import seed_demo_data
+
+    app = create_app('testing', SQL_REPEAT_RAISE=False, SHARD_COUNT=args.count,
+                     SQLITE_SYNCHRONOUS=args.synchronous,
+                     SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.join(directory, "parking.db")}',
+                     SHARD_DATABASE_URL=f'sqlite:///{os.path.join(directory, "parking-shard-{shard}.db")}')
+    bootstrap(app)
+    with app.app_context():
+        seed_demo_data(users=args.writers, lots=args.lots, slots_per_lot=args.slots,
+                       reservations=args.lots * args.slots, occupancy=0.0)
+        emails = [email for (email,) in db.session.query(User.email).filter(User.role == 'user').order_by(User.id)]
+        lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+        for engine in db.engines.values():
+            engine.dispose()
+
+    def writer(i, start, results):
+        client = app.test_client()
+        client.post('/auth/login', data={'email': emails[i], 'password': 'password'})
+        user_id = None
+        done = 0
+        while time.time() < start:
+            time.sleep(0.001)
+        deadline = start + args.duration
+        while time.time() < deadline:
+            lot_id = lot_ids[(i + done * args.writers) % len(lot_ids)]
+            client.post(f'/book_any/{lot_id}', data={'vehicle_number': f'BENCH{i}'})
+            with app.app_context(), use_shard(lot_shard(lot_id)):
+                if user_id is None:
+                    user_id = db.session.query(User.id).filter_by(email=emails[i]).scalar()
+                reservation_id = db.session.query(Reservation.id).filter_by(
+                    user_id=user_id, status='active').scalar()
+            client.get(f'/release_slot/{reservation_id}')
+            client.post(f'/pay/{reservation_id}')
+            done += 1
+        results.put(done)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    start = time.time() + 1.0
+    workers = [context.Process(target=writer, args=(i, start, results)) for i in range(args.writers)]
+    for worker in workers:
+        worker.start()
+    cycles = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+
+    print(json.dumps({'shards': args.count, 'cycles_per_sec': cycles / args.duration}))
+
+
+def main(args):
+    results = []
+    for count in args.shards:
+        cmd = [sys.executable, '-m', 'benchmarks.shards', '--count', str(count),
+               '--writers', str(args.writers), '--duration', str(args.duration),
+               '--lots', str(args.lots), '--slots', str(args.slots), '--synchronous', args.synchronous]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f'{args.writers} writer processes, {args.duration}s, {args.lots} lots x {args.slots} slots, '
+          f'synchronous={args.synchronous}')
+    base = results[0]['cycles_per_sec']
+    for r in results:
+        print(f"  SHARD_COUNT={r['shards']:<3} book/release/pay {r['cycles_per_sec']:7.1f} cycles/s "
+              f"({r['cycles_per_sec'] / base:4.2f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--lots', type=int, default=8)
+    parser.add_argument('--slots', type=int, default=50)
+    parser.add_argument('--synchronous', choices=('OFF', 'NORMAL', 'FULL'), default='NORMAL')
+    parser.add_argument('--count', type=int, help='run a single shard count in this process')
+    args = parser.parse_args()
+    if args.count:
+        run_count(args)
+    else:
+        main(args)
@@ -0,0 +1,185 @@
+"""Idle SSE streams against a real gunicorn server.
+
+Starts ``gunicorn -c gunicorn.conf.py wsgi:app`` (one worker) on a fresh
+database, opens N HTTP streams to ``/api/lots/<id>/events``, then checks
+what an open-stream load does to everything else:
+
+    python -m benchmarks.sse_fanout --streams 200
+    python -m benchmarks.sse_fanout --streams 200 --max-streams 0     # no cap
+    python -m benchmarks.sse_fanout --streams 2000 --worker-class gevent
+
+It reports how many streams were accepted, refused with 503
+(SSE_MAX_STREAMS) or left waiting for a thread, how long an ordinary page
+request takes while they are open, and how long one slot change takes to
+reach every accepted stream.
+"""
+import argparse
+import http.cookiejar
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN = ('admin@example.com', 'bench-admin')
+
+
+def prepare(path, slots):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+    from app import create_app
+    from services.bootstrap import bootstrap
+    from models import db
+    from models.lot import ParkingLot
+    from models.slot import ParkingSlot
+    from models.lot_occupancy import LotOccupancy
+
+    app = create_app('testing', SQL_REPEAT_RAISE=False, ADMIN_PASSWORD=ADMIN[1])
+    bootstrap(app)
+    with app.app_context():
+        lot = ParkingLot(name='Stream Lot', location='Bench', price=40.0)
+        lot.slots = [ParkingSlot(slot_number=f'S-{s:03d}', status='available') for s in range(slots)]
+        db.session.add(lot)
+        db.session.commit()
+        LotOccupancy.rebuild()
+        return lot.id, lot.slots[0].id
+
+
+def start_server(args, path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', APP_CONFIG='testing', SQL_REPEAT_RAISE='0',
+               WEB_CONCURRENCY='1', BIND=f'127.0.0.1:{args.port}', GUNICORN_WORKER_CLASS=args.worker_class,
+               GUNICORN_THREADS=str(args.threads))
+    # Unset, gunicorn.conf.py picks the default for the worker class
+    env.pop('SSE_MAX_STREAMS', None)
+    if args.max_streams is not None:
+        env['SSE_MAX_STREAMS'] = str(args.max_streams)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', args.port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn did not start; is it installed (pip install gunicorn)?')
+
+
+def login(base):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({'email': ADMIN[0], 'password': ADMIN[1]}).encode()
+    opener.open(base + '/auth/login', data, timeout=30).read()
+    cookie = '; '.join(f'{c.name}={c.value}' for c in jar)
+    return opener, cookie
+
+
+def open_streams(args, lot_id, cookie):
+    """Open the streams; returns the selector with accepted ones and (accepted, refused, waiting)."""
+    request = (f'GET /api/lots/{lot_id}/events HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+               f'Cookie: {cookie}\r\nAccept: text/event-stream\r\n\r\n').encode()
+    selector = selectors.DefaultSelector()
+    pending = {}
+    for _ in range(args.streams):
+        sock = socket.create_connection(('127.0.0.1', args.port))
+        sock.sendall(request)
+        sock.setblocking(False)
+        pending[sock] = b''
+        selector.register(sock, selectors.EVENT_READ)
+
+    accepted, refused = [], 0
+    deadline = time.monotonic() + args.wait
+    while pending and time.monotonic() < deadline:
+        for key, _ in selector.select(timeout=0.1):
+            sock = key.fileobj
+            if sock not in pending:
+                continue
+            chunk = sock.recv(65536)
+            pending[sock] += chunk
+            head = pending[sock]
+            # A stream counts once its ready frame is in; anything else once the headers are
+            ok = head.startswith(b'HTTP/1.1 200')
+            if chunk and not (b'event: ready' in head if ok else b'\r\n\r\n' in head):
+                continue
+            del pending[sock]
+            if ok and b'event: ready' in head:
+                accepted.append(sock)
+            else:
+                refused += 1
+                selector.unregister(sock)
+                sock.close()
+    for sock in pending:
+        selector.unregister(sock)
+    return selector, accepted, refused, list(pending)
+
+
+def fan_out(selector, accepted, opener, base, slot_id, timeout):
+    """Change one slot's status and time until every accepted stream has the frame.
+
+    Returns None when the change request itself gets no answer.
+    """
+    waiting = set(accepted)
+    began = time.perf_counter()
+    data = urllib.parse.urlencode({'status': 'maintenance'}).encode()
+    try:
+        opener.open(f'{base}/admin/update_slot_status/{slot_id}', data, timeout=timeout).read()
+    except OSError:
+        return None
+    deadline = time.monotonic() + timeout
+    while waiting and time.monotonic() < deadline:
+        for key, _ in selector.select(timeout=0.1):
+            if b'event: slots' in key.fileobj.recv(65536):
+                waiting.discard(key.fileobj)
+    return time.perf_counter() - began, len(accepted) - len(waiting)
+
+
+def run(args):
+    path = os.path.join(tempfile.mkdtemp(), 'sse.db')
+    lot_id, slot_id = prepare(path, args.slots)
+    server = start_server(args, path)
+    base = f'http://127.0.0.1:{args.port}'
+    try:
+        opener, cookie = login(base)
+        began = time.perf_counter()
+        selector, accepted, refused, waiting = open_streams(args, lot_id, cookie)
+        opened = time.perf_counter() - began
+
+        began = time.perf_counter()
+        try:
+            opener.open(f'{base}/api/lots/{lot_id}/availability', timeout=args.wait).read()
+            page = f'{(time.perf_counter() - began) * 1e3:.1f} ms'
+        except OSError:
+            page = f'no answer within {args.wait:.0f} s'
+
+        result = fan_out(selector, accepted, opener, base, slot_id, args.wait)
+        print(f'{args.worker_class}, {args.streams:,} streams opened in {opened:.2f} s: '
+              f'{len(accepted):,} accepted, {refused:,} refused (503), {len(waiting):,} waiting for a thread')
+        print(f'availability request with the streams open: {page}')
+        if result is None:
+            print(f'slot change request: no answer within {args.wait:.0f} s')
+        else:
+            delivered, reached = result
+            print(f'one slot change reached {reached:,}/{len(accepted):,} streams in {delivered * 1e3:.1f} ms')
+        for sock in accepted + waiting:
+            sock.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--worker-class', default='gthread', choices=('gthread', 'gevent'))
+    parser.add_argument('--threads', type=int, default=16, help='gunicorn threads per worker (gthread)')
+    parser.add_argument('--max-streams', type=int, help='SSE_MAX_STREAMS for the server (0: no limit)')
+    parser.add_argument('--slots', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--wait', type=float, default=5.0, help='seconds to wait for answers')
+    run(parser.parse_args())
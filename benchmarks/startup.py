@@ -0,0 +1,99 @@
+"""Cold-start and worker start-up cost of the WSGI app.
+
+Every run happens in a fresh interpreter, so nothing is imported already:
+
+    python -m benchmarks.startup --runs 5 --workers 4
+
+``cold`` times ``import wsgi`` (what a server's master does) and the first
+request. ``fork`` compares pre-fork serving with and without preload_app:
+time from fork() until a worker has answered its first request and billed a
+stay, and the memory the worker does not share with its parent.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CHILD = r'''
+import json, os, sys, time
+from datetime import datetime, timedelta
+
+def private_kb():
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            return sum(int(line.split()[1]) for line in f if line.startswith(('Private_Clean', 'Private_Dirty')))
+    except OSError:
+        return None
+
+def serve(app):
+    from services.tariff import Tariff
+    assert app.test_client().get('/').status_code == 200
+    Tariff().cost(datetime(2024, 1, 1), datetime(2024, 1, 1) + timedelta(hours=2), 40.0)
+
+mode, workers = sys.argv[1], int(sys.argv[2])
+began = time.perf_counter()
+if mode == 'cold':
+    import wsgi
+    ready = time.perf_counter()
+    serve(wsgi.app)
+    print(json.dumps({'import_ms': (ready - began) * 1e3, 'first_request_ms': (time.perf_counter() - ready) * 1e3,
+                      'modules': len(sys.modules), 'private_kb': private_kb()}))
+    sys.exit()
+
+if mode == 'preload':
+    import wsgi
+results = []
+for _ in range(workers):
+    read_end, write_end = os.pipe()
+    forked = time.perf_counter()
+    if os.fork() == 0:
+        os.close(read_end)
+        if mode != 'preload':
+            import wsgi
+        serve(wsgi.app)
+        os.write(write_end, json.dumps({'ready_ms': (time.perf_counter() - forked) * 1e3,
+                                        'private_kb': private_kb()}).encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        results.append(json.loads(pipe.read()))
+    os.wait()
+print(json.dumps(results))
+'''
+
+
+def _child(mode, workers, env):
+    out = subprocess.run([sys.executable, '-c', CHILD, mode, str(workers)], env=env, cwd=os.getcwd(),
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def run(args):
+    env = dict(os.environ, APP_CONFIG='production', SECRET_KEY='startup-benchmark', BOOTSTRAP_ON_START='0',
+               SESSION_COOKIE_SECURE='0', PYTHONPATH=os.getcwd(),
+               DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}")
+
+    cold = [_child('cold', 0, env) for _ in range(args.runs)]
+    print(f"cold start: import wsgi {_median([r['import_ms'] for r in cold]):.0f} ms, "
+          f"first request {_median([r['first_request_ms'] for r in cold]):.0f} ms, "
+          f"{cold[0]['modules']} modules loaded")
+
+    for mode in ('lazy', 'preload'):
+        workers = [w for _ in range(args.runs) for w in _child(mode, args.workers, env)]
+        private = [w['private_kb'] for w in workers if w['private_kb'] is not None]
+        memory = f", {_median(private) / 1024:.1f} MB private per worker" if private else ''
+        print(f"{mode:>8}: fork to first response {_median([w['ready_ms'] for w in workers]):.0f} ms{memory}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    run(parser.parse_args())
@@ -0,0 +1,48 @@
+"""Batch tariff throughput on synthetic reservations.
+
+Costs N random stays with the vectorised engine and, for comparison, a
+sample of them one at a time through ``Tariff.cost`` (the release_slot path):
+
+    python -m benchmarks.tariff_batch --reservations 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from services.tariff import Tariff
+
+
+def run(args):
+    rng = np.random.default_rng(42)
+    n = args.reservations
+    base = np.datetime64('2024-01-01T00:00:00', 'us')
+    start_times = base + rng.integers(0, 365 * 86400, n).astype('timedelta64[s]')
+    end_times = start_times + rng.integers(60, 3 * 86400, n).astype('timedelta64[s]')
+    prices = rng.choice([20.0, 40.0, 60.0, np.nan], n, p=[0.4, 0.4, 0.15, 0.05])
+
+    tariff = Tariff(rounding_minutes=15, minimum_charge=20.0, tiers=[(8, 10, 1.5), (17, 20, 1.5), (22, 6, 0.75)])
+
+    began = time.perf_counter()
+    costs = tariff.costs(start_times, end_times, prices)
+    vectorised = time.perf_counter() - began
+
+    sample = min(n, args.sample)
+    starts = start_times[:sample].astype(object)
+    ends = end_times[:sample].astype(object)
+    sample_prices = [None if np.isnan(p) else float(p) for p in prices[:sample]]
+    began = time.perf_counter()
+    scalar = [tariff.cost(s, e, p) for s, e, p in zip(starts, ends, sample_prices)]
+    per_call = (time.perf_counter() - began) / sample
+
+    assert np.allclose(costs[:sample], scalar)
+    print(f'{n:,} reservations vectorised: {vectorised:.3f}s ({n / vectorised:,.0f}/s), total {costs.sum():,.2f}')
+    print(f'one at a time: {per_call * 1e6:.1f} us/reservation, '
+          f'~{per_call * n:.1f}s projected for {n:,}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reservations', type=int, default=1_000_000)
+    parser.add_argument('--sample', type=int, default=20_000)
+    run(parser.parse_args())
@@ -0,0 +1,154 @@
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_tiers(name):
+    # "8-10:1.5,17-20:1.25" -> [(8, 10, 1.5), (17, 20, 1.25)]
+    tiers = []
+    for part in filter(None, os.environ.get(name, '').split(',')):
+        hours, multiplier = part.split(':')
+        start_hour, end_hour = hours.split('-')
+        tiers.append((float(start_hour), float(end_hour), float(multiplier)))
+    return tiers
+
+
+DEFAULT_SECRET_KEY = 'your_super_secret_key_here'
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
+    SECRET_KEY_REQUIRED = False      # refuse to start with DEFAULT_SECRET_KEY
+    DEBUG = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///parking.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool, used when DATABASE_URL points at a server database
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 20)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 30)        # seconds
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 1800)      # seconds
+
+    # SQLite tuning: WAL lets readers proceed while a booking is being written
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_MMAP_SIZE = _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+
+    # Sharding (models/shards.py): with SHARD_COUNT > 1, slots and reservations
+    # are spread by lot over the main database and SHARD_COUNT - 1 more SQLite
+    # files, so bookings in different shards do not wait for each other.
+    # It can be raised later (new lots fill the new shards), never lowered.
+    SHARD_COUNT = _env_int('SHARD_COUNT', 1)
+    SHARD_DATABASE_URL = os.environ.get('SHARD_DATABASE_URL', 'sqlite:///parking-shard-{shard}.db')
+
+    # Tariff rules (services/tariff.py); the defaults bill price/hr * exact hours
+    TARIFF_ROUNDING_MINUTES = _env_int('TARIFF_ROUNDING_MINUTES', 0)
+    TARIFF_MINIMUM_CHARGE = float(os.environ.get('TARIFF_MINIMUM_CHARGE', 0))
+    TARIFF_TIERS = _env_tiers('TARIFF_TIERS')
+    TARIFF_COST_DECIMALS = _env_int('TARIFF_COST_DECIMALS', None)
+
+    # Live slot updates (services/events.py). Empty EVENT_BROKER_URL keeps
+    # events in-process; set a redis:// URL when running several processes.
+    EVENT_BROKER_URL = os.environ.get('EVENT_BROKER_URL', '')
+    SSE_KEEPALIVE_SECONDS = _env_int('SSE_KEEPALIVE_SECONDS', 15)
+    # Open streams one process accepts before answering 503 (0: no limit).
+    # Under gthread each stream holds a thread; gunicorn.conf.py sets this
+    # to half the threads so page requests always have threads left.
+    SSE_MAX_STREAMS = _env_int('SSE_MAX_STREAMS', 0)
+
+    # current_user is served from an in-memory LRU (services/user_cache.py);
+    # the TTL bounds how long another process's role change can go unseen.
+    USER_CACHE_SIZE = _env_int('USER_CACHE_SIZE', 1024)
+    USER_CACHE_TTL = _env_int('USER_CACHE_TTL', 60)          # seconds, 0 disables
+
+    # SQL instrumentation (services/sql_metrics.py): slow-query log and a
+    # warning (or RepeatedQueryError when SQL_REPEAT_RAISE is set, as in
+    # tests) when one request runs the same statement shape too often.
+    SQL_METRICS_ENABLED = os.environ.get('SQL_METRICS_ENABLED', '1') != '0'
+    SQL_SLOW_QUERY_MS = _env_int('SQL_SLOW_QUERY_MS', 100)
+    SQL_REPEAT_THRESHOLD = _env_int('SQL_REPEAT_THRESHOLD', 10)
+    SQL_REPEAT_RAISE = os.environ.get('SQL_REPEAT_RAISE', '0') == '1'
+
+    # Rendered-page caching (services/page_cache.py): template fragments keyed
+    # on data versions, whole pages for anonymous visitors, and far-future
+    # expiry for static files requested with their content hash (?v=...).
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') != '0'
+    FRAGMENT_CACHE_BYTES = _env_int('FRAGMENT_CACHE_BYTES', 8 * 1024 * 1024)
+    RESPONSE_CACHE_BYTES = _env_int('RESPONSE_CACHE_BYTES', 8 * 1024 * 1024)
+    ANONYMOUS_CACHE_SECONDS = _env_int('ANONYMOUS_CACHE_SECONDS', 300)
+    STATIC_MAX_AGE = _env_int('STATIC_MAX_AGE', 365 * 24 * 3600)
+
+    # Advance bookings (services/schedule.py): how far ahead a slot can be
+    # booked and the longest window one booking may hold
+    ADVANCE_BOOKING_DAYS = _env_int('ADVANCE_BOOKING_DAYS', 30)
+    ADVANCE_BOOKING_MAX_HOURS = _env_int('ADVANCE_BOOKING_MAX_HOURS', 24)
+
+    # `flask archive-reservations` moves paid/cancelled reservations last
+    # changed this many days ago into reservation_archive
+    ARCHIVE_AFTER_DAYS = _env_int('ARCHIVE_AFTER_DAYS', 180)
+    ARCHIVE_BATCH_SIZE = _env_int('ARCHIVE_BATCH_SIZE', 1000)
+
+    # Startup (services/bootstrap.py): `flask --app app bootstrap` migrates the
+    # schema and creates the first admin from these. wsgi.py does the same at
+    # startup when BOOTSTRAP_ON_START is set.
+    ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@example.com')
+    ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'adminpassword')
+    BOOTSTRAP_ON_START = os.environ.get('BOOTSTRAP_ON_START', '0') == '1'
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    SECRET_KEY_REQUIRED = True
+    # No well-known admin password: without ADMIN_PASSWORD no admin is created
+    ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD')
+    SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', '1') != '0'
+    REMEMBER_COOKIE_SECURE = SESSION_COOKIE_SECURE
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQL_REPEAT_RAISE = True
+
+
+# Selected with APP_CONFIG (app.create_app)
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def shard_bind_key(shard):
+    # Shard 0 is the main database, the others are SQLALCHEMY_BINDS entries
+    return f'shard-{shard}' if shard else None
+
+
+def shard_binds(config):
+    """Build SQLALCHEMY_BINDS for shards 1..SHARD_COUNT-1."""
+    count = config['SHARD_COUNT']
+    if count > 1 and not config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        raise RuntimeError('SHARD_COUNT > 1 is only supported with SQLite databases.')
+    if count > 1 and '{shard}' not in config['SHARD_DATABASE_URL']:
+        raise RuntimeError('SHARD_DATABASE_URL must contain {shard}, e.g. sqlite:///parking-shard-{shard}.db.')
+    return {shard_bind_key(shard): config['SHARD_DATABASE_URL'].format(shard=shard) for shard in range(1, count)}
+
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the configured database URI."""
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # busy_timeout is also set as a pragma; this covers the connect itself
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0}}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
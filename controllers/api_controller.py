@@ -0,0 +1,279 @@
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, current_app, request, jsonify, abort, Response
+from flask_login import login_required, current_user
+
+from models import db
+from models.lot import ParkingLot
+from models.lot_occupancy import LotOccupancy
+from models.reservation import normalize_plate
+from services.availability import availability_index
+from services.booking import apply_gate_events, GATE_EVENT_TYPES, SlotUnavailable
+from services.events import subscribe, unsubscribe, sse_message, StreamLimitReached
+from services.nearby import nearest_available_lots, valid_coordinates
+from services.plates import active_plates, vehicle_stays
+from services.schedule import slot_schedule, parse_window
+from services.tariff import Tariff
+
+api_bp = Blueprint('api', __name__)
+
+# One character per slot keeps a 500-slot lot's statuses to 500 bytes
+STATUS_CODES = {'available': 'A', 'booked': 'B', 'occupied': 'O', 'maintenance': 'M'}
+STATUS_LEGEND = {code: status for status, code in STATUS_CODES.items()}
+NEAREST_MAX_K = 50
+GATE_MAX_EVENTS = 1000
+VEHICLE_MAX_RESULTS = 100
+
+
+def api_admin_required(view):
+    """Like main's admin_required, but answers 403 JSON instead of redirecting."""
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if not current_user.is_admin:
+            return jsonify({'error': 'This endpoint needs an admin account.'}), 403
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def _lot_payload(lot, version):
+    slots = availability_index.lot_slots(lot.id, version)
+    return {
+        'lot_id': lot.id,
+        'name': lot.name,
+        'version': version,
+        'ids': [slot['id'] for slot in slots],
+        'numbers': [slot['number'] for slot in slots],
+        'statuses': ''.join(STATUS_CODES.get(slot['status'], '?') for slot in slots),
+    }
+
+
+def _conditional(etag, build):
+    """304 if the client already holds ``etag``, otherwise the JSON from ``build()``.
+
+    ``build`` is only called on a miss, so unchanged polls never read slots.
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Always revalidate; the ETag makes that cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _lot_version(lot_id):
+    version = LotOccupancy.versions([lot_id]).get(lot_id)
+    if version is None:
+        if db.session.get(ParkingLot, lot_id) is None:
+            abort(404)
+        LotOccupancy.rebuild()
+        version = LotOccupancy.versions([lot_id])[lot_id]
+    return version
+
+
+@api_bp.route('/lots/<int:lot_id>/availability')
+@login_required
+def lot_availability(lot_id):
+    version = _lot_version(lot_id)
+
+    def build():
+        payload = _lot_payload(db.get_or_404(ParkingLot, lot_id), version)
+        payload['legend'] = STATUS_LEGEND
+        return payload
+
+    return _conditional(f'lot-{lot_id}-v{version}', build)
+
+
+@api_bp.route('/lots/availability')
+@login_required
+def lots_availability():
+    versions = LotOccupancy.versions()
+    lot_ids = [lot_id for (lot_id,) in db.session.query(ParkingLot.id)]
+    if any(lot_id not in versions for lot_id in lot_ids):
+        LotOccupancy.rebuild()
+        versions = LotOccupancy.versions()
+    etag = 'lots-' + LotOccupancy.fingerprint({lot_id: versions[lot_id] for lot_id in lot_ids})
+
+    def build():
+        return {
+            'legend': STATUS_LEGEND,
+            'lots': [_lot_payload(lot, occupancy.version) for lot, occupancy in LotOccupancy.for_lots()],
+        }
+
+    return _conditional(etag, build)
+
+
+@api_bp.route('/lots/<int:lot_id>/free_slots')
+@login_required
+def lot_free_slots(lot_id):
+    """Slots of one lot free for a whole window: ``?start=2026-10-20T09:00&end=2026-10-20T17:00``."""
+    _lot_version(lot_id)
+    try:
+        start, end = parse_window(request.args.get('start'), request.args.get('end'), datetime.utcnow(),
+                                  current_app.config['ADVANCE_BOOKING_DAYS'],
+                                  current_app.config['ADVANCE_BOOKING_MAX_HOURS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    slots = slot_schedule.free_slots(lot_id, start, end)
+    return jsonify({
+        'lot_id': lot_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'slots': [{'id': slot_id, 'number': number} for slot_id, number, _ in slots],
+    })
+
+
+@api_bp.route('/lots/nearest')
+@login_required
+def nearest_lots():
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    k = request.args.get('k', 5, type=int)
+    max_km = request.args.get('max_km', type=float)
+    if latitude is None or longitude is None or not valid_coordinates(latitude, longitude):
+        return jsonify({'error': 'lat and lon must be valid coordinates in degrees.'}), 400
+    if not 1 <= k <= NEAREST_MAX_K or (max_km is not None and max_km <= 0):
+        return jsonify({'error': f'k must be between 1 and {NEAREST_MAX_K} and max_km positive.'}), 400
+
+    return jsonify({
+        'lat': latitude,
+        'lon': longitude,
+        'lots': [{
+            'lot_id': lot.id,
+            'name': lot.name,
+            'location': lot.location,
+            'address': lot.address,
+            'price': lot.price,
+            'lat': lot.latitude,
+            'lon': lot.longitude,
+            'distance_km': round(km, 3),
+            'free_slots': free,
+            'version': version,
+        } for lot, version, free, km in nearest_available_lots(latitude, longitude, k, max_km)],
+    })
+
+
+def _streams_full():
+    # EventSource gives up on a 503; the page still works, just without live updates
+    response = jsonify({'error': 'Too many live-update streams on this server; try again later.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '60'
+    return response
+
+
+def _event_stream(subscription, ready):
+    """Yield SSE frames from a subscription until the client goes away.
+
+    Nothing here touches the database: frames arrive already encoded from
+    the broker and idle connections only get a comment line as keepalive.
+    """
+    keepalive = current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+
+    def generate():
+        yield 'retry: 3000\n\n' + ready
+        while True:
+            message = subscription.get(timeout=keepalive)
+            yield message if message is not None else ': keepalive\n\n'
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # Runs when the client disconnects, even if the stream never started
+    response.call_on_close(lambda: unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_bp.route('/lots/<int:lot_id>/events')
+@login_required
+def lot_events(lot_id):
+    # Subscribe before reading the version so no change can fall in between
+    try:
+        subscription = subscribe(lot_id)
+    except StreamLimitReached:
+        return _streams_full()
+    try:
+        version = _lot_version(lot_id)
+    except Exception:
+        unsubscribe(subscription)
+        raise
+    return _event_stream(subscription, sse_message('ready', {'lot_id': lot_id, 'version': version}))
+
+
+@api_bp.route('/lots/events')
+@login_required
+def lots_events():
+    try:
+        subscription = subscribe()
+    except StreamLimitReached:
+        return _streams_full()
+    return _event_stream(subscription, sse_message('ready', {'versions': LotOccupancy.versions()}))
+
+
+def _gate_event(item):
+    """Validate one posted gate event; returns (event, None) or (None, error)."""
+    if not isinstance(item, dict):
+        return None, 'must be an object'
+    vehicle_number, lot_id = item.get('vehicle_number'), item.get('lot_id')
+    if item.get('type') not in GATE_EVENT_TYPES:
+        return None, f"type must be one of: {', '.join(GATE_EVENT_TYPES)}"
+    plate = normalize_plate(vehicle_number) if isinstance(vehicle_number, str) else ''
+    if not 1 <= len(plate) <= 20:
+        return None, 'vehicle_number must have 1-20 letters or digits'
+    if not isinstance(lot_id, int) or isinstance(lot_id, bool):
+        return None, 'lot_id must be an integer'
+    return {'type': item['type'], 'vehicle_number': plate, 'lot_id': lot_id}, None
+
+
+@api_bp.route('/gate/events', methods=['POST'])
+@api_admin_required
+def gate_events():
+    """Entry/exit reads from the barrier cameras, applied as one batch.
+
+    Body: ``{"events": [{"type": "entry"|"exit", "vehicle_number": "...",
+    "lot_id": 1}, ...]}``. Returns one result per event, in order; invalid
+    events are reported and skipped without failing the rest.
+    """
+    body = request.get_json(silent=True)
+    items = body.get('events') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not 1 <= len(items) <= GATE_MAX_EVENTS:
+        return jsonify({'error': f'Send {{"events": [...]}} with 1 to {GATE_MAX_EVENTS} events.'}), 400
+
+    checked = [_gate_event(item) for item in items]
+    valid = [event for event, error in checked if error is None]
+    try:
+        applied = iter(apply_gate_events(valid, current_user.id, Tariff.from_config(current_app.config)))
+    except SlotUnavailable:
+        return jsonify({'error': 'The lots are busy; retry the batch.'}), 503
+
+    results = [next(applied) if error is None else {'outcome': 'invalid', 'error': error} for _, error in checked]
+    summary = {}
+    for result in results:
+        summary[result['outcome']] = summary.get(result['outcome'], 0) + 1
+    return jsonify({'results': results, 'summary': summary})
+
+
+@api_bp.route('/vehicles')
+@api_admin_required
+def vehicle_search():
+    """Autocomplete over the plates of parked vehicles: ``?q=MH12&limit=10``."""
+    prefix = normalize_plate(request.args.get('q', ''))
+    limit = request.args.get('limit', 10, type=int)
+    if not prefix or not 1 <= limit <= VEHICLE_MAX_RESULTS:
+        return jsonify({'error': f'q must contain a letter or digit and limit be 1 to {VEHICLE_MAX_RESULTS}.'}), 400
+    return jsonify({'q': prefix, 'matches': active_plates.search(prefix, limit)})
+
+
+@api_bp.route('/vehicles/<vehicle_number>')
+@api_admin_required
+def vehicle_lookup(vehicle_number):
+    """Where a vehicle is parked now and its most recent stays (``?limit=20``)."""
+    limit = request.args.get('limit', 20, type=int)
+    if not normalize_plate(vehicle_number) or not 1 <= limit <= VEHICLE_MAX_RESULTS:
+        return jsonify({'error': f'Give a plate and a limit of 1 to {VEHICLE_MAX_RESULTS}.'}), 400
+    plate, active, history = vehicle_stays(vehicle_number, limit)
+    return jsonify({'vehicle_number': plate, 'active': active, 'history': history})
@@ -3,10 +3,12 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import db
 from models.user import User
+from services.page_cache import cache_anonymous
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@cache_anonymous
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -29,6 +31,7 @@ def register():
     return render_template('register.html')
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@cache_anonymous
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.dashboard'))
@@ -1,17 +1,43 @@
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+import io
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, abort, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from functools import wraps
 from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
 
 from models import db
 from models.user import User
 from models.lot import ParkingLot
 from models.slot import ParkingSlot
-from models.reservation import Reservation
+from models.reservation import Reservation, normalize_plate
+from models.lot_occupancy import LotOccupancy
+from models.reservation_archive import ReservationArchive
+from models.user_summary import UserSummary
+from models.shards import use_shard, lot_shard, row_shard, sharded_by, gather, each_lot_shard, new_lot_shards
+from services.availability import availability_index
+from services.booking import (claim_slot, claim_any_slot, book_ahead_any, check_in, holding_reservations,
+                              move_reservation, SlotUnavailable, VehicleAlreadyParked)
+from services.schedule import parse_window
+from services.export import reservation_rows, iter_export, EXPORT_FORMATS
+from services.tariff import Tariff
+from services.analytics import refresh_rollups, daily_summary, daily_summaries, hourly_series_by_lot
+from services.provisioning import (expand_slot_range, bulk_add_slots, import_lots_csv, set_slot_status, remove_slots,
+                                   remove_lot, describe_slots, ProvisioningError)
+from services.user_cache import user_cache
+from services.page_cache import fragment_cache, response_cache
+from services.sql_metrics import sql_metrics
+from services.archive import merge_newest_first, ARCHIVED_STATUSES
+from services.nearby import parse_coordinates
 
 main_bp = Blueprint('main', __name__)
 
+RESERVATIONS_PAGE_SIZE = 50
+USER_HISTORY_PAGE_SIZE = 20
+OPEN_RESERVATION_STATUSES = ('scheduled', 'active', 'completed')
+ANALYTICS_MAX_DAYS = 366
+COORDINATES_ERROR = 'Latitude and longitude must both be given, in degrees (-90 to 90 and -180 to 180), or both left blank.'
+
 def admin_required(f):
     @wraps(f)
     @login_required
@@ -22,143 +48,223 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _admin_stats():
+    # Counters are maintained by the routes that change slot/reservation
+    # status, so this is one query regardless of table sizes.
+    stats = {'total_lots': 0, 'total_slots': 0, 'total_reservations': 0, 'active_reservations': 0,
+             'completed_reservations': 0, 'cancelled_reservations': 0, 'lots_with_slots': []}
+    for lot, occupancy in LotOccupancy.for_lots():
+        total = occupancy.total_slots
+        booked_count = occupancy.slots_booked + occupancy.slots_occupied
+        available = total - booked_count
+        stats['lots_with_slots'].append({'lot': lot, 'total': total, 'booked': booked_count, 'available': available})
+
+        stats['total_lots'] += 1
+        stats['total_slots'] += total
+        stats['total_reservations'] += occupancy.total_reservations
+        stats['active_reservations'] += occupancy.reservations_active
+        stats['completed_reservations'] += occupancy.reservations_completed
+        stats['cancelled_reservations'] += occupancy.reservations_cancelled
+    return stats
+
 # --- User Dashboard and Reservation ---
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
     if current_user.is_admin:
-        total_users = User.query.count()
-        total_lots = ParkingLot.query.count()
-        total_slots = ParkingSlot.query.count()
-        total_reservations = Reservation.query.count()
-
-        active_reservations = Reservation.query.filter(Reservation.status == 'active').count()
-        completed_reservations = Reservation.query.filter(Reservation.status == 'completed').count()
-        cancelled_reservations = Reservation.query.filter(Reservation.status == 'cancelled').count()
-
-        lots_with_slots = []
-        for lot in ParkingLot.query.all():
-            total = len(lot.slots)
-            booked = ParkingSlot.query.filter_by(lot_id=lot.id, status='booked').count()
-            occupied = ParkingSlot.query.filter_by(lot_id=lot.id, status='occupied').count()
-            booked_count = booked + occupied
-            available = total - booked_count
-            lots_with_slots.append({'lot': lot, 'total': total, 'booked': booked_count, 'available': available})
-
+        # The stat cards and lot overview are a cached fragment keyed on the
+        # user count and every lot's version; counters are only read on a miss.
         return render_template(
             'dashboard.html',
             is_admin=True,
-            total_users=total_users,
-            total_lots=total_lots,
-            total_slots=total_slots,
-            total_reservations=total_reservations,
-            active_reservations=active_reservations,
-            completed_reservations=completed_reservations,
-            cancelled_reservations=cancelled_reservations,
-            lots_with_slots=lots_with_slots
+            total_users=User.query.count(),
+            lots_fingerprint=LotOccupancy.fingerprint(),
+            load_stats=_admin_stats
         )
     else:
-        user_reservations = Reservation.query.filter_by(user_id=current_user.id).order_by(Reservation.start_time.desc()).all()
+        # First, as a missing summary is rebuilt and committed, which would
+        # expire the rows loaded below
+        summary = UserSummary.for_user(current_user.id)
+
+        # Ongoing and unpaid reservations are few and always live; settled
+        # history is paged newest-first across the live and archive tables
+        # (of every shard, when sharded).
+        open_reservations = gather(lambda: Reservation.query.options(
+            joinedload(Reservation.slot).joinedload(ParkingSlot.lot)
+        ).filter(
+            Reservation.user_id == current_user.id,
+            Reservation.status.in_(OPEN_RESERVATION_STATUSES)
+        ).order_by(Reservation.start_time.desc(), Reservation.id.desc()).all(),
+            key=lambda reservation: (reservation.start_time, reservation.id), reverse=True)
+
+        cursor = _parse_cursor(request.args.get('after'))
+        history = merge_newest_first(*gather(lambda: [
+            model.query.options(
+                joinedload(model.slot).joinedload(ParkingSlot.lot)
+            ).filter(
+                model.user_id == current_user.id,
+                model.status.in_(ARCHIVED_STATUSES),
+                _older_than(model, cursor)
+            ).order_by(model.start_time.desc(), model.id.desc()).limit(USER_HISTORY_PAGE_SIZE + 1).all()
+            for model in (Reservation, ReservationArchive)
+        ]), limit=USER_HISTORY_PAGE_SIZE + 1)
+
+        next_cursor = None
+        if len(history) > USER_HISTORY_PAGE_SIZE:
+            history = history[:USER_HISTORY_PAGE_SIZE]
+            next_cursor = f'{history[-1].start_time.isoformat()}_{history[-1].id}'
 
         return render_template(
             'dashboard.html',
             is_admin=False,
-            reservations=user_reservations,
+            open_reservations=open_reservations,
+            history=history,
+            next_cursor=next_cursor,
+            is_first_page=cursor is None,
+            summary=summary,
             now=datetime.utcnow()
         )
 
 @main_bp.route('/view_parking')
 @login_required
 def view_parking():
-    lots = ParkingLot.query.all()
-    lots_data = []
-    for lot in lots:
-        slots = ParkingSlot.query.filter_by(lot_id=lot.id).all()
-        active_reservations = Reservation.query.filter(
-            Reservation.slot_id.in_([s.id for s in slots]),
-            Reservation.status == 'active'
-        ).all()
-        slots_with_status = []
-        for slot in slots:
-            is_reserved = any(res.slot_id == slot.id for res in active_reservations)
-
-            if slot.status == 'maintenance':
-                display_status = 'maintenance'
-            elif slot.status == 'occupied':
-                display_status = 'occupied'
-            elif is_reserved:
-                display_status = 'booked'
-            else:
-                display_status = 'available'
-
-            slots_with_status.append({
-                'id': slot.id,
-                'number': slot.slot_number,
-                'status': display_status
-            })
-        lots_data.append({'lot': lot, 'slots': slots_with_status})
+    lots_data = [
+        {'lot': lot, 'slots': availability_index.lot_slots(lot.id, occupancy.version)}
+        for lot, occupancy in LotOccupancy.for_lots()
+    ]
     return render_template('view_parking.html', lots_data=lots_data)
 
 
 @main_bp.route('/book_slot/<int:slot_id>', methods=['GET', 'POST'])
 @login_required
+@sharded_by('slot_id', row_shard)
 def book_slot(slot_id):
     slot = ParkingSlot.query.get_or_404(slot_id)
 
-    # Check if the slot is currently occupied or has an active reservation
+    # Check if the slot is currently occupied, has an active reservation or is booked ahead
     if slot.status == 'occupied':
         flash(f'Slot {slot.slot_number} is currently occupied.', 'warning')
         return redirect(url_for('main.view_parking'))
     
-    active_reservation = Reservation.query.filter_by(slot_id=slot.id, status='active').first()
+    active_reservation = Reservation.query.filter(
+        Reservation.slot_id == slot.id, holding_reservations(datetime.utcnow())
+    ).first()
     if active_reservation:
         flash(f'Slot {slot.slot_number} is currently booked.', 'warning')
         return redirect(url_for('main.view_parking'))
 
     if request.method == 'POST':
-        vehicle_number = request.form.get('vehicle_number', '').strip()
+        vehicle_number = normalize_plate(request.form.get('vehicle_number', ''))
         
         if not vehicle_number:
             flash('Vehicle number is required.', 'danger')
             return render_template('book_slot.html', slot=slot)
 
-        # Set start_time to current time
-        start_time = datetime.utcnow()
-        
-        # Set initial end_time to far future (will be updated when slot is released)
-        # Using a date far in the future as placeholder since end_time is required
-        end_time = datetime.utcnow() + timedelta(days=365*100)  # 100 years in future as placeholder
-        
-        # Check if slot is still available
-        if slot.status == 'occupied':
+        # The booking engine claims the slot with a conditional UPDATE, so a
+        # concurrent booking of the same slot fails here instead of double-booking.
+        try:
+            claim_slot(slot.id, current_user.id, vehicle_number)
+        except SlotUnavailable:
             flash(f'Slot {slot.slot_number} became unavailable. Please try another slot.', 'warning')
             return redirect(url_for('main.view_parking'))
-
-        # Cost will be calculated when slot is released, set to None initially
-        new_reservation = Reservation(
-            user_id=current_user.id,
-            slot_id=slot.id,
-            vehicle_number=vehicle_number,
-            start_time=start_time,
-            end_time=end_time,
-            status='active',
-            cost=None  # Will be calculated on release
-        )
-        
-        # Mark slot as occupied
-        slot.status = 'occupied'
-        
-        db.session.add(new_reservation)
-        db.session.add(slot)
-        db.session.commit()
+        except VehicleAlreadyParked:
+            flash(f'Vehicle {vehicle_number} already has an active reservation.', 'warning')
+            return redirect(url_for('main.dashboard'))
         
         flash(f'Slot {slot.slot_number} in {slot.lot.name} booked successfully for vehicle {vehicle_number}!', 'success')
         return redirect(url_for('main.dashboard'))
 
     return render_template('book_slot.html', slot=slot)
 
+@main_bp.route('/book_any/<int:lot_id>', methods=['GET', 'POST'])
+@login_required
+@sharded_by('lot_id', lot_shard)
+def book_any_slot(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+
+    if request.method == 'POST':
+        vehicle_number = normalize_plate(request.form.get('vehicle_number', ''))
+
+        if not vehicle_number:
+            flash('Vehicle number is required.', 'danger')
+            return render_template('book_slot.html', slot=None, lot=lot)
+
+        try:
+            reservation = claim_any_slot(lot.id, current_user.id, vehicle_number)
+        except SlotUnavailable:
+            flash(f'No free slots left in {lot.name}. Please try another parking lot.', 'warning')
+            return redirect(url_for('main.view_parking'))
+        except VehicleAlreadyParked:
+            flash(f'Vehicle {vehicle_number} already has an active reservation.', 'warning')
+            return redirect(url_for('main.dashboard'))
+
+        flash(f'Slot {reservation.slot.slot_number} in {lot.name} booked successfully for vehicle {vehicle_number}!', 'success')
+        return redirect(url_for('main.dashboard'))
+
+    return render_template('book_slot.html', slot=None, lot=lot)
+
+@main_bp.route('/book_ahead/<int:lot_id>', methods=['GET', 'POST'])
+@login_required
+@sharded_by('lot_id', lot_shard)
+def book_ahead(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+
+    if request.method == 'POST':
+        vehicle_number = normalize_plate(request.form.get('vehicle_number', ''))
+        if not vehicle_number:
+            flash('Vehicle number is required.', 'danger')
+            return render_template('book_slot.html', slot=None, lot=lot, ahead=True)
+        try:
+            start, end = parse_window(request.form.get('start'), request.form.get('end'), datetime.utcnow(),
+                                      current_app.config['ADVANCE_BOOKING_DAYS'],
+                                      current_app.config['ADVANCE_BOOKING_MAX_HOURS'])
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return render_template('book_slot.html', slot=None, lot=lot, ahead=True)
+
+        try:
+            reservation = book_ahead_any(lot.id, current_user.id, vehicle_number, start, end)
+        except SlotUnavailable:
+            flash(f'No slot in {lot.name} is free for the whole of that time. Please try another time or lot.', 'warning')
+            return render_template('book_slot.html', slot=None, lot=lot, ahead=True)
+        except VehicleAlreadyParked:
+            flash(f'Vehicle {vehicle_number} already has a booking at that time.', 'warning')
+            return redirect(url_for('main.dashboard'))
+
+        flash(f'Slot {reservation.slot.slot_number} in {lot.name} booked for vehicle {vehicle_number} from '
+              f'{start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}. Check in from the dashboard when you arrive.', 'success')
+        return redirect(url_for('main.dashboard'))
+
+    return render_template('book_slot.html', slot=None, lot=lot, ahead=True)
+
+@main_bp.route('/check_in/<int:reservation_id>')
+@login_required
+@sharded_by('reservation_id', row_shard)
+def check_in_reservation(reservation_id):
+    reservation = Reservation.query.get_or_404(reservation_id)
+    if reservation.user_id != current_user.id and not current_user.is_admin:
+        flash('You are not authorized to check in to this reservation.', 'danger')
+        return redirect(url_for('main.dashboard'))
+
+    now = datetime.utcnow()
+    if reservation.status != 'scheduled':
+        flash('Only an upcoming booking can be checked in to.', 'warning')
+    elif not reservation.start_time <= now < reservation.end_time:
+        flash(f'Check-in is open from {reservation.start_time:%Y-%m-%d %H:%M} until {reservation.end_time:%Y-%m-%d %H:%M}.', 'warning')
+    else:
+        try:
+            check_in(reservation.id)
+        except SlotUnavailable:
+            flash(f'Slot {reservation.slot.slot_number} is still occupied. Please ask the attendant for help.', 'warning')
+        except VehicleAlreadyParked:
+            flash(f'Vehicle {reservation.vehicle_number} is already parked.', 'warning')
+        else:
+            flash(f'Checked in to slot {reservation.slot.slot_number}.', 'success')
+    return redirect(url_for('main.dashboard'))
+
 @main_bp.route('/release_slot/<int:reservation_id>')
 @login_required
+@sharded_by('reservation_id', row_shard)
 def release_slot(reservation_id):
     reservation = Reservation.query.get_or_404(reservation_id)
     
@@ -171,6 +277,12 @@ def release_slot(reservation_id):
     if reservation.status != 'active':
         flash('Cannot release a slot that is not active.', 'warning')
         return redirect(url_for('main.dashboard'))
+
+    # A second submit of the same release stops here instead of counting it twice
+    if not move_reservation(reservation.id, 'active', 'completed'):
+        db.session.rollback()
+        flash('This slot has already been released.', 'info')
+        return redirect(url_for('main.dashboard'))
     
     # Set end_time to current time
     end_time = datetime.utcnow()
@@ -179,10 +291,11 @@ def release_slot(reservation_id):
     duration = end_time - reservation.start_time
     duration_hours = duration.total_seconds() / 3600.0
     
-    # Calculate cost (hours * lot.price)
+    # Calculate cost from the lot's hourly price and the configured tariff rules
     total_cost = 0
     if reservation.slot and reservation.slot.lot and reservation.slot.lot.price is not None:
-        total_cost = reservation.slot.lot.price * duration_hours
+        tariff = Tariff.from_config(current_app.config)
+        total_cost = tariff.cost(reservation.start_time, end_time, reservation.slot.lot.price)
     else:
         flash('This parking lot does not have a price set. Cost set to 0.', 'warning')
     
@@ -190,9 +303,12 @@ def release_slot(reservation_id):
     reservation.end_time = end_time
     reservation.cost = total_cost
     reservation.status = 'completed'
+    UserSummary.stay_finished(reservation.user_id, reservation.start_time, end_time)
     
     # Mark slot as available
     if reservation.slot:
+        LotOccupancy.reservation_changed(reservation.slot.lot_id, 'active', 'completed')
+        LotOccupancy.slot_changed(reservation.slot.lot_id, reservation.slot.status or 'available', 'available')
         reservation.slot.status = 'available'
         db.session.add(reservation.slot)
     
@@ -204,6 +320,7 @@ def release_slot(reservation_id):
 
 @main_bp.route('/pay/<int:reservation_id>', methods=['GET', 'POST'])
 @login_required
+@sharded_by('reservation_id', row_shard)
 def pay(reservation_id):
     reservation = Reservation.query.get_or_404(reservation_id)
     
@@ -218,8 +335,15 @@ def pay(reservation_id):
         return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
+        if not move_reservation(reservation.id, 'completed', 'paid'):
+            db.session.rollback()
+            flash('This reservation has already been paid.', 'info')
+            return redirect(url_for('main.dashboard'))
         # Process payment (mock payment)
         reservation.status = 'paid'
+        UserSummary.paid(reservation.user_id, reservation.cost)
+        if reservation.slot:
+            LotOccupancy.reservation_changed(reservation.slot.lot_id, 'completed', 'paid')
         db.session.add(reservation)
         db.session.commit()
         
@@ -238,17 +362,32 @@ def pay(reservation_id):
 
 @main_bp.route('/cancel_reservation/<int:reservation_id>')
 @login_required
+@sharded_by('reservation_id', row_shard)
 def cancel_reservation(reservation_id):
     reservation = Reservation.query.get_or_404(reservation_id)
     if reservation.user_id != current_user.id and not current_user.is_admin:
         flash('You are not authorized to cancel this reservation.', 'danger')
         return redirect(url_for('main.dashboard'))
 
-    if reservation.status != 'active':
+    if reservation.status in ('scheduled', 'active') and not move_reservation(
+            reservation.id, reservation.status, 'cancelled'):
+        db.session.rollback()
+        flash('This reservation has already changed; nothing was cancelled.', 'info')
+    elif reservation.status == 'scheduled':
+        # Not started yet, so the slot was never taken
+        reservation.status = 'cancelled'
+        if reservation.slot:
+            LotOccupancy.reservation_changed(reservation.slot.lot_id, 'scheduled', 'cancelled')
+        db.session.add(reservation)
+        db.session.commit()
+        flash('Booking cancelled successfully.', 'info')
+    elif reservation.status != 'active':
         flash('Cannot cancel a reservation that is not active.', 'warning')
     else:
         reservation.status = 'cancelled'
         if reservation.slot:
+            LotOccupancy.reservation_changed(reservation.slot.lot_id, 'active', 'cancelled')
+            LotOccupancy.slot_changed(reservation.slot.lot_id, reservation.slot.status or 'available', 'available')
             reservation.slot.status = 'available'
         db.session.add(reservation)
         db.session.commit()
@@ -260,8 +399,11 @@ def cancel_reservation(reservation_id):
 @main_bp.route('/admin/lots')
 @admin_required
 def admin_lots():
-    lots = ParkingLot.query.all()
-    return render_template('admin_lots.html', lots=lots)
+    # Slot counts come from the occupancy counters instead of loading every lot's slots
+    lot_rows = LotOccupancy.for_lots()
+    lots = [lot for lot, _ in lot_rows]
+    slot_counts = {lot.id: occupancy.total_slots for lot, occupancy in lot_rows}
+    return render_template('admin_lots.html', lots=lots, slot_counts=slot_counts)
 
 
 @main_bp.route('/admin/add_lot', methods=['GET', 'POST'])
@@ -303,6 +445,11 @@ def add_lot():
                 flash('Invalid maximum number of spots format. Please enter a whole number.', 'danger')
                 return render_template('add_edit_lot.html', lot=None) # Pass lot=None on error
 
+        try:
+            latitude, longitude = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+        except ValueError:
+            flash(COORDINATES_ERROR, 'danger')
+            return render_template('add_edit_lot.html', lot=None)
 
         new_lot = ParkingLot(
             name=name,
@@ -310,10 +457,17 @@ def add_lot():
             price=price,
             address=address,
             pin_code=pin_code,
-            maximum_number_of_spots=maximum_number_of_spots
+            maximum_number_of_spots=maximum_number_of_spots,
+            latitude=latitude,
+            longitude=longitude,
+            shard=new_lot_shards()[0]
         )
         db.session.add(new_lot)
         db.session.commit()
+        # Its counters live in the lot's shard (the same database unless sharded)
+        with use_shard(lot_shard(new_lot.id)):
+            db.session.add(LotOccupancy(lot_id=new_lot.id))
+            db.session.commit()
         flash(f'Parking Lot "{name}" added successfully!', 'success')
         return redirect(url_for('main.admin_lots'))
    
@@ -346,7 +500,17 @@ def edit_lot(lot_id):
             flash('Invalid maximum number of spots format. Please enter a whole number.', 'danger')
             return render_template('add_edit_lot.html', lot=lot)
 
+        try:
+            lot.latitude, lot.longitude = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+        except ValueError:
+            flash(COORDINATES_ERROR, 'danger')
+            return render_template('add_edit_lot.html', lot=lot)
+
         db.session.commit()
+        # After the lot itself, so pages cached for the new version show the new details
+        with use_shard(lot_shard(lot.id)):
+            LotOccupancy.touch(lot.id)
+            db.session.commit()
         flash(f'Parking Lot "{lot.name}" updated successfully!', 'success')
         return redirect(url_for('main.admin_lots'))
 
@@ -356,18 +520,20 @@ def edit_lot(lot_id):
 @admin_required
 def delete_lot(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
+    name = lot.name
     try:
-        db.session.delete(lot)
-        db.session.commit()
-        flash(f'Parking Lot "{lot.name}" and all its slots/reservations deleted successfully!', 'success')
+        slots, cancelled, archived = remove_lot(lot.id)
     except Exception as e:
-        db.session.rollback()
         flash(f'Error deleting parking lot: {str(e)}', 'danger')
+        return redirect(url_for('main.admin_lots'))
+    flash(f'Parking Lot "{name}" and its {slots} slots deleted successfully! '
+          f'{archived} reservations were archived ({cancelled} of them cancelled).', 'success')
     return redirect(url_for('main.admin_lots'))
 
 
 @main_bp.route('/admin/slots/<int:lot_id>')
 @admin_required
+@sharded_by('lot_id', lot_shard)
 def admin_slots(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
     slots = ParkingSlot.query.filter_by(lot_id=lot.id).order_by(ParkingSlot.slot_number).all()
@@ -375,6 +541,7 @@ def admin_slots(lot_id):
 
 @main_bp.route('/admin/add_slot/<int:lot_id>', methods=['POST'])
 @admin_required
+@sharded_by('lot_id', lot_shard)
 def add_slot(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
     slot_number = request.form.get('slot_number')
@@ -397,17 +564,58 @@ def add_slot(lot_id):
 
 
     new_slot = ParkingSlot(lot_id=lot.id, slot_number=slot_number, status='available')
+    LotOccupancy.slot_changed(lot.id, None, 'available')
     db.session.add(new_slot)
     db.session.commit()
     flash(f'Slot "{slot_number}" added to {lot.name} successfully!', 'success')
     return redirect(url_for('main.admin_slots', lot_id=lot.id))
 
+@main_bp.route('/admin/bulk_add_slots/<int:lot_id>', methods=['POST'])
+@admin_required
+@sharded_by('lot_id', lot_shard)
+def bulk_add_slots_view(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    try:
+        slot_numbers = expand_slot_range(request.form.get('slot_range'))
+        if not slot_numbers:
+            flash('Slot range is required.', 'danger')
+            return redirect(url_for('main.admin_slots', lot_id=lot.id))
+        added, skipped = bulk_add_slots(lot, slot_numbers)
+    except ProvisioningError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.admin_slots', lot_id=lot.id))
+
+    message = f'{added} slots added to {lot.name} successfully!'
+    if skipped:
+        message += f' {skipped} already existed and were skipped.'
+    flash(message, 'success')
+    return redirect(url_for('main.admin_slots', lot_id=lot.id))
+
+@main_bp.route('/admin/import_lots', methods=['POST'])
+@admin_required
+def import_lots():
+    upload = request.files.get('csv_file')
+    if not upload or not upload.filename:
+        flash('Please choose a CSV file to import.', 'danger')
+        return redirect(url_for('main.admin_lots'))
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        created, added, skipped = import_lots_csv(stream)
+    except (ProvisioningError, UnicodeDecodeError) as e:
+        flash(f'Import failed, nothing was changed: {e}', 'danger')
+        return redirect(url_for('main.admin_lots'))
+
+    flash(f'Import complete: {created} lots created, {added} slots added, {skipped} existing slots skipped.', 'success')
+    return redirect(url_for('main.admin_lots'))
+
 @main_bp.route('/admin/update_slot_status/<int:slot_id>', methods=['POST'])
 @admin_required
+@sharded_by('slot_id', row_shard)
 def update_slot_status(slot_id):
     slot = ParkingSlot.query.get_or_404(slot_id)
     new_status = request.form.get('status')
     if new_status in ['available', 'booked', 'maintenance', 'occupied']: # Define allowed statuses
+        LotOccupancy.slot_changed(slot.lot_id, slot.status or 'available', new_status)
         slot.status = new_status
         db.session.commit()
         flash(f'Slot {slot.slot_number} status updated to "{new_status}".', 'success')
@@ -415,24 +623,249 @@ def update_slot_status(slot_id):
         flash('Invalid status provided.', 'danger')
     return redirect(url_for('main.admin_slots', lot_id=slot.lot_id))
 
+@main_bp.route('/admin/bulk_slot_status/<int:lot_id>', methods=['POST'])
+@admin_required
+@sharded_by('lot_id', lot_shard)
+def bulk_slot_status(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    status = request.form.get('status')
+    try:
+        # A blank range means every slot of the lot
+        slot_numbers = expand_slot_range(request.form.get('slot_range')) or None
+        changed, skipped = set_slot_status(lot, status, slot_numbers)
+    except ProvisioningError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.admin_slots', lot_id=lot.id))
+
+    message = f'{changed} slots in {lot.name} set to "{status}".'
+    if skipped:
+        message += f' {skipped} slots with a vehicle parked were left unchanged.'
+    flash(message, 'success')
+    return redirect(url_for('main.admin_slots', lot_id=lot.id))
+
 @main_bp.route('/admin/delete_slot/<int:slot_id>', methods=['POST'])
 @admin_required
+@sharded_by('slot_id', row_shard)
 def delete_slot(slot_id):
     slot = ParkingSlot.query.get_or_404(slot_id)
-    lot_id = slot.lot_id
+    lot_id, slot_number = slot.lot_id, slot.slot_number
     try:
-        # Before deleting slot, consider cancelling any active reservations for it
-        # For this example, cascade delete is handled by the model relationship for Reservation
-        db.session.delete(slot)
-        db.session.commit()
-        flash(f'Slot "{slot.slot_number}" deleted successfully!', 'success')
+        _, cancelled, archived, kept = remove_slots(lot_id, [slot_number])
+        if kept:
+            flash(f'Slot "{slot_number}" has a vehicle parked or a stay awaiting payment and was not deleted.',
+                  'warning')
+        else:
+            flash(f'Slot "{slot_number}" deleted successfully! {archived} reservations were archived '
+                  f'({cancelled} of them cancelled).', 'success')
     except Exception as e:
-        db.session.rollback()
         flash(f'Error deleting slot: {str(e)}', 'danger')
     return redirect(url_for('main.admin_slots', lot_id=lot_id))
 
+@main_bp.route('/admin/bulk_delete_slots/<int:lot_id>', methods=['POST'])
+@admin_required
+@sharded_by('lot_id', lot_shard)
+def bulk_delete_slots(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    try:
+        slot_numbers = expand_slot_range(request.form.get('slot_range'))
+        if not slot_numbers:
+            flash('Slot range is required.', 'danger')
+            return redirect(url_for('main.admin_slots', lot_id=lot.id))
+        slots, cancelled, archived, kept = remove_slots(lot.id, slot_numbers)
+    except ProvisioningError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.admin_slots', lot_id=lot.id))
+
+    flash(f'{slots} slots deleted from {lot.name}. {archived} reservations were archived '
+          f'({cancelled} of them cancelled).', 'success')
+    if kept:
+        flash(f'{len(kept)} slots have a vehicle parked or a stay awaiting payment and were kept: '
+              f'{describe_slots(kept)}.', 'warning')
+    return redirect(url_for('main.admin_slots', lot_id=lot.id))
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+def _parse_cursor(value):
+    # Cursors are "<start_time isoformat>_<id>" of the last row on the previous page
+    try:
+        start_time, reservation_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(start_time), int(reservation_id)
+    except (AttributeError, ValueError):
+        return None
+
+def _older_than(model, cursor):
+    # Keyset pagination on (start_time, id): each page is an index range
+    # scan instead of an OFFSET that grows with history.
+    if cursor is None:
+        return db.true()
+    start_time, reservation_id = cursor
+    return db.or_(
+        model.start_time < start_time,
+        db.and_(model.start_time == start_time, model.id < reservation_id)
+    )
+
 @main_bp.route('/admin/reservations')
 @admin_required
 def admin_reservations():
-    reservations = Reservation.query.order_by(Reservation.start_time.desc()).all()
-    return render_template('admin_reservations.html', reservations=reservations, now=datetime.utcnow())
\ No newline at end of file
+    filters = {
+        'status': request.args.get('status', ''),
+        'lot_id': request.args.get('lot_id', type=int),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+
+    date_from = _parse_date(filters['date_from'])
+    date_to = _parse_date(filters['date_to'])
+    cursor = _parse_cursor(request.args.get('after'))
+
+    def page(model, in_lot):
+        query = model.query.options(
+            joinedload(model.user),
+            joinedload(model.slot).joinedload(ParkingSlot.lot)
+        )
+        if filters['status']:
+            query = query.filter(model.status == filters['status'])
+        if filters['lot_id']:
+            query = query.filter(in_lot)
+        if date_from:
+            query = query.filter(model.start_time >= date_from)
+        if date_to:
+            query = query.filter(model.start_time < date_to + timedelta(days=1))
+        return query.filter(_older_than(model, cursor)).order_by(model.start_time.desc(), model.id.desc()).limit(RESERVATIONS_PAGE_SIZE + 1).all()
+
+    # Live and archived reservations are paged together, from every shard
+    # or just the filtered lot's
+    lot_slot_ids = db.select(ParkingSlot.id).where(ParkingSlot.lot_id == filters['lot_id'])
+    reservations = merge_newest_first(*gather(lambda: [
+        page(Reservation, Reservation.slot_id.in_(lot_slot_ids)),
+        page(ReservationArchive, ReservationArchive.lot_id == filters['lot_id']),
+    ], lot_id=filters['lot_id']), limit=RESERVATIONS_PAGE_SIZE + 1)
+
+    next_cursor = None
+    if len(reservations) > RESERVATIONS_PAGE_SIZE:
+        reservations = reservations[:RESERVATIONS_PAGE_SIZE]
+        last = reservations[-1]
+        next_cursor = f'{last.start_time.isoformat()}_{last.id}'
+
+    lots = db.session.query(ParkingLot.id, ParkingLot.name).order_by(ParkingLot.name).all()
+    return render_template(
+        'admin_reservations.html',
+        reservations=reservations,
+        lots=lots,
+        filters=filters,
+        next_cursor=next_cursor,
+        is_first_page=cursor is None,
+        now=datetime.utcnow()
+    )
+
+@main_bp.route('/admin/reservations/export')
+@admin_required
+def export_reservations():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    rows = reservation_rows(
+        status=request.args.get('status') or None,
+        lot_id=request.args.get('lot_id', type=int),
+        date_from=_parse_date(request.args.get('date_from')),
+        date_to=_parse_date(request.args.get('date_to')),
+    )
+    filename = f'reservations-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}'
+    # stream_with_context keeps the DB session alive while the body is sent
+    return Response(
+        stream_with_context(iter_export(fmt, rows)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def _analytics_range():
+    today = datetime.utcnow().date()
+    date_to = _parse_date(request.args.get('date_to'))
+    date_to = date_to.date() if date_to else today
+    date_from = _parse_date(request.args.get('date_from'))
+    date_from = date_from.date() if date_from else date_to - timedelta(days=6)
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    return date_from, min(date_to, date_from + timedelta(days=ANALYTICS_MAX_DAYS - 1))
+
+@main_bp.route('/admin/analytics')
+@admin_required
+def admin_analytics():
+    lots = db.session.query(ParkingLot.id, ParkingLot.name).order_by(ParkingLot.name).all()
+    lot_id = request.args.get('lot_id', type=int) or (lots[0].id if lots else None)
+    date_from, date_to = _analytics_range()
+    days, occupancy = [], None
+    if lot_id:
+        with use_shard(lot_shard(lot_id)):
+            days = daily_summary(lot_id, date_from, date_to)
+            occupancy = db.session.get(LotOccupancy, lot_id)
+    return render_template(
+        'admin_analytics.html',
+        lots=lots,
+        lot_id=lot_id,
+        date_from=date_from,
+        date_to=date_to,
+        days=days,
+        total_slots=occupancy.total_slots if occupancy else 0
+    )
+
+@main_bp.route('/admin/analytics.json')
+@admin_required
+def admin_analytics_json():
+    lot_ids = [request.args.get('lot_id', type=int)] if request.args.get('lot_id') else \
+        [lot_id for (lot_id,) in db.session.query(ParkingLot.id).order_by(ParkingLot.id)]
+    date_from, date_to = _analytics_range()
+    hourly = request.args.get('granularity') == 'hour'
+
+    # One query (two for days) per shard, whatever the number of lots
+    fetch = hourly_series_by_lot if hourly else daily_summaries
+    series = {}
+    for part in each_lot_shard(lot_ids, lambda ids: fetch(ids, date_from, date_to)):
+        series.update(part)
+
+    return jsonify({
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'granularity': 'hour' if hourly else 'day',
+        'lots': {str(lot_id): series[lot_id] for lot_id in lot_ids},
+    })
+
+@main_bp.route('/admin/analytics/refresh', methods=['POST'])
+@admin_required
+def refresh_analytics():
+    rebuilt = refresh_rollups()
+    flash(f'Analytics refreshed ({rebuilt} lot-days recomputed).', 'success')
+    return redirect(url_for('main.admin_analytics', **request.args))
+
+@main_bp.route('/admin/user_cache.json')
+@admin_required
+def admin_user_cache_json():
+    return jsonify(user_cache.stats())
+
+@main_bp.route('/admin/page_cache.json')
+@admin_required
+def admin_page_cache_json():
+    return jsonify({'fragments': fragment_cache.stats(), 'responses': response_cache.stats()})
+
+@main_bp.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    return render_template('admin_metrics.html', endpoints=sql_metrics.snapshot(),
+                           threshold=current_app.config['SQL_REPEAT_THRESHOLD'],
+                           slow_ms=current_app.config['SQL_SLOW_QUERY_MS'])
+
+@main_bp.route('/admin/metrics.json')
+@admin_required
+def admin_metrics_json():
+    return jsonify({'endpoints': sql_metrics.snapshot()})
+
+@main_bp.route('/admin/metrics/reset', methods=['POST'])
+@admin_required
+def reset_metrics():
+    sql_metrics.reset()
+    flash('SQL metrics reset.', 'success')
+    return redirect(url_for('main.admin_metrics'))
@@ -1,28 +1,35 @@
 # create_db.py
-import app # This imports your app.py file as a module
-from models import db # Assuming models.py has 'db' instance
-from models.lot import ParkingLot
-from models.slot import ParkingSlot
-from models.reservation import Reservation
-from models.user import User
+# Brings the database schema up to date through the Flask-Migrate chain in
+# migrations/ (existing data is kept) and creates the admin user, the same as
+# `flask --app app bootstrap`. Pass --reset to drop everything first (refused
+# with APP_CONFIG=production) and --seed to add synthetic users, lots, slots
+# and reservations (see `flask --app app seed-data --help` for the sizes).
+import sys
 
-with app.app.app_context():
-    print("Dropping all existing database tables...")
-    db.drop_all()
-    print("Creating new database tables based on models...")
-    db.create_all()
-    print("Database tables dropped and recreated with new schema.")
+from app import create_app
+from models import db
+from services.bootstrap import bootstrap
 
-    if not User.query.filter_by(role='admin').first():
-        from werkzeug.security import generate_password_hash
-        admin_user = User(
-            name='Admin',
-            email='admin@example.com',
-            password=generate_password_hash('adminpassword', method='pbkdf2:sha256'),
-            role='admin'
-        )
-        db.session.add(admin_user)
-        db.session.commit()
-        print("Admin user created: admin@example.com / adminpassword")
-    else:
-        print("Admin user already exists.")
\ No newline at end of file
+app = create_app()
+
+if '--reset' in sys.argv:
+    if app.config['APP_CONFIG'] == 'production':
+        sys.exit("Refusing to --reset a production database.")
+    with app.app_context():
+        print("Dropping all existing database tables...")
+        # Every engine: the main database and any shard databases
+        for engine in db.engines.values():
+            db.metadata.drop_all(bind=engine)
+            with engine.begin() as connection:
+                connection.execute(db.text('DROP TABLE IF EXISTS alembic_version'))
+
+print("Applying database migrations...")
+for line in bootstrap(app):
+    print(line)
+
+if '--seed' in sys.argv:
+    from services.seed import seed_demo_data
+    with app.app_context():
+        counts = seed_demo_data()
+    print(f"Seeded {counts['users']} users, {counts['lots']} lots, {counts['slots']} slots, "
+          f"{counts['reservations']} reservations (password: 'password').")
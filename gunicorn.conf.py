@@ -0,0 +1,40 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app is imported once in the master (preload_app) and each worker is a
+# fork of it, so workers start in milliseconds and share the imported code.
+# Database pools and the Redis event listener are reopened in every worker
+# (models.init_db, services.events).
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Under gthread each open live-update stream (/api/.../events) holds one of a
+# worker's threads until the client leaves. Streams beyond SSE_MAX_STREAMS per
+# worker (default: half the threads) get a 503, so page requests always find
+# a free thread. For many idle streams run a second server with
+# GUNICORN_WORKER_CLASS=gevent and route only the stream URLs to it (README).
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+if worker_class == 'gevent':
+    # Before the app is preloaded, so the locks and queues it creates yield
+    # to other connections instead of blocking the worker
+    from gevent import monkey
+    monkey.patch_all()
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+    os.environ.setdefault('SSE_MAX_STREAMS', str(worker_connections - 100))
+else:
+    os.environ.setdefault('SSE_MAX_STREAMS', str(max(1, threads // 2)))
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+accesslog = '-'
+
+
+def when_ready(server):
+    if workers > 1 and not os.environ.get('EVENT_BROKER_URL'):
+        server.log.warning('Several workers without EVENT_BROKER_URL: live slot updates only '
+                           'reach clients connected to the worker that made the change.')
+    elif worker_class == 'gevent' and not os.environ.get('EVENT_BROKER_URL'):
+        server.log.warning('Stream server without EVENT_BROKER_URL: it only sees slot changes '
+                           'made by requests it serves itself.')
@@ -0,0 +1,76 @@
+"""baseline schema
+
+Revision ID: 0001_baseline
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created by the old create_db.py / db.create_all() already have
+    # these tables; adopt them instead of failing.
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'user' not in existing:
+        op.create_table('user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password', sa.String(length=200), nullable=False),
+            sa.Column('role', sa.String(length=20), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email')
+        )
+    if 'parking_lot' not in existing:
+        op.create_table('parking_lot',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('location', sa.String(length=200), nullable=False),
+            sa.Column('price', sa.Float(), nullable=True),
+            sa.Column('address', sa.String(length=255), nullable=True),
+            sa.Column('pin_code', sa.String(length=20), nullable=True),
+            sa.Column('maximum_number_of_spots', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+    if 'parking_slot' not in existing:
+        op.create_table('parking_slot',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('lot_id', sa.Integer(), nullable=False),
+            sa.Column('slot_number', sa.String(length=20), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.ForeignKeyConstraint(['lot_id'], ['parking_lot.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('lot_id', 'slot_number', name='_lot_slot_uc')
+        )
+    if 'reservation' not in existing:
+        op.create_table('reservation',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('slot_id', sa.Integer(), nullable=False),
+            sa.Column('vehicle_number', sa.String(length=20), nullable=False),
+            sa.Column('start_time', sa.DateTime(), nullable=False),
+            sa.Column('end_time', sa.DateTime(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('cost', sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(['slot_id'], ['parking_slot.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('reservation')
+    op.drop_table('parking_slot')
+    op.drop_table('parking_lot')
+    op.drop_table('user')
@@ -0,0 +1,40 @@
+"""lot occupancy counters
+
+Revision ID: 0002_lot_occupancy
+Revises: 0001_baseline
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_lot_occupancy'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'lot_occupancy' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    # Rows are filled in by LotOccupancy.rebuild() (run on startup and by the
+    # admin dashboard when a lot has no counters yet).
+    op.create_table('lot_occupancy',
+        sa.Column('lot_id', sa.Integer(), nullable=False),
+        sa.Column('slots_available', sa.Integer(), nullable=False),
+        sa.Column('slots_booked', sa.Integer(), nullable=False),
+        sa.Column('slots_occupied', sa.Integer(), nullable=False),
+        sa.Column('slots_maintenance', sa.Integer(), nullable=False),
+        sa.Column('reservations_active', sa.Integer(), nullable=False),
+        sa.Column('reservations_completed', sa.Integer(), nullable=False),
+        sa.Column('reservations_paid', sa.Integer(), nullable=False),
+        sa.Column('reservations_cancelled', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['lot_id'], ['parking_lot.id'], ),
+        sa.PrimaryKeyConstraint('lot_id')
+    )
+
+
+def downgrade():
+    op.drop_table('lot_occupancy')
@@ -0,0 +1,53 @@
+"""indexes for hot query predicates
+
+Revision ID: 0003_hot_path_indexes
+Revises: 0002_lot_occupancy
+Create Date: 2026-10-17 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_hot_path_indexes'
+down_revision = '0002_lot_occupancy'
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.text("status = 'active'")
+
+INDEXES = [
+    ('reservation', 'ix_reservation_status', ['status'], {}),
+    ('reservation', 'ix_reservation_slot_status', ['slot_id', 'status'], {}),
+    ('reservation', 'ix_reservation_user_start', ['user_id', 'start_time'], {}),
+    ('reservation', 'ix_reservation_start_id', ['start_time', 'id'], {}),
+    ('parking_slot', 'ix_parking_slot_lot_status', ['lot_id', 'status'], {}),
+    ('reservation', 'uq_reservation_active_slot', ['slot_id'],
+     dict(unique=True, sqlite_where=ACTIVE, postgresql_where=ACTIVE)),
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    duplicates = bind.execute(sa.text(
+        "SELECT slot_id FROM reservation WHERE status = 'active' "
+        "GROUP BY slot_id HAVING COUNT(*) > 1"
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            'Cannot enforce one active reservation per slot: slots %s have '
+            'several. Release or cancel the extra reservations and re-run '
+            'the upgrade.' % ', '.join(map(str, duplicates))
+        )
+
+    for table, name, columns, kwargs in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, **kwargs)
+
+
+def downgrade():
+    for table, name, columns, kwargs in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,54 @@
+"""analytics rollups and reservation change tracking
+
+Revision ID: 0004_analytics_rollups
+Revises: 0003_hot_path_indexes
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_analytics_rollups'
+down_revision = '0003_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_reservation_updated_at', ['updated_at'], unique=False)
+    op.execute('UPDATE reservation SET updated_at = start_time WHERE updated_at IS NULL')
+
+    op.create_table('lot_hourly_occupancy',
+        sa.Column('lot_id', sa.Integer(), nullable=False),
+        sa.Column('hour', sa.DateTime(), nullable=False),
+        sa.Column('peak_occupancy', sa.Integer(), nullable=False),
+        sa.Column('occupied_hours', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['lot_id'], ['parking_lot.id'], ),
+        sa.PrimaryKeyConstraint('lot_id', 'hour')
+    )
+    op.create_table('lot_daily_revenue',
+        sa.Column('lot_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.Column('reservations', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['lot_id'], ['parking_lot.id'], ),
+        sa.PrimaryKeyConstraint('lot_id', 'day')
+    )
+    op.create_table('analytics_watermark',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('analytics_watermark')
+    op.drop_table('lot_daily_revenue')
+    op.drop_table('lot_hourly_occupancy')
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.drop_index('ix_reservation_updated_at')
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,26 @@
+"""per-lot version counter for availability ETags
+
+Revision ID: 0005_lot_version
+Revises: 0004_analytics_rollups
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_lot_version'
+down_revision = '0004_analytics_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('lot_occupancy', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('lot_occupancy', schema=None) as batch_op:
+        batch_op.drop_column('version')
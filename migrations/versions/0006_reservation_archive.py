@@ -0,0 +1,44 @@
+"""reservation archive table
+
+Revision ID: 0006_reservation_archive
+Revises: 0005_lot_version
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_reservation_archive'
+down_revision = '0005_lot_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reservation_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('slot_id', sa.Integer(), nullable=False),
+        sa.Column('lot_id', sa.Integer(), nullable=True),
+        sa.Column('slot_number', sa.String(length=20), nullable=True),
+        sa.Column('vehicle_number', sa.String(length=20), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('cost', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('reservation_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_reservation_archive_lot_start', ['lot_id', 'start_time'], unique=False)
+        batch_op.create_index('ix_reservation_archive_start_id', ['start_time', 'id'], unique=False)
+        batch_op.create_index('ix_reservation_archive_updated_at', ['updated_at'], unique=False)
+        batch_op.create_index('ix_reservation_archive_user_start', ['user_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_table('reservation_archive')
@@ -0,0 +1,32 @@
+"""per-user lifetime reservation totals
+
+Revision ID: 0007_user_summary
+Revises: 0006_reservation_archive
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_user_summary'
+down_revision = '0006_reservation_archive'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are created lazily from reservation history on first dashboard visit
+    op.create_table('user_summary',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('reservations', sa.Integer(), nullable=False),
+        sa.Column('hours', sa.Float(), nullable=False),
+        sa.Column('spend', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_summary')
@@ -0,0 +1,37 @@
+"""lot shard and non-reused slot/reservation ids for sharding
+
+Revision ID: 0009_shards
+Revises: 0008_lot_coordinates
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_shards'
+down_revision = '0008_lot_coordinates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('parking_lot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shard', sa.Integer(), nullable=False, server_default='0'))
+
+    # AUTOINCREMENT keeps ids above the sqlite_sequence floor each shard is given
+    for table in ('parking_slot', 'reservation'):
+        with op.batch_alter_table(table, schema=None, recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': True}):
+            pass
+
+
+def downgrade():
+    for table in ('reservation', 'parking_slot'):
+        with op.batch_alter_table(table, schema=None, recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': False}):
+            pass
+
+    with op.batch_alter_table('parking_lot', schema=None) as batch_op:
+        batch_op.drop_column('shard')
@@ -0,0 +1,49 @@
+"""normalised, indexed vehicle numbers
+
+Revision ID: 0010_vehicle_plates
+Revises: 0009_shards
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_vehicle_plates'
+down_revision = '0009_shards'
+branch_labels = None
+depends_on = None
+
+TABLES = {
+    'reservation': 'ix_reservation_vehicle_start',
+    'reservation_archive': 'ix_reservation_archive_vehicle_start',
+}
+
+
+def _normalise(vehicle_number):
+    # Same rule as models.reservation.normalize_plate, frozen here
+    return ''.join(char for char in vehicle_number.upper() if char.isalnum()) or vehicle_number
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table, index in TABLES.items():
+        rows = sa.table(table, sa.column('id', sa.Integer), sa.column('vehicle_number', sa.String))
+        changed = [
+            {'row_id': row_id, 'plate': _normalise(vehicle_number)}
+            for row_id, vehicle_number in bind.execute(sa.select(rows.c.id, rows.c.vehicle_number))
+            if _normalise(vehicle_number) != vehicle_number
+        ]
+        if changed:
+            bind.execute(
+                rows.update().where(rows.c.id == sa.bindparam('row_id')).values(vehicle_number=sa.bindparam('plate')),
+                changed,
+            )
+        op.create_index(index, table, ['vehicle_number', 'start_time'], unique=False)
+
+
+def downgrade():
+    # Plates stay normalised; only the indexes go
+    for table, index in TABLES.items():
+        op.drop_index(index, table_name=table)
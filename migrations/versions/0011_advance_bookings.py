@@ -0,0 +1,65 @@
+"""advance bookings: nullable end_time and a scheduled reservation counter
+
+Revision ID: 0011_advance_bookings
+Revises: 0010_vehicle_plates
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_advance_bookings'
+down_revision = '0010_vehicle_plates'
+branch_labels = None
+depends_on = None
+
+# What booking used to write as end_time until a stay was released
+PLACEHOLDER_END = timedelta(days=365 * 100)
+# Open and cancelled stays only ever carried the placeholder
+OPEN_STATUSES = ('active', 'cancelled')
+
+
+def _end_times(table):
+    return sa.table(table, sa.column('id', sa.Integer), sa.column('status', sa.String),
+                    sa.column('start_time', sa.DateTime), sa.column('end_time', sa.DateTime))
+
+
+def upgrade():
+    # reservation keeps AUTOINCREMENT when it is recreated
+    with op.batch_alter_table('reservation', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=True)
+    with op.batch_alter_table('reservation_archive', schema=None) as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=True)
+
+    for table in ('reservation', 'reservation_archive'):
+        rows = _end_times(table)
+        op.execute(rows.update().where(rows.c.status.in_(OPEN_STATUSES)).values(end_time=None))
+
+    with op.batch_alter_table('lot_occupancy', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reservations_scheduled', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    # Advance bookings become cancelled reservations; open ends get the placeholder back
+    bind = op.get_bind()
+    for table in ('reservation', 'reservation_archive'):
+        rows = _end_times(table)
+        bind.execute(rows.update().where(rows.c.status == 'scheduled').values(status='cancelled'))
+        placeholders = [
+            {'row_id': row_id, 'end': start_time + PLACEHOLDER_END}
+            for row_id, start_time in bind.execute(sa.select(rows.c.id, rows.c.start_time).where(rows.c.end_time.is_(None)))
+        ]
+        if placeholders:
+            bind.execute(rows.update().where(rows.c.id == sa.bindparam('row_id')).values(end_time=sa.bindparam('end')),
+                         placeholders)
+
+    with op.batch_alter_table('lot_occupancy', schema=None) as batch_op:
+        batch_op.drop_column('reservations_scheduled')
+    with op.batch_alter_table('reservation_archive', schema=None) as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+    with op.batch_alter_table('reservation', schema=None, table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
@@ -0,0 +1,30 @@
+"""non-reused lot ids
+
+Revision ID: 0012_lot_ids
+Revises: 0011_advance_bookings
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012_lot_ids'
+down_revision = '0011_advance_bookings'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Archived reservations keep their lot_id; AUTOINCREMENT stops a new lot
+    # from taking a deleted lot's id, and its history with it
+    with op.batch_alter_table('parking_lot', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}):
+        pass
+
+
+def downgrade():
+    with op.batch_alter_table('parking_lot', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}):
+        pass
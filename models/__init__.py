@@ -1,3 +1,52 @@
+import os
+from functools import partial
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+from models.shards import ShardedSession, session_scope, remove_shard_sessions
+
+db = SQLAlchemy(session_options={'class_': ShardedSession, 'scopefunc': session_scope})
+
+
+def _set_sqlite_pragmas(config, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+    cursor.close()
+
+
+def _forget_pools(engines):
+    # Connections opened before fork() belong to the parent; dispose(close=False)
+    # drops them from the child's pools without closing the parent's sockets
+    for engine in engines:
+        engine.dispose(close=False)
+
+
+def init_db(app):
+    """Bind ``db`` to the app and apply per-connection SQLite pragmas."""
+    db.init_app(app)
+    app.teardown_appcontext(remove_shard_sessions)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', partial(_set_sqlite_pragmas, app.config))
+    # Workers forked from a preloaded app (gunicorn --preload) open their own
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=partial(_forget_pools, engines))
+
+
+def init_migrations(app):
+    """Register Flask-Migrate for `flask db` and bootstrap.
 
-db = SQLAlchemy()
\ No newline at end of file
+    Imported here rather than at module level: alembic takes about as long
+    to import as Flask itself and serving requests never needs it.
+    """
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        # Next to the code, not the working directory, so bootstrap runs from anywhere
+        directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+        Migrate(app, db, directory=directory, render_as_batch=True)
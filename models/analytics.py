@@ -0,0 +1,32 @@
+from models import db
+
+
+class LotHourlyOccupancy(db.Model):
+    """Peak concurrent reservations and occupied slot-hours per lot-hour."""
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)  # start of the UTC hour
+    peak_occupancy = db.Column(db.Integer, nullable=False, default=0)
+    occupied_hours = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<LotHourlyOccupancy lot:{self.lot_id} {self.hour}>'
+
+
+class LotDailyRevenue(db.Model):
+    """Billed revenue per lot-day, attributed to the day a stay ended."""
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<LotDailyRevenue lot:{self.lot_id} {self.day}>'
+
+
+class AnalyticsWatermark(db.Model):
+    """How far the rollups have processed a source table's change stream."""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<AnalyticsWatermark {self.name}={self.value}>'
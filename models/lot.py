@@ -8,6 +8,13 @@ class ParkingLot(db.Model):
     address = db.Column(db.String(255), nullable=True)
     pin_code = db.Column(db.String(20), nullable=True)
     maximum_number_of_spots = db.Column(db.Integer, nullable=True)
+    # WGS84 degrees; lots without coordinates are left out of nearest-lot search
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    # Database holding the lot's slots and reservations (models/shards.py)
+    shard = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Ids are never reused: archived reservations and cached shards still refer to deleted lots
+    __table_args__ = {'sqlite_autoincrement': True}
 
     slots = db.relationship('ParkingSlot', backref='lot', lazy=True, cascade="all, delete-orphan")
 
@@ -0,0 +1,208 @@
+import hashlib
+
+from models import db
+
+SLOT_STATUSES = ('available', 'booked', 'occupied', 'maintenance')
+RESERVATION_STATUSES = ('scheduled', 'active', 'completed', 'paid', 'cancelled')
+COUNTER_COLUMNS = tuple(f'slots_{status}' for status in SLOT_STATUSES) + \
+    tuple(f'reservations_{status}' for status in RESERVATION_STATUSES)
+# session.info key: {lot_id: [version before, version after]} of the lots
+# the session's transaction has changed, for in-memory indexes to catch up
+VERSION_CHANGES_KEY = 'lot_version_changes'
+
+
+def slot_deltas(old_status, new_status, count=1, deltas=None):
+    """Add ``count`` slots moving between statuses to a ``{column: delta}`` dict."""
+    return _deltas('slots', SLOT_STATUSES, old_status, new_status, count, deltas)
+
+
+def reservation_deltas(old_status, new_status, count=1, deltas=None):
+    """Add ``count`` reservations moving between statuses to a ``{column: delta}`` dict."""
+    return _deltas('reservations', RESERVATION_STATUSES, old_status, new_status, count, deltas)
+
+
+def _note_versions(versions):
+    moved = db.session.info.setdefault(VERSION_CHANGES_KEY, {})
+    for lot_id, version in versions.items():
+        moved.setdefault(lot_id, [version - 1, version])[1] = version
+
+
+def _deltas(prefix, statuses, old_status, new_status, count, deltas):
+    deltas = {} if deltas is None else deltas
+    if old_status in statuses:
+        deltas[f'{prefix}_{old_status}'] = deltas.get(f'{prefix}_{old_status}', 0) - count
+    if new_status in statuses:
+        deltas[f'{prefix}_{new_status}'] = deltas.get(f'{prefix}_{new_status}', 0) + count
+    return deltas
+
+
+class LotOccupancy(db.Model):
+    """Per-lot slot and reservation counters.
+
+    Kept up to date by the routes that change a slot or reservation status so
+    the admin dashboard can be served without counting rows.
+    """
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), primary_key=True)
+    slots_available = db.Column(db.Integer, nullable=False, default=0)
+    slots_booked = db.Column(db.Integer, nullable=False, default=0)
+    slots_occupied = db.Column(db.Integer, nullable=False, default=0)
+    slots_maintenance = db.Column(db.Integer, nullable=False, default=0)
+    reservations_scheduled = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reservations_active = db.Column(db.Integer, nullable=False, default=0)
+    reservations_completed = db.Column(db.Integer, nullable=False, default=0)
+    reservations_paid = db.Column(db.Integer, nullable=False, default=0)
+    reservations_cancelled = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped on every change to the lot's slots or reservations; clients use
+    # it as an ETag and other processes to detect stale in-memory state.
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    lot = db.relationship('ParkingLot', backref=db.backref('occupancy', uselist=False, cascade="all, delete-orphan"))
+
+    @property
+    def total_slots(self):
+        return sum(getattr(self, f'slots_{status}') for status in SLOT_STATUSES)
+
+    @property
+    def total_reservations(self):
+        return sum(getattr(self, f'reservations_{status}') for status in RESERVATION_STATUSES)
+
+    @classmethod
+    def _apply(cls, lot_id, deltas):
+        values = {column: getattr(cls, column) + delta for column, delta in deltas.items() if delta}
+        values['version'] = cls.version + 1
+        version = db.session.execute(db.update(cls).where(cls.lot_id == lot_id).values(values)
+                                     .returning(cls.version)).scalar()
+        if version is not None:
+            _note_versions({lot_id: version})
+
+    @classmethod
+    def apply_many(cls, changes):
+        """Apply ``{lot_id: {column: delta}}`` to many lots in one executemany UPDATE."""
+        if not changes:
+            return
+        table = cls.__table__
+        db.session.execute(
+            table.update().where(table.c.lot_id == db.bindparam('lot')).values(
+                {column: table.c[column] + db.bindparam(f'delta_{column}') for column in COUNTER_COLUMNS}
+            ).values(version=table.c.version + 1),
+            [{'lot': lot_id, **{f'delta_{column}': deltas.get(column, 0) for column in COUNTER_COLUMNS}}
+             for lot_id, deltas in changes.items()],
+        )
+        # No RETURNING for an executemany UPDATE; one lookup of the new versions
+        _note_versions(dict(db.session.query(cls.lot_id, cls.version).filter(cls.lot_id.in_(list(changes)))))
+
+    @classmethod
+    def touch(cls, lot_id):
+        """Bump the lot's version without changing any counter."""
+        cls._apply(lot_id, {})
+
+    @classmethod
+    def for_lots(cls):
+        """Return (lot, occupancy) for every lot, rebuilding missing counters.
+
+        One query per shard, joining the shard's copy of its lots to their counters.
+        """
+        from models.lot import ParkingLot
+        from models.shards import gather, in_current_shard
+
+        def lots_with_counters(outer):
+            query = db.session.query(ParkingLot, cls)
+            query = query.outerjoin(cls, cls.lot_id == ParkingLot.id) if outer else query.join(cls, cls.lot_id == ParkingLot.id)
+            return query.filter(in_current_shard(ParkingLot.shard)).order_by(ParkingLot.id).all()
+
+        rows = gather(lambda: lots_with_counters(outer=True), key=lambda row: row[0].id)
+        if any(occupancy is None for _, occupancy in rows):
+            cls.rebuild()
+            rows = gather(lambda: lots_with_counters(outer=False), key=lambda row: row[0].id)
+        return rows
+
+    @classmethod
+    def versions(cls, lot_ids=None):
+        """Map lot_id -> version, straight from the counter table(s)."""
+        from models.shards import each_shard, each_lot_shard
+
+        def read(ids=None):
+            query = db.session.query(cls.lot_id, cls.version)
+            if ids is not None:
+                query = query.filter(cls.lot_id.in_(ids))
+            return dict(query)
+
+        versions = {}
+        for part in each_shard(read) if lot_ids is None else each_lot_shard(lot_ids, read):
+            versions.update(part)
+        return versions
+
+    @classmethod
+    def missing(cls):
+        """True if some lot has no counter row."""
+        from models.lot import ParkingLot
+        from models.shards import each_shard, in_current_shard
+
+        return any(each_shard(lambda: db.session.query(ParkingLot.id).outerjoin(
+            cls, cls.lot_id == ParkingLot.id
+        ).filter(cls.lot_id.is_(None), in_current_shard(ParkingLot.shard)).first() is not None))
+
+    @classmethod
+    def fingerprint(cls, versions=None):
+        """Short hash of every lot's version; changes whenever any lot's data does."""
+        versions = cls.versions() if versions is None else versions
+        joined = ','.join(f'{lot_id}:{versions[lot_id]}' for lot_id in sorted(versions))
+        return hashlib.sha1(joined.encode()).hexdigest()[:20]
+
+    @classmethod
+    def slot_changed(cls, lot_id, old_status, new_status, count=1):
+        """Move ``count`` slots between status buckets. None means added/deleted."""
+        cls._apply(lot_id, slot_deltas(old_status, new_status, count))
+
+    @classmethod
+    def reservation_changed(cls, lot_id, old_status, new_status, count=1):
+        """Move ``count`` reservations between status buckets. None means added/deleted."""
+        cls._apply(lot_id, reservation_deltas(old_status, new_status, count))
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every lot's counters from the slot and reservation tables, shard by shard."""
+        from models.shards import each_shard
+        each_shard(cls._rebuild_shard)
+
+    @classmethod
+    def _rebuild_shard(cls):
+        from models.lot import ParkingLot
+        from models.slot import ParkingSlot
+        from models.reservation import Reservation
+        from models.reservation_archive import ReservationArchive
+        from models.shards import in_current_shard
+
+        counters = {lot_id: {} for (lot_id,) in db.session.query(ParkingLot.id).filter(in_current_shard(ParkingLot.shard))}
+
+        slot_counts = db.session.query(
+            ParkingSlot.lot_id, ParkingSlot.status, db.func.count(ParkingSlot.id)
+        ).group_by(ParkingSlot.lot_id, ParkingSlot.status)
+        for lot_id, status, count in slot_counts:
+            if lot_id in counters and (status or 'available') in SLOT_STATUSES:
+                key = f'slots_{status or "available"}'
+                counters[lot_id][key] = counters[lot_id].get(key, 0) + count
+
+        reservation_counts = db.session.query(
+            ParkingSlot.lot_id, Reservation.status, db.func.count(Reservation.id)
+        ).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id).group_by(ParkingSlot.lot_id, Reservation.status).all()
+        # Archived reservations still count towards their lot's totals
+        reservation_counts += db.session.query(
+            ReservationArchive.lot_id, ReservationArchive.status, db.func.count(ReservationArchive.id)
+        ).group_by(ReservationArchive.lot_id, ReservationArchive.status).all()
+        for lot_id, status, count in reservation_counts:
+            if lot_id in counters and (status or 'active') in RESERVATION_STATUSES:
+                key = f'reservations_{status or "active"}'
+                counters[lot_id][key] = counters[lot_id].get(key, 0) + count
+
+        # Keep versions moving forward so cached ETags never match new counts
+        versions = dict(db.session.query(cls.lot_id, cls.version))
+        db.session.query(cls).delete()
+        db.session.add_all(
+            cls(lot_id=lot_id, version=versions.get(lot_id, 0) + 1, **counts)
+            for lot_id, counts in counters.items()
+        )
+        db.session.commit()
+
+    def __repr__(self):
+        return f'<LotOccupancy lot:{self.lot_id}>'
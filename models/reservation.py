@@ -1,5 +1,20 @@
 from models import db
 from datetime import datetime
+from sqlalchemy.orm import validates
+
+# Reservations that hold their slot: stays in progress and advance bookings
+# that have not started yet (or were never checked in)
+HOLDING_STATUSES = ('active', 'scheduled')
+
+
+def normalize_plate(vehicle_number):
+    """Canonical form of a number plate: upper case letters and digits only.
+
+    "MH 12 ab-1234" and "MH12AB1234" are the same vehicle. Plates are stored
+    this way so lookups and the duplicate-booking check can use an index.
+    """
+    return ''.join(char for char in vehicle_number.upper() if char.isalnum())
+
 
 class Reservation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -7,9 +22,32 @@ class Reservation(db.Model):
     slot_id = db.Column(db.Integer, db.ForeignKey('parking_slot.id'), nullable=False)
     vehicle_number = db.Column(db.String(20), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    end_time = db.Column(db.DateTime, nullable=False)
+    # The booked end for advance bookings, the actual end once released;
+    # None while a walk-in stay is open
+    end_time = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='active')
     cost = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_reservation_status', 'status'),
+        db.Index('ix_reservation_slot_status', 'slot_id', 'status'),
+        db.Index('ix_reservation_user_start', 'user_id', 'start_time'),
+        db.Index('ix_reservation_start_id', 'start_time', 'id'),
+        db.Index('ix_reservation_updated_at', 'updated_at'),
+        # Where a vehicle is parked and its history (vehicle lookup, book_slot)
+        db.Index('ix_reservation_vehicle_start', 'vehicle_number', 'start_time'),
+        # At most one active reservation per slot, enforced by the database
+        db.Index('uq_reservation_active_slot', 'slot_id', unique=True,
+                 sqlite_where=db.text("status = 'active'"),
+                 postgresql_where=db.text("status = 'active'")),
+        # Ids are never reused, and each shard hands them out from its own range
+        {'sqlite_autoincrement': True},
+    )
+
+    @validates('vehicle_number')
+    def _normalize_vehicle_number(self, key, vehicle_number):
+        return normalize_plate(vehicle_number)
 
     def __repr__(self):
         return f'<Reservation {self.id} User:{self.user_id} Slot:{self.slot_id}>'
\ No newline at end of file
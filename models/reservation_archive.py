@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from models import db
+
+
+class ReservationArchive(db.Model):
+    """Paid and cancelled reservations moved out of ``reservation`` by age
+    or because their slot was deleted.
+
+    Rows keep their original id. ``lot_id`` and ``slot_number`` are copied at
+    archive time so history still reads correctly after a slot is deleted;
+    ``slot_id`` and ``lot_id`` are plain columns, not foreign keys, for the
+    same reason.
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    slot_id = db.Column(db.Integer, nullable=False)
+    lot_id = db.Column(db.Integer, nullable=True)
+    slot_number = db.Column(db.String(20), nullable=True)
+    vehicle_number = db.Column(db.String(20), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    cost = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_reservation_archive_user_start', 'user_id', 'start_time'),
+        db.Index('ix_reservation_archive_start_id', 'start_time', 'id'),
+        db.Index('ix_reservation_archive_lot_start', 'lot_id', 'start_time'),
+        db.Index('ix_reservation_archive_updated_at', 'updated_at'),
+        db.Index('ix_reservation_archive_vehicle_start', 'vehicle_number', 'start_time'),
+    )
+
+    user = db.relationship('User')
+    # Same attribute names as Reservation so templates can show either
+    slot = db.relationship('ParkingSlot', primaryjoin='foreign(ReservationArchive.slot_id) == ParkingSlot.id',
+                           viewonly=True)
+
+    def __repr__(self):
+        return f'<ReservationArchive {self.id} User:{self.user_id} Slot:{self.slot_id}>'
@@ -0,0 +1,355 @@
+"""Optional sharding of slots and reservations over several SQLite files.
+
+SQLite lets one transaction write at a time, so with one file every booking
+in every lot queues behind the others. With SHARD_COUNT > 1 each lot is
+placed on a shard (``ParkingLot.shard``) and its slots, reservations,
+archive, counters and rollups live in that shard's database: shard 0 is the
+main database, shards 1..N-1 are the SHARD_DATABASE_URL files. Users and
+lots stay in the main database (the catalogue) and are copied into the
+other shards after every commit that changes them, so queries inside a
+shard can still join to them.
+
+``db.session`` talks to one database at a time: the catalogue by default,
+or a shard inside ``use_shard()`` / a ``sharded_by()`` view. Slot and
+reservation ids carry their shard in the high bits (``row_shard``), so
+routes taking only an id find the right database. With SHARD_COUNT = 1
+(the default) every helper here runs its callback once on the single
+database and nothing changes.
+"""
+import contextvars
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session, _app_ctx_id
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.util import find_tables
+
+import models
+from config import shard_bind_key
+
+# Tables whose rows belong to one lot's shard
+SHARDED_TABLES = frozenset({
+    'parking_slot', 'reservation', 'reservation_archive', 'lot_occupancy',
+    'lot_hourly_occupancy', 'lot_daily_revenue', 'user_summary', 'analytics_watermark',
+})
+# Copied from the catalogue into every other shard
+REPLICATED_TABLES = ('user', 'parking_lot')
+# Ids in shard k's slot and reservation tables start above k << SHARD_ID_BITS
+SHARD_ID_BITS = 40
+ID_RANGE_TABLES = ('parking_slot', 'reservation')
+
+logger = logging.getLogger('parking.shards')
+
+_current_shard = contextvars.ContextVar('current_shard', default=None)
+# lot_id -> shard. Lots never move and their ids are never reused (AUTOINCREMENT),
+# so an entry stays right in every process; one for a lot another process
+# deleted only leads to empty lookups in its old shard
+_lot_shards = {}
+_REPLICA_KEY = 'shard_replica_changes'
+
+
+class ShardingError(RuntimeError):
+    """Raised when sharded tables are queried without choosing a shard."""
+
+
+class ShardedSession(Session):
+    """``db.session`` class; each session is tied to the shard current when it was made.
+
+    A shard session binds every table to that shard's engine. The catalogue
+    session refuses sharded tables when there is more than one shard, so a
+    query that forgot to pick a shard fails instead of seeing only shard 0.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self.shard = _current_shard.get()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.shard is not None:
+            return self._db.engines[shard_bind_key(self.shard)]
+        if bind is None and is_sharded():
+            tables = set(find_tables(clause, include_crud=True)) if clause is not None else set()
+            if mapper is not None:
+                tables.add(inspect(mapper).local_table)
+            sharded = sorted({table.name for table in tables} & SHARDED_TABLES)
+            if sharded:
+                raise ShardingError(f'{", ".join(sharded)} is sharded; query it inside use_shard().')
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def session_scope():
+    # One session per app context and shard
+    return _app_ctx_id(), _current_shard.get()
+
+
+def remove_shard_sessions(exc=None):
+    """Close the ending app context's shard sessions (Flask-SQLAlchemy removes the catalogue's)."""
+    registry = models.db.session.registry.registry
+    app_ctx = _app_ctx_id()
+    for key in [key for key in list(registry) if key[0] == app_ctx and key[1] is not None]:
+        session = registry.pop(key, None)
+        if session is not None:
+            session.close()
+
+
+# --- Choosing a shard ---
+
+def shard_count():
+    return current_app.config['SHARD_COUNT']
+
+
+def is_sharded():
+    return current_app.config['SHARD_COUNT'] > 1
+
+
+def current_shard():
+    """Shard ``db.session`` currently talks to; None for the catalogue."""
+    return _current_shard.get()
+
+
+def shard_ids():
+    """Every shard, or ``[None]`` (just the one database) when not sharded."""
+    return list(range(shard_count())) if is_sharded() else [None]
+
+
+@contextmanager
+def use_shard(shard):
+    """Point ``db.session`` at ``shard`` (None: the catalogue) for the block."""
+    token = _current_shard.set(shard if is_sharded() else None)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def lot_shard(lot_id):
+    """Shard holding a lot's slots and reservations; None when not sharded.
+
+    Unknown lots map to shard 0, where lookups of their rows come back empty,
+    and are not cached, so a lot another process creates is found once it
+    is committed.
+    """
+    if not is_sharded():
+        return None
+    shard = _lot_shards.get(lot_id)
+    if shard is None:
+        from models.lot import ParkingLot
+        with use_shard(None):
+            shard = models.db.session.execute(
+                models.db.select(ParkingLot.shard).where(ParkingLot.id == lot_id)
+            ).scalar()
+        if shard is None:
+            return 0
+        _lot_shards[lot_id] = shard
+    return shard
+
+
+def lot_shards(lot_ids):
+    """``lot_shard`` for many lots, looking up the uncached ones in one query."""
+    if not is_sharded():
+        return {lot_id: None for lot_id in lot_ids}
+    missing = [lot_id for lot_id in set(lot_ids) if lot_id not in _lot_shards]
+    if missing:
+        from models.lot import ParkingLot
+        with use_shard(None):
+            _lot_shards.update(models.db.session.execute(
+                models.db.select(ParkingLot.id, ParkingLot.shard).where(ParkingLot.id.in_(missing))
+            ).all())
+    return {lot_id: _lot_shards.get(lot_id, 0) for lot_id in lot_ids}
+
+
+def forget_lot(lot_id):
+    _lot_shards.pop(lot_id, None)
+
+
+def row_shard(row_id):
+    """Shard of a slot or reservation id; None when not sharded."""
+    if not is_sharded():
+        return None
+    shard = row_id >> SHARD_ID_BITS
+    return shard if shard < shard_count() else 0
+
+
+def in_current_shard(column):
+    """Filter on ``ParkingLot.shard`` keeping the lots of the current shard."""
+    shard = current_shard()
+    return column == shard if shard is not None else models.db.true()
+
+
+def sharded_by(argument, locate):
+    """View decorator running the view in the shard ``locate(kwargs[argument])`` returns.
+
+    e.g. ``@sharded_by('reservation_id', row_shard)`` or ``@sharded_by('lot_id', lot_shard)``.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            with use_shard(locate(kwargs[argument])):
+                return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+# --- Scatter-gather ---
+
+def each_shard(fn, lot_id=None):
+    """Call ``fn()`` once in every shard (only ``lot_id``'s, if given); returns the results."""
+    results = []
+    for shard in shard_ids() if lot_id is None else [lot_shard(lot_id)]:
+        with use_shard(shard):
+            results.append(fn())
+    return results
+
+
+def gather(fn, key=None, reverse=False, lot_id=None):
+    """Concatenate the lists ``fn()`` returns in each shard, sorted by ``key`` if given."""
+    parts = each_shard(fn, lot_id=lot_id)
+    rows = [row for part in parts for row in part]
+    if key is not None and len(parts) > 1:
+        rows.sort(key=key, reverse=reverse)
+    return rows
+
+
+def each_lot_shard(lot_ids, fn):
+    """Call ``fn(ids)`` in each shard holding some of ``lot_ids``, with that shard's ids."""
+    by_shard = {}
+    for lot_id, shard in lot_shards(lot_ids).items():
+        by_shard.setdefault(shard, []).append(lot_id)
+    results = []
+    for shard, ids in by_shard.items():
+        with use_shard(shard):
+            results.append(fn(ids))
+    return results
+
+
+def drop_lot(lot_id):
+    """Delete a lot from the catalogue and every shard's copy, once its shard's rows are gone.
+
+    Only needed when sharded; without sharding the ORM delete did it all.
+    """
+    if not is_sharded():
+        return
+    table = models.db.metadata.tables['parking_lot']
+    for shard in shard_ids():
+        with models.db.engines[shard_bind_key(shard)].begin() as connection:
+            connection.execute(table.delete().where(table.c.id == lot_id))
+    forget_lot(lot_id)
+
+
+def new_lot_shards(count=1):
+    """Shards for ``count`` new lots, filling the shards with fewest lots first."""
+    if not is_sharded():
+        return [0] * count
+    from models.lot import ParkingLot
+    with use_shard(None):
+        lots = dict(models.db.session.query(ParkingLot.shard, models.db.func.count(ParkingLot.id))
+                    .group_by(ParkingLot.shard))
+    load = {shard: lots.get(shard, 0) for shard in range(shard_count())}
+    shards = []
+    for _ in range(count):
+        shard = min(load, key=lambda s: (load[s], s))
+        load[shard] += 1
+        shards.append(shard)
+    return shards
+
+
+# --- Shard databases ---
+
+def prepare_shards(app):
+    """Migrate shards 1..N-1, give each its id range and copy users and lots in.
+
+    Called by bootstrap inside an app context after the catalogue is migrated.
+    Returns the number of extra shard databases.
+    """
+    from flask_migrate import upgrade
+
+    extra = range(1, app.config['SHARD_COUNT'])
+    for shard in extra:
+        upgrade(x_arg=[f'shard={shard}'])
+        with models.db.engines[shard_bind_key(shard)].begin() as connection:
+            _raise_id_floor(connection, shard << SHARD_ID_BITS)
+    if extra:
+        sync_replicas()
+    return len(extra)
+
+
+def _raise_id_floor(connection, floor):
+    # AUTOINCREMENT tables never hand out ids at or below sqlite_sequence.seq
+    for table in ID_RANGE_TABLES:
+        connection.execute(text('UPDATE sqlite_sequence SET seq = :floor WHERE name = :table AND seq < :floor'),
+                           {'table': table, 'floor': floor})
+        connection.execute(text('INSERT INTO sqlite_sequence (name, seq) SELECT :table, :floor '
+                                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :table)'),
+                           {'table': table, 'floor': floor})
+
+
+def sync_replicas():
+    """Replace every shard's copy of the users and lots with the catalogue's.
+
+    Run after bulk inserts that bypass the session hooks (seeding) or to
+    repair copies after a failed update (`flask --app app sync-shards`).
+    """
+    tables = [models.db.metadata.tables[name] for name in REPLICATED_TABLES]
+    with models.db.engines[None].connect() as source:
+        rows = {table.name: [dict(row._mapping) for row in source.execute(table.select())] for table in tables}
+    for shard in range(1, shard_count()):
+        with models.db.engines[shard_bind_key(shard)].begin() as connection:
+            for table in tables:
+                connection.execute(table.delete())
+                if rows[table.name]:
+                    connection.execute(table.insert(), rows[table.name])
+    return {name: len(table_rows) for name, table_rows in rows.items()}
+
+
+def _write_replicas(shard, changes):
+    from sqlalchemy.dialects.sqlite import insert
+
+    with models.db.engines[shard_bind_key(shard)].begin() as connection:
+        for name, rows in changes.items():
+            table = models.db.metadata.tables[name]
+            deleted = [row_id for row_id, row in rows.items() if row is None]
+            if deleted:
+                connection.execute(table.delete().where(table.c.id.in_(deleted)))
+            upserts = [row for row in rows.values() if row is not None]
+            if upserts:
+                stmt = insert(table)
+                connection.execute(stmt.on_conflict_do_update(
+                    index_elements=[table.c.id],
+                    set_={column.name: stmt.excluded[column.name] for column in table.columns if column.name != 'id'}
+                ), upserts)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_replica_changes(session, flush_context):
+    if getattr(session, 'shard', 0) is not None or not has_app_context() or not is_sharded():
+        return
+    for objects, deleted in ((session.new, False), (session.dirty, False), (session.deleted, True)):
+        for obj in objects:
+            table = getattr(obj, '__table__', None)
+            if table is None or table.name not in REPLICATED_TABLES:
+                continue
+            row = None if deleted else {column.name: getattr(obj, column.key) for column in table.columns}
+            session.info.setdefault(_REPLICA_KEY, {}).setdefault(table.name, {})[obj.id] = row
+
+
+@event.listens_for(Session, 'after_commit')
+def _push_replica_changes(session):
+    changes = session.info.pop(_REPLICA_KEY, None)
+    if not changes:
+        return
+    for shard in range(1, shard_count()):
+        try:
+            _write_replicas(shard, changes)
+        except SQLAlchemyError:
+            # The catalogue has committed; stale copies only affect names and
+            # prices shown from that shard until the next sync
+            logger.exception('Could not update the user/lot copies in shard %s; '
+                             'run `flask --app app sync-shards`.', shard)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_replica_changes(session):
+    session.info.pop(_REPLICA_KEY, None)
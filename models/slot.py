@@ -5,9 +5,14 @@ class ParkingSlot(db.Model):
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
     slot_number = db.Column(db.String(20), nullable=False)
     status = db.Column(db.String(20), default='available')
-    __table_args__ = (db.UniqueConstraint('lot_id', 'slot_number', name='_lot_slot_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('lot_id', 'slot_number', name='_lot_slot_uc'),
+        db.Index('ix_parking_slot_lot_status', 'lot_id', 'status'),
+        # Ids are never reused, and each shard hands them out from its own range
+        {'sqlite_autoincrement': True},
+    )
 
     reservations = db.relationship('Reservation', backref='slot', lazy=True)
 
     def __repr__(self):
-        return f'<ParkingSlot {self.lot.name}-{self.slot_number}>'
\ No newline at end of file
+        return f'<ParkingSlot lot:{self.lot_id}-{self.slot_number}>'
\ No newline at end of file
@@ -0,0 +1,102 @@
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+
+# Statuses of reservations whose stay has ended (and so count towards hours)
+FINISHED_STATUSES = ('completed', 'paid')
+
+class UserSummary(db.Model):
+    """Lifetime parking totals per user.
+
+    Updated by ``release_slot`` and ``pay`` so the user dashboard never has
+    to aggregate a user's whole reservation history. Both apply their change
+    only after ``move_reservation`` has moved the status, so a stay released
+    or paid twice at once is counted once. Missing rows are rebuilt
+    from the live and archived reservations on first read. When sharded,
+    each shard keeps the totals of the stays in its lots.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    hours = db.Column(db.Float, nullable=False, default=0.0)
+    spend = db.Column(db.Float, nullable=False, default=0.0)
+
+    @classmethod
+    def _apply(cls, user_id, **deltas):
+        values = {column: getattr(cls, column) + delta for column, delta in deltas.items() if delta}
+        if values:
+            db.session.execute(db.update(cls).where(cls.user_id == user_id).values(values))
+
+    @classmethod
+    def stay_finished(cls, user_id, start_time, end_time):
+        """Count one finished stay of ``start_time``..``end_time``."""
+        cls._apply(user_id, reservations=1, hours=(end_time - start_time).total_seconds() / 3600.0)
+
+    @classmethod
+    def stays_finished(cls, totals):
+        """Count many finished stays at once from ``{user_id: (stays, hours)}``, in one executemany UPDATE."""
+        if not totals:
+            return
+        table = cls.__table__
+        db.session.execute(
+            table.update().where(table.c.user_id == db.bindparam('user')).values(
+                reservations=table.c.reservations + db.bindparam('stays'),
+                hours=table.c.hours + db.bindparam('stay_hours'),
+            ),
+            [{'user': user_id, 'stays': stays, 'stay_hours': hours} for user_id, (stays, hours) in totals.items()],
+        )
+
+    @classmethod
+    def paid(cls, user_id, cost):
+        cls._apply(user_id, spend=cost or 0.0)
+
+    @classmethod
+    def for_user(cls, user_id):
+        """Return the user's summary, rebuilding it if it does not exist yet.
+
+        With several shards the result is a new, unsaved row adding up theirs.
+        """
+        from models.shards import each_shard
+
+        parts = each_shard(lambda: db.session.get(cls, user_id) or cls.rebuild(user_id))
+        if len(parts) == 1:
+            return parts[0]
+        return cls(user_id=user_id, reservations=sum(part.reservations for part in parts),
+                   hours=sum(part.hours for part in parts), spend=sum(part.spend for part in parts))
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recompute one user's totals from the reservation and archive tables."""
+        from models.reservation import Reservation
+        from models.reservation_archive import ReservationArchive
+
+        summary = cls(user_id=user_id, reservations=0, hours=0.0, spend=0.0)
+        for model in (Reservation, ReservationArchive):
+            rows = db.session.query(model.start_time, model.end_time, model.status, model.cost).filter(
+                model.user_id == user_id, model.status.in_(FINISHED_STATUSES)
+            )
+            for start_time, end_time, status, cost in rows:
+                summary.reservations += 1
+                summary.hours += (end_time - start_time).total_seconds() / 3600.0
+                if status == 'paid':
+                    summary.spend += cost or 0.0
+        db.session.add(summary)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request rebuilt it first; its totals are just as current
+            db.session.rollback()
+            summary = db.session.get(cls, user_id)
+        return summary
+
+    @classmethod
+    def invalidate(cls):
+        """Drop every summary so each is rebuilt on next read (e.g. after re-billing)."""
+        from models.shards import each_shard
+
+        def delete():
+            db.session.query(cls).delete()
+            db.session.commit()
+        each_shard(delete)
+
+    def __repr__(self):
+        return f'<UserSummary user:{self.user_id}>'
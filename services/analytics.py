@@ -0,0 +1,252 @@
+from datetime import datetime, date, time, timedelta
+from itertools import chain
+
+from models import db
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.reservation_archive import ReservationArchive
+from models.analytics import LotHourlyOccupancy, LotDailyRevenue, AnalyticsWatermark
+from models.shards import each_shard
+
+WATERMARK = 'reservations'
+# Reprocess a little before the watermark so rows committed by transactions
+# that were still open at the last run are not missed.
+SAFETY_LAG = timedelta(minutes=5)
+BILLED_STATUSES = ('completed', 'paid')
+
+
+def _effective_end(status, end_time, updated_at, now):
+    """When a stay stopped occupying its slot, for occupancy purposes."""
+    if status in BILLED_STATUSES:
+        return end_time
+    if status == 'active':
+        return now
+    # Cancelled stays held the slot until they were cancelled; a cancelled
+    # advance booking no later than the end of its window.
+    if end_time is not None and updated_at is not None:
+        return min(end_time, updated_at)
+    return updated_at or end_time
+
+
+def hourly_occupancy(starts, ends, hours):
+    """Interval sweep over stays given as float hours from the range start.
+
+    Returns (peak, occupied) arrays of length ``hours``: the highest number of
+    overlapping stays within each hour and the slot-hours they used.
+    """
+    import numpy as np
+    starts = np.clip(starts, 0, hours)
+    ends = np.clip(ends, 0, hours)
+    keep = starts < ends
+    starts, ends = starts[keep], ends[keep]
+
+    boundaries = np.arange(hours + 1, dtype=float)
+    if not len(starts):
+        return np.zeros(hours, dtype=int), np.zeros(hours)
+
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts), dtype=int), -np.ones(len(ends), dtype=int)])
+    # At equal times process departures first so back-to-back stays don't overlap
+    order = np.lexsort((deltas, times))
+    times, deltas = times[order], deltas[order]
+    occupancy = np.cumsum(deltas)
+
+    # Occupancy in force at each hour boundary
+    at = np.searchsorted(times, boundaries, side='right') - 1
+    occupancy_at = np.where(at >= 0, occupancy[np.maximum(at, 0)], 0)
+
+    peak = occupancy_at[:hours].copy()
+    # Only the occupancy after the last of several simultaneous events is real
+    settled = np.append(times[1:] != times[:-1], True)
+    inside = settled & (times < hours)
+    np.maximum.at(peak, times[inside].astype(int), occupancy[inside])
+
+    # Area under the occupancy step function, sampled at each boundary
+    area = np.concatenate([[0.0], np.cumsum(occupancy[:-1] * np.diff(times))])
+    area_at = np.where(at >= 0, area[np.maximum(at, 0)] + occupancy_at * (boundaries - times[np.maximum(at, 0)]), 0.0)
+    return peak, np.diff(area_at)
+
+
+def _recompute(lot_id, first_day, last_day, now):
+    """Rebuild one lot's rollups for the days first_day..last_day inclusive."""
+    import numpy as np
+    range_start = datetime.combine(first_day, time.min)
+    range_end = datetime.combine(last_day + timedelta(days=1), time.min)
+    days = (last_day - first_day).days + 1
+
+    def overlapping(model):
+        return db.select(model.start_time, model.end_time, model.status, model.updated_at, model.cost).where(
+            model.start_time < range_end,
+            db.or_(
+                db.and_(model.status.in_(BILLED_STATUSES), model.end_time > range_start),
+                model.status == 'active',
+                db.and_(model.status == 'cancelled', model.updated_at > range_start),
+            )
+        )
+
+    rows = db.session.execute(
+        overlapping(Reservation).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id)
+        .where(ParkingSlot.lot_id == lot_id)
+    ).all()
+    rows += db.session.execute(overlapping(ReservationArchive).where(ReservationArchive.lot_id == lot_id)).all()
+
+    base = np.datetime64(range_start, 'us')
+    starts = np.array([row.start_time for row in rows], dtype='datetime64[us]')
+    ends = np.array([_effective_end(row.status, row.end_time, row.updated_at, now) for row in rows],
+                    dtype='datetime64[us]')
+    hour = np.timedelta64(1, 'h')
+    peak, occupied = hourly_occupancy((starts - base) / hour, (ends - base) / hour, days * 24)
+
+    billed = np.array([row.status in BILLED_STATUSES for row in rows], dtype=bool)
+    end_days = ((ends - base) / np.timedelta64(1, 'D')).astype(float)
+    billed &= (end_days >= 0) & (end_days < days)
+    costs = np.array([row.cost or 0.0 for row in rows], dtype=float)
+    day_index = np.floor(end_days[billed]).astype(int)
+    revenue = np.bincount(day_index, weights=costs[billed], minlength=days)
+    counts = np.bincount(day_index, minlength=days)
+
+    db.session.execute(db.delete(LotHourlyOccupancy).where(
+        LotHourlyOccupancy.lot_id == lot_id,
+        LotHourlyOccupancy.hour >= range_start,
+        LotHourlyOccupancy.hour < range_end
+    ))
+    db.session.execute(db.delete(LotDailyRevenue).where(
+        LotDailyRevenue.lot_id == lot_id,
+        LotDailyRevenue.day >= first_day,
+        LotDailyRevenue.day <= last_day
+    ))
+    hourly = [
+        {'lot_id': lot_id, 'hour': range_start + timedelta(hours=int(h)),
+         'peak_occupancy': int(peak[h]), 'occupied_hours': float(occupied[h])}
+        for h in np.flatnonzero(peak)
+    ]
+    daily = [
+        {'lot_id': lot_id, 'day': first_day + timedelta(days=int(d)),
+         'revenue': float(revenue[d]), 'reservations': int(counts[d])}
+        for d in np.flatnonzero(counts)
+    ]
+    if hourly:
+        db.session.execute(db.insert(LotHourlyOccupancy), hourly)
+    if daily:
+        db.session.execute(db.insert(LotDailyRevenue), daily)
+
+
+def _day_ranges(days):
+    """Collapse a set of dates into inclusive (first, last) runs."""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def refresh_rollups(now=None):
+    """Bring the rollups up to date and return the number of lot-days rebuilt.
+
+    Only reservations changed since the watermark (plus still-active ones,
+    whose occupancy grows with time) are read to find the affected lot-days;
+    each affected run of days is then recomputed from the reservations that
+    overlap it. Every shard keeps its own rollups and watermark.
+    """
+    now = now or datetime.utcnow()
+    return sum(each_shard(lambda: _refresh_shard(now)))
+
+
+def _refresh_shard(now):
+    mark = db.session.get(AnalyticsWatermark, WATERMARK)
+    since = mark.value - SAFETY_LAG if mark else None
+
+    query = db.select(
+        ParkingSlot.lot_id, Reservation.start_time, Reservation.end_time,
+        Reservation.status, Reservation.updated_at
+    ).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id)
+    # Archived rows never change, so only a first run (or rows archived
+    # before a refresh got to them) needs to read the archive
+    archived = db.select(
+        ReservationArchive.lot_id, ReservationArchive.start_time, ReservationArchive.end_time,
+        ReservationArchive.status, ReservationArchive.updated_at
+    ).where(ReservationArchive.lot_id.is_not(None))
+    if since:
+        query = query.where(db.or_(Reservation.updated_at > since, Reservation.status == 'active'))
+        archived = archived.where(ReservationArchive.updated_at > since)
+
+    affected = {}
+    changed = chain.from_iterable(db.session.execute(q) for q in (query, archived))
+    for lot_id, start_time, end_time, status, updated_at in changed:
+        first = start_time.date()
+        if status == 'active' and since and updated_at and updated_at <= since:
+            # Unchanged active stay: earlier days already include it
+            first = max(first, since.date())
+        last = min(_effective_end(status, end_time, updated_at, now), now).date()
+        days = affected.setdefault(lot_id, set())
+        day = first
+        while day <= last:
+            days.add(day)
+            day += timedelta(days=1)
+
+    rebuilt = 0
+    for lot_id, days in affected.items():
+        for first_day, last_day in _day_ranges(days):
+            _recompute(lot_id, first_day, last_day, now)
+            rebuilt += (last_day - first_day).days + 1
+
+    if mark is None:
+        db.session.add(AnalyticsWatermark(name=WATERMARK, value=now))
+    else:
+        mark.value = now
+    db.session.commit()
+    return rebuilt
+
+
+def daily_summary(lot_id, first_day, last_day):
+    """Per-day revenue, stays, peak occupancy and occupied slot-hours, from rollups only."""
+    return daily_summaries([lot_id], first_day, last_day)[lot_id]
+
+
+def daily_summaries(lot_ids, first_day, last_day):
+    """``daily_summary`` for several lots of the current shard, in two queries."""
+    summaries = {}
+    for lot_id in lot_ids:
+        summary = summaries[lot_id] = {}
+        day = first_day
+        while day <= last_day:
+            summary[day] = {'day': day.isoformat(), 'revenue': 0.0, 'reservations': 0,
+                            'peak_occupancy': 0, 'occupied_hours': 0.0}
+            day += timedelta(days=1)
+
+    for row in LotDailyRevenue.query.filter(
+        LotDailyRevenue.lot_id.in_(lot_ids),
+        LotDailyRevenue.day >= first_day,
+        LotDailyRevenue.day <= last_day
+    ):
+        entry = summaries[row.lot_id][row.day]
+        entry['revenue'] = row.revenue
+        entry['reservations'] = row.reservations
+
+    for lot_id, rows in hourly_series_by_lot(lot_ids, first_day, last_day).items():
+        for row in rows:
+            entry = summaries[lot_id][date.fromisoformat(row['hour'][:10])]
+            entry['peak_occupancy'] = max(entry['peak_occupancy'], row['peak_occupancy'])
+            entry['occupied_hours'] += row['occupied_hours']
+    return {lot_id: list(summary.values()) for lot_id, summary in summaries.items()}
+
+
+def hourly_series(lot_id, first_day, last_day):
+    """Non-empty hours of a lot between two days, from rollups only."""
+    return hourly_series_by_lot([lot_id], first_day, last_day)[lot_id]
+
+
+def hourly_series_by_lot(lot_ids, first_day, last_day):
+    """``hourly_series`` for several lots of the current shard, in one query."""
+    series = {lot_id: [] for lot_id in lot_ids}
+    rows = LotHourlyOccupancy.query.filter(
+        LotHourlyOccupancy.lot_id.in_(lot_ids),
+        LotHourlyOccupancy.hour >= datetime.combine(first_day, time.min),
+        LotHourlyOccupancy.hour < datetime.combine(last_day + timedelta(days=1), time.min)
+    ).order_by(LotHourlyOccupancy.lot_id, LotHourlyOccupancy.hour)
+    for row in rows:
+        series[row.lot_id].append(
+            {'hour': row.hour.isoformat(), 'peak_occupancy': row.peak_occupancy, 'occupied_hours': row.occupied_hours})
+    return series
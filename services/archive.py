@@ -0,0 +1,74 @@
+import heapq
+from datetime import datetime, timedelta
+
+from models import db
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.reservation_archive import ReservationArchive
+from models.shards import each_shard
+
+ARCHIVED_STATUSES = ('paid', 'cancelled')
+_COPIED_COLUMNS = ('id', 'user_id', 'slot_id', 'vehicle_number', 'start_time', 'end_time',
+                   'status', 'cost', 'updated_at')
+
+
+def archive_reservations(older_than_days, batch_size=1000, now=None):
+    """Move paid/cancelled reservations last changed more than ``older_than_days`` ago.
+
+    Works in batches of ``batch_size`` rows, each copied with one
+    INSERT ... SELECT and removed with one DELETE in its own short
+    transaction, so bookings are never blocked for long. Each shard archives
+    into its own archive table. Returns the number of reservations archived.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    return sum(each_shard(lambda: _archive_shard(cutoff, batch_size, now)))
+
+
+def _archive_shard(cutoff, batch_size, now):
+    # SQLite hands out max(id) + 1 for new rows; keeping the newest reservation
+    # in the live table stops archived ids from ever being reused.
+    newest_id = db.session.query(db.func.max(Reservation.id)).scalar()
+    if newest_id is None:
+        return 0
+
+    moved = 0
+    while True:
+        ids = [reservation_id for (reservation_id,) in db.session.query(Reservation.id).filter(
+            Reservation.status.in_(ARCHIVED_STATUSES),
+            db.func.coalesce(Reservation.updated_at, Reservation.start_time) < cutoff,
+            Reservation.id < newest_id
+        ).order_by(Reservation.id).limit(batch_size)]
+        if not ids:
+            break
+        try:
+            copy_to_archive(now, Reservation.id.in_(ids))
+            db.session.execute(db.delete(Reservation).where(Reservation.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        moved += len(ids)
+    return moved
+
+
+def copy_to_archive(now, *criteria):
+    """Copy the reservations matching ``criteria`` into the archive with one INSERT ... SELECT.
+
+    ``criteria`` may also filter on ParkingSlot, which is outer-joined to
+    take each row's lot and slot number. The live rows are left for the
+    caller to delete. Returns the number of rows copied.
+    """
+    columns = [getattr(Reservation, column) for column in _COPIED_COLUMNS]
+    return db.session.execute(db.insert(ReservationArchive).from_select(
+        list(_COPIED_COLUMNS) + ['lot_id', 'slot_number', 'archived_at'],
+        db.select(*columns, ParkingSlot.lot_id, ParkingSlot.slot_number, db.literal(now))
+        .outerjoin(ParkingSlot, Reservation.slot_id == ParkingSlot.id)
+        .where(*criteria)
+    )).rowcount
+
+
+def merge_newest_first(*lists, limit=None):
+    """Merge lists already sorted by (start_time, id) descending into one."""
+    merged = heapq.merge(*lists, key=lambda row: (row.start_time, row.id), reverse=True)
+    return list(merged) if limit is None else [row for _, row in zip(range(limit), merged)]
@@ -0,0 +1,287 @@
+import threading
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db
+from models.slot import ParkingSlot
+from models.reservation import Reservation, HOLDING_STATUSES
+from models.lot_occupancy import LotOccupancy
+from models.shards import gather, use_shard, lot_shard
+
+
+class AvailabilityIndex:
+    """Process-local view of every slot's display status, grouped by lot.
+
+    Built lazily with a few queries and then kept current from the session's
+    commit hooks, so ``view_parking`` never has to query slots or match
+    reservations per lot. Code that changes rows with bulk UPDATE/DELETE
+    statements bypasses the hooks and must record its changes with
+    ``record_slot_change``/``record_active_change`` or call ``invalidate()``.
+
+    Each lot also remembers the ``LotOccupancy.version`` it was loaded at.
+    Callers that pass the current version get that lot reloaded when another
+    process (or a change the hooks missed) has moved it on.
+
+    Slots held by an advance booking show as booked, as walk-ins cannot take
+    them, until the booking is checked in, cancelled or expired.
+
+    Free slots per lot are counted as the index changes, for callers that
+    rank whole lots (``free_counts``).
+
+    Listeners added with ``add_listener`` are called after each commit with
+    ``{lot_id: [slot dicts]}`` for the slots whose display status changed.
+    A lot maps to ``None`` instead when its clients should resync: it was
+    invalidated, or this process has not built the index and so cannot say
+    what its slots now show. The whole argument is ``None`` only when every
+    lot was invalidated.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lots = {}          # lot_id -> {slot_id: [slot_number, slot_status]}
+        self._slot_lot = {}      # slot_id -> lot_id
+        self._active = {}        # slot_id -> number of active or scheduled reservations
+        self._versions = {}      # lot_id -> LotOccupancy.version when loaded
+        self._free = {}          # lot_id -> number of slots shown as available
+        self._built = False
+        self._generation = 0
+        self._listeners = []
+
+    # --- Reads ---
+
+    def lot_slots(self, lot_id, version=None):
+        """Return the slots of one lot as ``{'id', 'number', 'status'}`` dicts."""
+        self._ensure_built()
+        if version is not None and self._versions.get(lot_id) != version:
+            self._reload_lot(lot_id, version)
+        with self._lock:
+            slots = self._lots.get(lot_id, {})
+            return [
+                {'id': slot_id, 'number': number, 'status': self._display_status(slot_id, status)}
+                for slot_id, (number, status) in slots.items()
+            ]
+
+    def refresh(self, versions):
+        """Reload every lot in ``{lot_id: version}`` whose version moved on; True if any did."""
+        self._ensure_built()
+        stale = [(lot_id, version) for lot_id, version in versions.items() if self._versions.get(lot_id) != version]
+        for lot_id, version in stale:
+            self._reload_lot(lot_id, version)
+        return bool(stale)
+
+    def free_counts(self):
+        """Map lot_id -> slots currently shown as available. Treat as read-only."""
+        self._ensure_built()
+        return self._free
+
+    def _display_status(self, slot_id, status):
+        if status == 'maintenance':
+            return 'maintenance'
+        if status == 'occupied':
+            return 'occupied'
+        if self._active.get(slot_id):
+            return 'booked'
+        return 'available'
+
+    # --- Building ---
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, deltas):
+        for listener in self._listeners:
+            listener(deltas)
+
+    def invalidate(self, lot_ids=None):
+        """Drop the index after bulk changes; listeners resync ``lot_ids``, or every lot if None."""
+        with self._lock:
+            self._built = False
+            self._generation += 1
+        self._notify(None if lot_ids is None else {lot_id: None for lot_id in lot_ids})
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        with self._lock:
+            generation = self._generation
+
+        # Versions are read first so a change committed mid-build leaves the
+        # recorded version behind the data and triggers a reload, not a miss.
+        versions = LotOccupancy.versions()
+        lots, slot_lot, active = {}, {}, {}
+        # Shards hand out increasing id ranges, so their rows come back in id order
+        slot_rows = gather(lambda: db.session.query(
+            ParkingSlot.id, ParkingSlot.lot_id, ParkingSlot.slot_number, ParkingSlot.status
+        ).order_by(ParkingSlot.id).all())
+        for slot_id, lot_id, number, status in slot_rows:
+            lots.setdefault(lot_id, {})[slot_id] = [number, status]
+            slot_lot[slot_id] = lot_id
+        active_rows = gather(lambda: db.session.query(
+            Reservation.slot_id, db.func.count(Reservation.id)
+        ).filter(Reservation.status.in_(HOLDING_STATUSES)).group_by(Reservation.slot_id).all())
+        for slot_id, count in active_rows:
+            active[slot_id] = count
+
+        free = {lot_id: _count_free(slots, active) for lot_id, slots in lots.items()}
+
+        with self._lock:
+            self._lots, self._slot_lot, self._active = lots, slot_lot, active
+            self._versions, self._free = versions, free
+            # A commit that landed while we were reading may be missing from
+            # this snapshot; leave the index unbuilt so the next read retries.
+            self._built = generation == self._generation
+
+    def _reload_lot(self, lot_id, version):
+        slots = {}
+        with use_shard(lot_shard(lot_id)):
+            for slot_id, number, status in db.session.query(
+                ParkingSlot.id, ParkingSlot.slot_number, ParkingSlot.status
+            ).filter(ParkingSlot.lot_id == lot_id).order_by(ParkingSlot.id):
+                slots[slot_id] = [number, status]
+            active = dict(db.session.query(
+                Reservation.slot_id, db.func.count(Reservation.id)
+            ).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id).filter(
+                ParkingSlot.lot_id == lot_id, Reservation.status.in_(HOLDING_STATUSES)
+            ).group_by(Reservation.slot_id))
+
+        with self._lock:
+            for slot_id in self._lots.pop(lot_id, {}):
+                self._slot_lot.pop(slot_id, None)
+                self._active.pop(slot_id, None)
+            self._lots[lot_id] = slots
+            for slot_id in slots:
+                self._slot_lot[slot_id] = lot_id
+            self._active.update(active)
+            self._versions[lot_id] = version
+            self._free[lot_id] = _count_free(slots, self._active)
+
+    # --- Commit hooks ---
+
+    def _apply(self, changes):
+        touched = {}             # slot_id -> lot_id of every slot the commit changed
+        deleted = set()
+        with self._lock:
+            self._generation += 1
+            if not self._built:
+                # Nothing to describe the slots with; only their lots resync
+                deltas = {lot_id: None for lot_id in _changed_lots(changes)}
+            else:
+                for kind, *args in changes:
+                    if kind == 'slot':
+                        slot_id, lot_id, number, status = args
+                        self._lots.setdefault(lot_id, {})[slot_id] = [number, status]
+                        self._slot_lot[slot_id] = lot_id
+                        touched[slot_id] = lot_id
+                    elif kind == 'slot_deleted':
+                        slot_id, lot_id = args
+                        lot_id = self._slot_lot.pop(slot_id, lot_id)
+                        self._lots.get(lot_id, {}).pop(slot_id, None)
+                        touched[slot_id] = lot_id
+                        deleted.add(slot_id)
+                    elif kind == 'active':
+                        slot_id, lot_id, delta = args
+                        count = self._active.get(slot_id, 0) + delta
+                        if count > 0:
+                            self._active[slot_id] = count
+                        else:
+                            self._active.pop(slot_id, None)
+                        touched.setdefault(slot_id, self._slot_lot.get(slot_id, lot_id))
+                for lot_id in set(touched.values()) - {None}:
+                    self._free[lot_id] = _count_free(self._lots.get(lot_id, {}), self._active)
+                deltas = self._deltas(touched, deleted)
+        if self._listeners:
+            self._notify(deltas)
+
+    def _deltas(self, touched, deleted):
+        deltas = {}
+        for slot_id, lot_id in touched.items():
+            if lot_id is None:
+                continue
+            if slot_id in deleted:
+                delta = {'id': slot_id, 'number': None, 'status': 'deleted'}
+            else:
+                number, status = self._lots[lot_id][slot_id]
+                delta = {'id': slot_id, 'number': number, 'status': self._display_status(slot_id, status)}
+            deltas.setdefault(lot_id, []).append(delta)
+        return deltas
+
+
+def _changed_lots(changes):
+    # Every kind of change records (kind, slot_id, lot_id, ...)
+    return {change[2] for change in changes} - {None}
+
+
+def _count_free(slots, active):
+    # Same rule as AvailabilityIndex._display_status() == 'available'
+    return sum(1 for slot_id, (_, status) in slots.items()
+               if status not in ('maintenance', 'occupied') and not active.get(slot_id))
+
+
+availability_index = AvailabilityIndex()
+
+_CHANGES_KEY = 'availability_changes'
+
+
+def _status_change(obj, default):
+    """Return (old, new) status for a flushed object, or None if unchanged."""
+    history = inspect(obj).attrs.status.history
+    if not history.has_changes():
+        return None
+    old = history.deleted[0] if history.deleted else default
+    new = history.added[0] if history.added else default
+    return old or default, new or default
+
+
+def record_slot_change(session, slot_id, lot_id, slot_number, status):
+    """Queue a slot status change made outside the ORM (e.g. a bulk UPDATE)."""
+    session.info.setdefault(_CHANGES_KEY, []).append(('slot', slot_id, lot_id, slot_number, status))
+
+
+def record_active_change(session, slot_id, lot_id, delta):
+    """Queue an active or scheduled reservation added (+1) or ended (-1) outside the ORM."""
+    session.info.setdefault(_CHANGES_KEY, []).append(('active', slot_id, lot_id, delta))
+
+
+def reservation_lot(session, reservation):
+    """Lot of a reservation's slot, for the commit hooks; None if the slot is gone."""
+    # The slot is usually loaded already (the route read it or changed it);
+    # otherwise one primary-key lookup
+    slot = reservation.__dict__.get('slot') or session.get(ParkingSlot, reservation.slot_id)
+    return slot.lot_id if slot is not None else None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault(_CHANGES_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, ParkingSlot):
+            changes.append(('slot', obj.id, obj.lot_id, obj.slot_number, obj.status or 'available'))
+        elif isinstance(obj, Reservation) and (obj.status or 'active') in HOLDING_STATUSES:
+            changes.append(('active', obj.slot_id, reservation_lot(session, obj), 1))
+    for obj in session.dirty:
+        if isinstance(obj, ParkingSlot) and _status_change(obj, 'available'):
+            changes.append(('slot', obj.id, obj.lot_id, obj.slot_number, obj.status or 'available'))
+        elif isinstance(obj, Reservation):
+            change = _status_change(obj, 'active')
+            if change and change[0] in HOLDING_STATUSES and change[1] not in HOLDING_STATUSES:
+                changes.append(('active', obj.slot_id, reservation_lot(session, obj), -1))
+            elif change and change[0] not in HOLDING_STATUSES and change[1] in HOLDING_STATUSES:
+                changes.append(('active', obj.slot_id, reservation_lot(session, obj), 1))
+    for obj in session.deleted:
+        if isinstance(obj, ParkingSlot):
+            changes.append(('slot_deleted', obj.id, obj.lot_id))
+        elif isinstance(obj, Reservation) and (obj.status or 'active') in HOLDING_STATUSES:
+            changes.append(('active', obj.slot_id, reservation_lot(session, obj), -1))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes:
+        availability_index._apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
@@ -0,0 +1,562 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from models import db
+from models.slot import ParkingSlot
+from models.reservation import Reservation, HOLDING_STATUSES, normalize_plate
+from models.lot_occupancy import LotOccupancy, reservation_deltas
+from services.availability import record_slot_change, record_active_change
+from services.schedule import record_booking_change
+
+# Slot statuses a driver may book. 'booked' without an active reservation is
+# shown as available on view_parking, so it stays bookable here too.
+CLAIMABLE_STATUSES = ('available', 'booked')
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.05  # seconds, doubled after each locked attempt
+
+
+class SlotUnavailable(Exception):
+    """Raised when the requested slot, or every slot in a lot, is taken."""
+
+
+class VehicleAlreadyParked(Exception):
+    """Raised when the vehicle already has an active reservation, or a booking overlapping the window."""
+
+
+def _no_active_reservation(slot_table):
+    return ~db.exists().where(
+        Reservation.slot_id == slot_table.id,
+        Reservation.status == 'active'
+    )
+
+
+def holding_reservations(start, end=None, now=None):
+    """Filter for reservations that keep their slot from being booked for [start, end).
+
+    ``end=None`` is an open-ended (walk-in) stay. An advance booking holds
+    its window; a stay in progress holds its slot until it is released, which
+    past its booked end (or without one) could be any time.
+    """
+    now = now or datetime.utcnow()
+    holds = db.or_(
+        db.and_(Reservation.status == 'scheduled', Reservation.end_time > start),
+        db.and_(Reservation.status == 'active', db.or_(
+            Reservation.end_time.is_(None), Reservation.end_time <= now, Reservation.end_time > start
+        )),
+    )
+    return holds if end is None else db.and_(Reservation.start_time < end, holds)
+
+
+def _no_hold(slot_table, now):
+    # Free for a walk-in: nothing in progress and no advance booking still to come
+    return ~db.exists().where(Reservation.slot_id == slot_table.id, holding_reservations(now, None, now))
+
+
+def vehicle_is_parked(vehicle_number):
+    """True if the plate has an active reservation in any shard (an index probe each)."""
+    from models.shards import each_shard
+
+    plate = normalize_plate(vehicle_number)
+    return any(each_shard(lambda: db.session.execute(
+        db.select(Reservation.id).where(Reservation.vehicle_number == plate, Reservation.status == 'active').limit(1)
+    ).first() is not None))
+
+
+def vehicle_is_booked(vehicle_number, start, end):
+    """True if the plate has a booked window overlapping [start, end) in any shard.
+
+    Open walk-in stays have no end to compare, so they do not count here.
+    """
+    from models.shards import each_shard
+
+    plate = normalize_plate(vehicle_number)
+    return any(each_shard(lambda: db.session.execute(
+        db.select(Reservation.id).where(
+            Reservation.vehicle_number == plate, Reservation.status.in_(HOLDING_STATUSES),
+            Reservation.start_time < end, Reservation.end_time > start
+        ).limit(1)
+    ).first() is not None))
+
+
+def _create_reservation(slot_id, lot_id, old_status, user_id, vehicle_number):
+    # No end_time until the slot is released
+    reservation = Reservation(
+        user_id=user_id,
+        slot_id=slot_id,
+        vehicle_number=vehicle_number,
+        start_time=datetime.utcnow(),
+        end_time=None,
+        status='active',
+        cost=None
+    )
+    db.session.add(reservation)
+    LotOccupancy.slot_changed(lot_id, old_status, 'occupied')
+    LotOccupancy.reservation_changed(lot_id, None, 'active')
+    return reservation
+
+
+def _with_retries(attempt):
+    """Run ``attempt()`` until it returns a result, retrying on lock contention.
+
+    ``attempt`` returns None when it lost a compare-and-swap race and should
+    be re-run, and raises SlotUnavailable when there is nothing left to claim
+    (or VehicleAlreadyParked).
+    """
+    backoff = RETRY_BACKOFF
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            result = attempt()
+        except (SlotUnavailable, VehicleAlreadyParked):
+            db.session.rollback()
+            raise
+        except IntegrityError:
+            # uq_reservation_active_slot caught a concurrent active reservation
+            db.session.rollback()
+            continue
+        except OperationalError:
+            # SQLite reports a competing writer as "database is locked"
+            db.session.rollback()
+            time.sleep(backoff)
+            backoff *= 2
+            continue
+        if result is not None:
+            return result
+        db.session.rollback()
+    raise SlotUnavailable()
+
+
+def claim_slot(slot_id, user_id, vehicle_number):
+    """Atomically book one slot and return the new active Reservation.
+
+    The slot is claimed with a conditional UPDATE that only matches while it
+    still has the status we read and no active reservation or upcoming
+    advance booking, so two concurrent requests can never both succeed.
+    """
+    def attempt():
+        now = datetime.utcnow()
+        row = db.session.execute(
+            db.select(ParkingSlot.lot_id, ParkingSlot.slot_number, ParkingSlot.status)
+            .where(ParkingSlot.id == slot_id)
+        ).first()
+        if row is None or (row.status or 'available') not in CLAIMABLE_STATUSES:
+            raise SlotUnavailable()
+
+        same_status = ParkingSlot.status == row.status if row.status is not None else ParkingSlot.status.is_(None)
+        result = db.session.execute(
+            db.update(ParkingSlot)
+            .where(ParkingSlot.id == slot_id, same_status, _no_hold(ParkingSlot, now))
+            .values(status='occupied')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            return None
+        # Checked while holding the write lock, so two bookings of one plate in a shard cannot both pass
+        if vehicle_is_parked(vehicle_number):
+            raise VehicleAlreadyParked()
+
+        reservation = _create_reservation(slot_id, row.lot_id, row.status or 'available', user_id, vehicle_number)
+        record_slot_change(db.session, slot_id, row.lot_id, row.slot_number, 'occupied')
+        db.session.commit()
+        return reservation
+
+    return _with_retries(attempt)
+
+
+def claim_any_slot(lot_id, user_id, vehicle_number):
+    """Book the first free slot in a lot in a single UPDATE ... RETURNING."""
+    def attempt():
+        free = db.aliased(ParkingSlot)
+        first_free = (
+            db.select(free.id)
+            .where(free.lot_id == lot_id, free.status == 'available', _no_hold(free, datetime.utcnow()))
+            .order_by(free.id)
+            .limit(1)
+        )
+        row = db.session.execute(
+            db.update(ParkingSlot)
+            .where(ParkingSlot.id == first_free.scalar_subquery(), ParkingSlot.status == 'available')
+            .values(status='occupied')
+            .returning(ParkingSlot.id, ParkingSlot.slot_number)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            # Either the lot is full or a concurrent claim took our candidate
+            if db.session.execute(first_free).first() is None:
+                raise SlotUnavailable()
+            return None
+        if vehicle_is_parked(vehicle_number):
+            raise VehicleAlreadyParked()
+
+        reservation = _create_reservation(row.id, lot_id, 'available', user_id, vehicle_number)
+        record_slot_change(db.session, row.id, lot_id, row.slot_number, 'occupied')
+        db.session.commit()
+        return reservation
+
+    return _with_retries(attempt)
+
+
+# --- Advance bookings ---
+
+def book_ahead(slot_id, user_id, vehicle_number, start, end, now=None):
+    """Book one slot for the window [start, end) and return the scheduled Reservation.
+
+    The lot counter UPDATE goes first so the shard's write lock is held while
+    the slot's bookings and the vehicle's are probed (both indexed), so two
+    overlapping bookings of one slot can never both commit. Raises
+    SlotUnavailable or VehicleAlreadyParked.
+    """
+    now = now or datetime.utcnow()
+
+    def attempt():
+        row = db.session.execute(
+            db.select(ParkingSlot.lot_id, ParkingSlot.status).where(ParkingSlot.id == slot_id)
+        ).first()
+        if row is None or row.status == 'maintenance':
+            raise SlotUnavailable()
+
+        LotOccupancy.reservation_changed(row.lot_id, None, 'scheduled')
+        taken = db.session.execute(
+            db.select(Reservation.id).where(Reservation.slot_id == slot_id, holding_reservations(start, end, now)).limit(1)
+        ).first()
+        if taken is not None:
+            raise SlotUnavailable()
+        if vehicle_is_booked(vehicle_number, start, end):
+            raise VehicleAlreadyParked()
+
+        reservation = Reservation(
+            user_id=user_id,
+            slot_id=slot_id,
+            vehicle_number=vehicle_number,
+            start_time=start,
+            end_time=end,
+            status='scheduled',
+            cost=None
+        )
+        db.session.add(reservation)
+        db.session.commit()
+        return reservation
+
+    return _with_retries(attempt)
+
+
+def book_ahead_any(lot_id, user_id, vehicle_number, start, end, now=None):
+    """Book any slot in the lot that is free for [start, end).
+
+    Candidates come from the interval index. Slots that already carry advance
+    bookings are tried first, highest id first, which leaves the low-numbered
+    slots walk-ins are given (claim_any_slot) clear as long as possible.
+    """
+    from services.schedule import slot_schedule
+
+    free = slot_schedule.free_slots(lot_id, start, end, now)
+    for slot_id, _, _ in sorted(free, key=lambda slot: (not slot[2], -slot[0]))[:MAX_ATTEMPTS]:
+        try:
+            return book_ahead(slot_id, user_id, vehicle_number, start, end, now)
+        except SlotUnavailable:
+            continue     # taken since the index was read
+    raise SlotUnavailable()
+
+
+def check_in(reservation_id):
+    """Start an advance booking: occupy its slot and make the reservation active.
+
+    The caller checks the window. The slot is claimed with the same kind of
+    conditional UPDATE as a walk-in, so a slot that is still occupied (a
+    driver staying past their booking) raises SlotUnavailable.
+    """
+    def attempt():
+        now = datetime.utcnow()
+        row = db.session.execute(
+            db.select(Reservation.slot_id, Reservation.vehicle_number, Reservation.start_time, Reservation.end_time,
+                      ParkingSlot.lot_id, ParkingSlot.slot_number, ParkingSlot.status)
+            .join(ParkingSlot, Reservation.slot_id == ParkingSlot.id)
+            .where(Reservation.id == reservation_id, Reservation.status == 'scheduled')
+        ).first()
+        if row is None or (row.status or 'available') not in CLAIMABLE_STATUSES:
+            raise SlotUnavailable()
+
+        same_status = ParkingSlot.status == row.status if row.status is not None else ParkingSlot.status.is_(None)
+        result = db.session.execute(
+            db.update(ParkingSlot)
+            .where(ParkingSlot.id == row.slot_id, same_status, _no_active_reservation(ParkingSlot))
+            .values(status='occupied')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            return None
+        if vehicle_is_parked(row.vehicle_number):
+            raise VehicleAlreadyParked()
+        db.session.execute(
+            db.update(Reservation)
+            .where(Reservation.id == reservation_id, Reservation.status == 'scheduled')
+            .values(status='active', updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        LotOccupancy.slot_changed(row.lot_id, row.status or 'available', 'occupied')
+        LotOccupancy.reservation_changed(row.lot_id, 'scheduled', 'active')
+        record_slot_change(db.session, row.slot_id, row.lot_id, row.slot_number, 'occupied')
+        record_booking_change(db.session, row.lot_id, row.slot_id, 'scheduled', 'active', row.start_time, row.end_time)
+        db.session.commit()
+        return row.slot_id
+
+    return _with_retries(attempt)
+
+
+def move_reservation(reservation_id, old_status, new_status):
+    """Move a reservation from ``old_status`` to ``new_status``; False if it had already left it.
+
+    The same conditional UPDATE as claim_slot: a form submitted twice has
+    both requests read the old status, but only one UPDATE matches, so only
+    that request goes on to change the counters. The caller rolls back on
+    False. ORM changes to the loaded reservation afterwards still flush
+    (and fire the index hooks) as usual.
+    """
+    result = db.session.execute(
+        db.update(Reservation)
+        .where(Reservation.id == reservation_id, Reservation.status == old_status)
+        .values(status=new_status, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def expire_missed_bookings(now=None):
+    """Cancel advance bookings whose window ended without a check-in; returns how many.
+
+    They stop holding their slot when the window ends either way; this
+    settles their status and the counters (`flask --app app expire-bookings`,
+    run from cron).
+    """
+    from models.shards import each_shard
+
+    now = now or datetime.utcnow()
+
+    def attempt():
+        rows = db.session.execute(
+            db.select(Reservation.id, Reservation.slot_id, Reservation.start_time, Reservation.end_time, ParkingSlot.lot_id)
+            .join(ParkingSlot, Reservation.slot_id == ParkingSlot.id)
+            .where(Reservation.status == 'scheduled', Reservation.end_time <= now)
+        ).all()
+        if not rows:
+            return 0
+        result = db.session.execute(
+            db.update(Reservation)
+            .where(Reservation.id.in_([row.id for row in rows]), Reservation.status == 'scheduled')
+            .values(status='cancelled', updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(rows):
+            return None      # checked in or cancelled meanwhile
+        counters = defaultdict(dict)
+        for row in rows:
+            reservation_deltas('scheduled', 'cancelled', deltas=counters[row.lot_id])
+            record_active_change(db.session, row.slot_id, row.lot_id, -1)
+            record_booking_change(db.session, row.lot_id, row.slot_id, 'scheduled', 'cancelled', row.start_time, row.end_time)
+        LotOccupancy.apply_many(counters)
+        db.session.commit()
+        return len(rows)
+
+    return sum(each_shard(lambda: _with_retries(attempt)))
+
+
+# --- Gate events ---
+
+GATE_EVENT_TYPES = ('entry', 'exit')
+
+
+def apply_gate_events(events, user_id, tariff, now=None):
+    """Apply a burst of barrier camera events and return one outcome per event.
+
+    ``events`` are ``{'type': 'entry'|'exit', 'vehicle_number', 'lot_id'}``
+    dicts with normalised plates, applied in order. An entry allocates a free slot in the lot and
+    opens a reservation for ``user_id`` (the gate's account); an exit closes
+    the plate's active reservation in that lot and bills it with ``tariff``,
+    the same as ``release_slot``. Each shard's events are resolved with one
+    lookup of active reservations and one of free slots, and written in one
+    transaction of set-based statements, so a batch of a thousand events
+    costs about as many statements as one.
+
+    Outcomes: ``parked``, ``already_parked``, ``lot_full``, ``unknown_lot``,
+    ``exited`` and ``not_parked``, with the reservation, slot and cost where
+    there is one.
+    """
+    from models.shards import each_lot_shard
+
+    now = now or datetime.utcnow()
+    results = [None] * len(events)
+
+    def apply_shard(lot_ids):
+        lot_ids = set(lot_ids)
+        batch = [(index, event) for index, event in enumerate(events) if event['lot_id'] in lot_ids]
+        for index, result in _with_retries(lambda: _apply_gate_batch(batch, user_id, tariff, now)):
+            results[index] = result
+
+    each_lot_shard(sorted({event['lot_id'] for event in events}), apply_shard)
+    return results
+
+
+def _apply_gate_batch(batch, user_id, tariff, now):
+    from collections import deque
+    import numpy as np
+    from models.lot import ParkingLot
+    from models.lot_occupancy import slot_deltas
+    from models.user_summary import UserSummary
+
+    lot_ids = {event['lot_id'] for _, event in batch}
+    plates = {event['vehicle_number'] for _, event in batch}
+    prices = dict(db.session.execute(db.select(ParkingLot.id, ParkingLot.price).where(ParkingLot.id.in_(lot_ids))).all())
+
+    # Every plate's active reservation in these lots, in one query
+    parked = {}
+    for row in db.session.execute(
+        db.select(Reservation.id, Reservation.user_id, Reservation.vehicle_number, Reservation.start_time,
+                  Reservation.slot_id, ParkingSlot.lot_id, ParkingSlot.slot_number, ParkingSlot.status)
+        .join(ParkingSlot, Reservation.slot_id == ParkingSlot.id)
+        .where(Reservation.status == 'active', ParkingSlot.lot_id.in_(lot_ids),
+               Reservation.vehicle_number.in_(plates))
+    ):
+        parked[(row.lot_id, row.vehicle_number)] = dict(row._mapping)
+
+    # Enough free slots for every entry, lowest ids first, in one query
+    needed = defaultdict(int)
+    for _, event in batch:
+        if event['type'] == 'entry':
+            needed[event['lot_id']] += 1
+    free = defaultdict(deque)
+    if needed:
+        candidates = db.aliased(ParkingSlot)
+        ranked = (
+            db.select(candidates.id, candidates.lot_id, candidates.slot_number,
+                      db.func.row_number().over(partition_by=candidates.lot_id, order_by=candidates.id).label('rank'))
+            .where(candidates.lot_id.in_(needed), candidates.status == 'available',
+                   _no_hold(candidates, now))
+            .subquery()
+        )
+        for slot_id, lot_id, slot_number, rank in db.session.execute(
+            db.select(ranked).where(ranked.c.rank <= max(needed.values())).order_by(ranked.c.lot_id, ranked.c.rank)
+        ):
+            if rank <= needed[lot_id]:
+                free[lot_id].append((slot_id, slot_number))
+
+    opened, closed, outcomes, touched = [], [], [], {}
+    for index, event in batch:
+        lot_id, plate = event['lot_id'], event['vehicle_number']
+        stay = parked.get((lot_id, plate))
+        result = {'type': event['type'], 'vehicle_number': event['vehicle_number'], 'lot_id': lot_id}
+        outcomes.append((index, result))
+        if lot_id not in prices:
+            result['outcome'] = 'unknown_lot'
+        elif event['type'] == 'entry':
+            if stay is not None:
+                result['outcome'] = 'already_parked'
+            elif not free[lot_id]:
+                result['outcome'] = 'lot_full'
+            else:
+                slot_id, slot_number = free[lot_id].popleft()
+                stay = {'id': None, 'user_id': user_id, 'vehicle_number': event['vehicle_number'],
+                        'start_time': now, 'slot_id': slot_id, 'lot_id': lot_id,
+                        'slot_number': slot_number, 'status': 'available'}
+                parked[(lot_id, plate)] = stay
+                opened.append(stay)
+                result['outcome'] = 'parked'
+        elif stay is None:
+            result['outcome'] = 'not_parked'
+        else:
+            del parked[(lot_id, plate)]
+            closed.append(stay)
+            result['outcome'] = 'exited'
+            if stay['id'] is not None:
+                # Released before the claims below, so later entries can have it
+                free[lot_id].append((stay['slot_id'], stay['slot_number']))
+        if stay is not None:
+            touched.setdefault(id(stay), stay).setdefault('results', []).append(result)
+
+    if closed:
+        costs = tariff.costs(
+            np.array([stay['start_time'] for stay in closed], dtype='datetime64[us]'),
+            np.full(len(closed), now, dtype='datetime64[us]'),
+            np.array([np.nan if prices[stay['lot_id']] is None else prices[stay['lot_id']]
+                      for stay in closed], dtype=float),
+        )
+        for stay, cost in zip(closed, costs):
+            stay['cost'] = float(cost)
+
+    # A vehicle that came and went within the batch never holds its slot
+    claimed = [stay for stay in opened if 'cost' not in stay]
+    ended = [stay for stay in closed if stay['id'] is not None]
+    counters = defaultdict(dict)
+
+    if ended:
+        table = Reservation.__table__
+        closing = db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('reservation'), table.c.status == 'active')
+            .values(end_time=now, cost=db.bindparam('billed'), status='completed', updated_at=now),
+            [{'reservation': stay['id'], 'billed': stay['cost']} for stay in ended]
+        )
+        if closing.rowcount != len(ended):
+            return None      # released or cancelled meanwhile
+        db.session.execute(
+            db.update(ParkingSlot)
+            .where(ParkingSlot.id.in_([stay['slot_id'] for stay in ended]))
+            .values(status='available')
+            .execution_options(synchronize_session=False)
+        )
+        for stay in ended:
+            record_active_change(db.session, stay['slot_id'], stay['lot_id'], -1)
+            record_booking_change(db.session, stay['lot_id'], stay['slot_id'], 'active', 'completed', stay['start_time'], now)
+            record_slot_change(db.session, stay['slot_id'], stay['lot_id'], stay['slot_number'], 'available')
+            reservation_deltas('active', 'completed', deltas=counters[stay['lot_id']])
+            slot_deltas(stay['status'] or 'available', 'available', deltas=counters[stay['lot_id']])
+
+    if claimed:
+        claim_ids = [stay['slot_id'] for stay in claimed]
+        rows = db.session.execute(
+            db.update(ParkingSlot)
+            .where(ParkingSlot.id.in_(claim_ids), ParkingSlot.status == 'available',
+                   _no_hold(ParkingSlot, now))
+            .values(status='occupied')
+            .returning(ParkingSlot.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if len(rows) != len(claim_ids):
+            return None      # a concurrent booking took one of them; start again
+        for stay in claimed:
+            record_slot_change(db.session, stay['slot_id'], stay['lot_id'], stay['slot_number'], 'occupied')
+            slot_deltas('available', 'occupied', deltas=counters[stay['lot_id']])
+
+    if opened:
+        # Each new stay has its own slot, so RETURNING rows are matched on it
+        # and can come back in any order (letting SQLite batch the INSERT)
+        ids = dict(db.session.execute(
+            db.insert(Reservation).returning(Reservation.slot_id, Reservation.id),
+            [{'user_id': stay['user_id'], 'slot_id': stay['slot_id'], 'vehicle_number': stay['vehicle_number'],
+              'start_time': now, 'updated_at': now,
+              'end_time': now if 'cost' in stay else None,
+              'status': 'completed' if 'cost' in stay else 'active', 'cost': stay.get('cost')}
+             for stay in opened]
+        ).all())
+        for stay in opened:
+            stay['id'] = ids[stay['slot_id']]
+            reservation_deltas(None, 'completed' if 'cost' in stay else 'active', deltas=counters[stay['lot_id']])
+            if 'cost' not in stay:
+                record_active_change(db.session, stay['slot_id'], stay['lot_id'], 1)
+                record_booking_change(db.session, stay['lot_id'], stay['slot_id'], None, 'active', now, None)
+
+    totals = defaultdict(lambda: [0, 0.0])
+    for stay in closed:
+        totals[stay['user_id']][0] += 1
+        totals[stay['user_id']][1] += (now - stay['start_time']).total_seconds() / 3600.0
+    UserSummary.stays_finished(totals)
+    LotOccupancy.apply_many(counters)
+    db.session.commit()
+
+    for stay in touched.values():
+        for result in stay['results']:
+            result.update(reservation_id=stay['id'], slot_id=stay['slot_id'], slot_number=stay['slot_number'])
+            if result['outcome'] == 'exited':
+                result['cost'] = stay['cost']
+    return outcomes
@@ -0,0 +1,71 @@
+import os
+from contextlib import contextmanager
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, init_migrations
+from models.user import User
+from models.lot_occupancy import LotOccupancy
+from models.shards import prepare_shards
+
+try:
+    import fcntl
+except ImportError:          # Windows: one process at a time is up to the operator
+    fcntl = None
+
+
+@contextmanager
+def _bootstrap_lock(app):
+    """Hold an exclusive lock file in the instance folder for the duration.
+
+    Covers several processes on one host starting together (workers without
+    preload_app, a deploy script racing the server). Hosts sharing a database
+    server should run `flask --app app bootstrap` once per release instead.
+    """
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, 'bootstrap.lock'), 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def bootstrap(app):
+    """Bring the database up to date for serving; every step is a no-op when done.
+
+    Applies pending migrations (to every shard database when SHARD_COUNT > 1),
+    creates an admin from ADMIN_EMAIL /
+    ADMIN_PASSWORD if there is no admin yet and builds missing lot counters.
+    Returns a line per step for the caller to print or log.
+    """
+    from flask_migrate import upgrade
+
+    init_migrations(app)
+    report = []
+    with _bootstrap_lock(app), app.app_context():
+        upgrade()
+        report.append('Database schema is up to date.')
+        # Before anything is written, so new users and lots reach every shard
+        shards = prepare_shards(app)
+        if shards:
+            report.append(f'{shards} shard databases are up to date.')
+
+        if User.query.filter_by(role='admin').first():
+            report.append('Admin user already exists.')
+        elif not app.config['ADMIN_PASSWORD']:
+            report.append('No admin user: set ADMIN_PASSWORD to create one.')
+        else:
+            admin = User(name='Admin', email=app.config['ADMIN_EMAIL'], role='admin')
+            admin.set_password(app.config['ADMIN_PASSWORD'])
+            db.session.add(admin)
+            try:
+                db.session.commit()
+                report.append(f"Admin user created: {app.config['ADMIN_EMAIL']}")
+            except IntegrityError:
+                # Email is unique: another host got there first, or a user has it
+                db.session.rollback()
+                report.append(f"Admin user not created: {app.config['ADMIN_EMAIL']} is already registered.")
+
+        if LotOccupancy.missing():
+            LotOccupancy.rebuild()
+            report.append('Lot occupancy counters rebuilt.')
+    return report
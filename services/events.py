@@ -0,0 +1,181 @@
+import json
+import os
+import queue
+import threading
+
+from services.availability import availability_index
+
+ALL_LOTS = 'lots'        # every lot's slot changes
+BROADCAST = 'broadcast'  # resync notices for every subscriber
+RESYNC = 'resync'
+
+
+def lot_channel(lot_id):
+    return f'lot:{lot_id}'
+
+
+class StreamLimitReached(RuntimeError):
+    """Raised by ``subscribe`` when this process already serves SSE_MAX_STREAMS streams."""
+
+
+def sse_message(event, data):
+    """Encode one Server-Sent Events frame."""
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class Subscription:
+    """A subscriber's bounded queue of encoded SSE frames.
+
+    A client that falls more than ``maxsize`` frames behind is not allowed to
+    hold up the publisher: its backlog is dropped and it is told to resync.
+    """
+
+    def __init__(self, channels, maxsize):
+        self.channels = channels
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            self._queue.put_nowait(sse_message(RESYNC, {}))
+
+    def get(self, timeout):
+        """Return the next frame, or None if nothing arrived within ``timeout``."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class InProcessBroker:
+    """Pub/sub within one process.
+
+    ``publish`` does no I/O and no DB work: the frame is encoded once by the
+    caller and handed to every subscriber queue on the channel. With
+    ``max_subscribers`` set, subscribing beyond it raises StreamLimitReached.
+    """
+
+    def __init__(self, queue_size=256, max_subscribers=0):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._channels = {}      # channel -> set of Subscription
+        self._subscribers = 0
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscribe(self, *channels):
+        subscription = Subscription(channels, self.queue_size)
+        with self._lock:
+            if self.max_subscribers and self._subscribers >= self.max_subscribers:
+                raise StreamLimitReached(f'This process already serves {self._subscribers} event streams.')
+            self._subscribers += 1
+            for channel in channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers -= 1
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subscribers in self._channels.values() for s in subscribers})
+
+
+class RedisBroker(InProcessBroker):
+    """Shares events between processes through Redis pub/sub.
+
+    Frames are published to Redis; one listener thread per process receives
+    them and fans them out to that process's subscribers, so each commit costs
+    one Redis message no matter how many clients are connected.
+    """
+
+    def __init__(self, url, prefix='parking:', queue_size=256, max_subscribers=0):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('EVENT_BROKER_URL needs the "redis" package (pip install redis).')
+        super().__init__(queue_size, max_subscribers)
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(f'{prefix}*')
+        threading.Thread(target=self._listen, name='event-broker', daemon=True).start()
+
+    def publish(self, channel, message):
+        self._redis.publish(self.prefix + channel, message)
+
+    def _listen(self):
+        for item in self._pubsub.listen():
+            channel = item['channel'].decode()[len(self.prefix):]
+            self._deliver(channel, item['data'].decode())
+
+
+broker = InProcessBroker()
+
+
+def configure_broker(config):
+    """Pick the broker for this process from EVENT_BROKER_URL (empty: in-process)."""
+    global broker
+    url = config.get('EVENT_BROKER_URL')
+    limit = config.get('SSE_MAX_STREAMS', 0)
+    broker = RedisBroker(url, max_subscribers=limit) if url else InProcessBroker(max_subscribers=limit)
+    return broker
+
+
+def _reconnect_after_fork():
+    # The listener thread and the Redis connections do not survive fork(), so
+    # a worker forked from a preloaded app needs a broker of its own
+    global broker
+    if isinstance(broker, RedisBroker):
+        broker = RedisBroker(broker.url, broker.prefix, broker.queue_size, broker.max_subscribers)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reconnect_after_fork)
+
+
+def subscribe(lot_id=None):
+    """Subscribe to one lot's slot changes, or every lot's when lot_id is None.
+
+    Raises StreamLimitReached when this process is at SSE_MAX_STREAMS.
+    """
+    return broker.subscribe(ALL_LOTS if lot_id is None else lot_channel(lot_id), BROADCAST)
+
+
+def unsubscribe(subscription):
+    broker.unsubscribe(subscription)
+
+
+def _publish_slot_changes(deltas):
+    if deltas is None:
+        broker.publish(BROADCAST, sse_message(RESYNC, {}))
+        return
+    for lot_id, slots in deltas.items():
+        if slots is None:
+            message = sse_message(RESYNC, {'lot_id': lot_id})
+        else:
+            message = sse_message('slots', {'lot_id': lot_id, 'slots': slots})
+        broker.publish(lot_channel(lot_id), message)
+        broker.publish(ALL_LOTS, message)
+
+
+availability_index.add_listener(_publish_slot_changes)
@@ -0,0 +1,100 @@
+import csv
+import heapq
+import io
+import json
+from datetime import timedelta
+
+from models import db
+from models.user import User
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.reservation_archive import ReservationArchive
+from models.shards import gather
+
+EXPORT_COLUMNS = (
+    'id', 'user_name', 'user_email', 'vehicle_number', 'lot_name', 'slot_number',
+    'start_time', 'end_time', 'status', 'cost',
+)
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+CHUNK_SIZE = 1000
+
+
+def reservation_rows(status=None, lot_id=None, date_from=None, date_to=None, chunk_size=CHUNK_SIZE):
+    """Yield export rows as dicts, fetching ``chunk_size`` rows at a time.
+
+    Selects plain columns joined to user, slot and lot (no ORM objects, no
+    lazy loads) and streams them with ``yield_per``, so memory use does not
+    grow with the number of reservations. Live and archived reservations (of
+    every shard, or the lot's) are streamed side by side and merged by id.
+    ``date_to`` is inclusive.
+    """
+    def streams():
+        return [
+            filtered(live(), Reservation, ParkingSlot.lot_id),
+            filtered(archived(), ReservationArchive, ReservationArchive.lot_id),
+        ]
+
+    def live():
+        return db.session.query(
+            Reservation.id, User.name, User.email, Reservation.vehicle_number,
+            ParkingLot.name, ParkingSlot.slot_number, Reservation.start_time,
+            Reservation.end_time, Reservation.status, Reservation.cost
+        ).join(User, Reservation.user_id == User.id).join(
+            ParkingSlot, Reservation.slot_id == ParkingSlot.id
+        ).join(ParkingLot, ParkingSlot.lot_id == ParkingLot.id)
+
+    def archived():
+        return db.session.query(
+            ReservationArchive.id, User.name, User.email, ReservationArchive.vehicle_number,
+            ParkingLot.name, ReservationArchive.slot_number, ReservationArchive.start_time,
+            ReservationArchive.end_time, ReservationArchive.status, ReservationArchive.cost
+        ).join(User, ReservationArchive.user_id == User.id).outerjoin(
+            ParkingLot, ReservationArchive.lot_id == ParkingLot.id
+        )
+
+    def filtered(query, model, lot_column):
+        if status:
+            query = query.filter(model.status == status)
+        if lot_id:
+            query = query.filter(lot_column == lot_id)
+        if date_from:
+            query = query.filter(model.start_time >= date_from)
+        if date_to:
+            query = query.filter(model.start_time < date_to + timedelta(days=1))
+        return query.order_by(model.id).yield_per(chunk_size)
+
+    # Ids of different shards never overlap, so one merge by id covers them all
+    rows = heapq.merge(*gather(streams, lot_id=lot_id), key=lambda row: row[0])
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record['start_time'] = record['start_time'].isoformat()
+        # Open walk-in stays (and cancelled ones) have no end_time
+        record['end_time'] = record['end_time'].isoformat() if record['end_time'] else None
+        yield record
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def iter_export(fmt, rows):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format "{fmt}". Use one of: {", ".join(EXPORT_FORMATS)}.')
+    return iter_csv(rows) if fmt == 'csv' else iter_jsonl(rows)
@@ -0,0 +1,280 @@
+import heapq
+import math
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db
+from models.lot import ParkingLot
+from models.lot_occupancy import LotOccupancy
+from services.availability import availability_index
+
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 16
+# How often a process checks for lots other processes added, moved or removed
+RECHECK_SECONDS = 5
+
+
+def unit_vector(latitude, longitude):
+    """Point on the unit sphere; straight-line distance grows with great-circle distance."""
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+def valid_coordinates(latitude, longitude):
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def parse_coordinates(latitude, longitude):
+    """Parse form/CSV strings into (latitude, longitude); both blank gives (None, None).
+
+    Raises ValueError if only one is given, either is not a number or out of range.
+    """
+    latitude, longitude = (latitude or '').strip(), (longitude or '').strip()
+    if not latitude and not longitude:
+        return None, None
+    latitude, longitude = float(latitude), float(longitude)
+    if not valid_coordinates(latitude, longitude):
+        raise ValueError('coordinates out of range')
+    return latitude, longitude
+
+
+class LotLocator:
+    """Process-local k-d tree over lot coordinates for nearest-lot queries.
+
+    Lots are stored as 3-D unit vectors so distances need no trigonometry and
+    there is no seam at the antimeridian. The tree is an implicit, balanced
+    layout over flat lists (split at the middle of each range, cycling x, y,
+    z) built with numpy partitions.
+
+    Lots added, moved or removed after the build go into a small overflow
+    dict and a set of stale tree entries that queries take into account; the
+    tree is rebuilt once those grow past a fraction of its size, so editing
+    a lot never costs a full rebuild. Like ``AvailabilityIndex`` it is kept
+    current from the session's commit hooks; code that changes lots with
+    bulk statements must call ``invalidate()``.
+
+    Other processes' changes never reach those hooks, so every
+    ``recheck_seconds`` a query also reads a fingerprint of the lots with
+    coordinates (count, highest id and coordinate sums) and the tree is
+    rebuilt when it differs from the one taken at the last build.
+    """
+
+    def __init__(self, leaf_size=LEAF_SIZE, recheck_seconds=RECHECK_SECONDS):
+        self.leaf_size = leaf_size
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        self._points = {}        # lot_id -> unit vector, every lot with coordinates
+        self._ids = []           # tree layout
+        self._axes = ([], [], [])
+        self._splits = []        # split value of the node whose middle is at this index
+        self._stale = set()      # lot ids whose tree entry is outdated
+        self._extra = {}         # lot_id -> unit vector, not in the tree yet
+        self._built = False
+        self._generation = 0
+        self._fingerprint = None
+        self._checked = 0.0      # time.monotonic() of the last fingerprint read
+
+    # --- Reads ---
+
+    def nearest(self, latitude, longitude, k=5, max_km=None, accept=None):
+        """Return up to ``k`` (lot_id, distance_km) pairs, nearest first.
+
+        ``accept(lot_id)`` filters candidates during the search, e.g. to lots
+        with free slots, so the tree does not have to be re-queried with a
+        larger ``k`` when the closest lots are full.
+        """
+        self._ensure_built()
+        query = unit_vector(latitude, longitude)
+        limit = km_to_chord(max_km) ** 2 if max_km is not None else math.inf
+        with self._lock:
+            ids, axes, splits, stale, extra = self._ids, self._axes, self._splits, self._stale, self._extra
+            best = []            # max-heap of (-squared chord, lot_id)
+
+            def consider(lot_id, x, y, z):
+                if accept is not None and not accept(lot_id):
+                    return
+                d2 = (x - query[0]) ** 2 + (y - query[1]) ** 2 + (z - query[2]) ** 2
+                if d2 > limit:
+                    return
+                if len(best) < k:
+                    heapq.heappush(best, (-d2, lot_id))
+                elif d2 < -best[0][0]:
+                    heapq.heapreplace(best, (-d2, lot_id))
+
+            def search(lo, hi, depth):
+                if hi - lo <= self.leaf_size:
+                    for i in range(lo, hi):
+                        if ids[i] not in stale:
+                            consider(ids[i], axes[0][i], axes[1][i], axes[2][i])
+                    return
+                mid = (lo + hi) // 2
+                diff = query[depth % 3] - splits[mid]
+                near, far = ((lo, mid), (mid, hi)) if diff < 0 else ((mid, hi), (lo, mid))
+                search(*near, depth + 1)
+                bound = -best[0][0] if len(best) == k else limit
+                if diff * diff <= bound:
+                    search(*far, depth + 1)
+
+            if k > 0:
+                if ids:
+                    search(0, len(ids), 0)
+                for lot_id, point in extra.items():
+                    consider(lot_id, *point)
+        return [(lot_id, chord_to_km(math.sqrt(-d2))) for d2, lot_id in sorted(best, reverse=True)]
+
+    def __len__(self):
+        self._ensure_built()
+        return len(self._points)
+
+    # --- Building ---
+
+    def invalidate(self):
+        with self._lock:
+            self._built = False
+            self._generation += 1
+
+    def _ensure_built(self):
+        if self._built and time.monotonic() < self._checked + self.recheck_seconds:
+            return
+        with self._lock:
+            generation = self._generation
+        # Read before the lots, so a change landing in between shows at the next check
+        fingerprint = _lot_fingerprint()
+        self._checked = time.monotonic()
+        if self._built and fingerprint == self._fingerprint:
+            return
+        rows = db.session.query(ParkingLot.id, ParkingLot.latitude, ParkingLot.longitude).filter(
+            ParkingLot.latitude.isnot(None), ParkingLot.longitude.isnot(None)
+        )
+        points = {lot_id: unit_vector(lat, lon) for lot_id, lat, lon in rows}
+        with self._lock:
+            self._points = points
+            self._rebuild()
+            self._fingerprint = fingerprint
+            # Same retry rule as AvailabilityIndex: a commit during the read wins
+            self._built = generation == self._generation
+
+    def load(self, points):
+        """Replace the contents with ``{lot_id: (latitude, longitude)}`` (benchmarks, tests)."""
+        with self._lock:
+            self._points = {lot_id: unit_vector(lat, lon) for lot_id, (lat, lon) in points.items()}
+            self._rebuild()
+            self._built = True
+            # Not from the database, so never compared with it
+            self._checked = math.inf
+
+    def _rebuild(self):
+        import numpy as np
+        ids = np.fromiter(self._points, dtype=np.int64, count=len(self._points))
+        coords = np.array(list(self._points.values()), dtype=float).reshape(-1, 3)
+        order = np.arange(len(ids))
+        splits = np.zeros(len(ids))
+        stack = [(0, len(ids), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= self.leaf_size:
+                continue
+            mid = (lo + hi) // 2
+            part = order[lo:hi]
+            # Put the median on ``mid``, smaller values left of it, larger right
+            order[lo:hi] = part[np.argpartition(coords[part, depth % 3], mid - lo)]
+            # Recorded now: partitioning the halves moves what sits at ``mid``
+            splits[mid] = coords[order[mid], depth % 3]
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid, hi, depth + 1))
+        self._ids = ids[order].tolist()
+        self._axes = tuple(coords[order, axis].tolist() for axis in range(3))
+        self._splits = splits.tolist()
+        self._stale, self._extra = set(), {}
+
+    # --- Commit hooks ---
+
+    def _apply(self, changes):
+        with self._lock:
+            self._generation += 1
+            if not self._built:
+                return
+            for lot_id, latitude, longitude in changes:
+                if lot_id in self._points:
+                    self._stale.add(lot_id)
+                self._points.pop(lot_id, None)
+                self._extra.pop(lot_id, None)
+                if latitude is not None and longitude is not None:
+                    self._points[lot_id] = self._extra[lot_id] = unit_vector(latitude, longitude)
+            if len(self._stale) + len(self._extra) > max(64, len(self._ids) // 8):
+                self._rebuild()
+
+
+def _lot_fingerprint():
+    located = db.and_(ParkingLot.latitude.isnot(None), ParkingLot.longitude.isnot(None))
+    count, highest, latitudes, longitudes = db.session.query(
+        db.func.count(ParkingLot.id), db.func.max(ParkingLot.id),
+        db.func.sum(ParkingLot.latitude), db.func.sum(ParkingLot.longitude)
+    ).filter(located).one()
+    # Rounded: the sums only need to notice a lot moving, not every last bit
+    return count, highest, round(latitudes or 0.0, 6), round(longitudes or 0.0, 6)
+
+
+lot_locator = LotLocator()
+
+
+def nearest_available_lots(latitude, longitude, k=5, max_km=None):
+    """The ``k`` nearest lots with a free slot as (lot, occupancy_version, free, km).
+
+    Free counts come from the in-memory availability index; the chosen lots'
+    versions are checked against the database afterwards and any lot another
+    process has changed is reloaded, repeating the search if one has filled up.
+    """
+    for _ in range(3):
+        free = availability_index.free_counts()
+        found = lot_locator.nearest(latitude, longitude, k, max_km, accept=lambda lot_id: free.get(lot_id, 0) > 0)
+        versions = LotOccupancy.versions([lot_id for lot_id, _ in found])
+        if not availability_index.refresh(versions) or all(free.get(lot_id, 0) > 0 for lot_id, _ in found):
+            break
+    lots = {lot.id: lot for lot in ParkingLot.query.filter(ParkingLot.id.in_([lot_id for lot_id, _ in found]))}
+    return [(lots[lot_id], versions.get(lot_id), free.get(lot_id, 0), km) for lot_id, km in found if lot_id in lots]
+
+
+_CHANGES_KEY = 'lot_location_changes'
+
+
+def _moved(lot):
+    attrs = inspect(lot).attrs
+    return attrs.latitude.history.has_changes() or attrs.longitude.history.has_changes()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault(_CHANGES_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, ParkingLot) and obj.latitude is not None:
+            changes.append((obj.id, obj.latitude, obj.longitude))
+    for obj in session.dirty:
+        if isinstance(obj, ParkingLot) and _moved(obj):
+            changes.append((obj.id, obj.latitude, obj.longitude))
+    for obj in session.deleted:
+        if isinstance(obj, ParkingLot):
+            changes.append((obj.id, None, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes:
+        lot_locator._apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from markupsafe import Markup
+
+
+class ByteLRU:
+    """LRU of byte strings/str bounded by their total size rather than count."""
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()    # key -> (value, size)
+        self._size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size):
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.maxbytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'maxbytes': self.maxbytes,
+                'lookups': lookups,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+fragment_cache = ByteLRU(8 * 1024 * 1024)
+response_cache = ByteLRU(8 * 1024 * 1024)
+
+
+def cached_fragment(*key, caller):
+    """Template global: ``{% call cached('name', version) %}...{% endcall %}``.
+
+    The block is rendered once per key and served from ``fragment_cache``
+    afterwards, so the key must include every version the block's output
+    depends on. Anything expensive the block needs should be loaded inside it.
+    """
+    if not current_app.config['PAGE_CACHE_ENABLED']:
+        return caller()
+    html = fragment_cache.get(key)
+    if html is None:
+        html = str(caller())
+        fragment_cache.set(key, html, len(html))
+    return Markup(html)
+
+
+def cache_anonymous(view):
+    """Serve a GET view from ``response_cache`` to visitors who are not logged in.
+
+    Only for pages whose anonymous output depends on nothing but the URL:
+    requests with pending flash messages, logged-in users and non-200
+    responses always go to the view. Hits are revalidated with an ETag and
+    may be kept by browsers and shared caches for ANONYMOUS_CACHE_SECONDS.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if (request.method != 'GET' or not current_app.config['PAGE_CACHE_ENABLED']
+                or current_user.is_authenticated or session.get('_flashes')):
+            return view(*args, **kwargs)
+        key = request.full_path
+        entry = response_cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or 'Set-Cookie' in response.headers:
+                return response
+            body = response.get_data()
+            entry = (body, response.mimetype, hashlib.sha1(body).hexdigest()[:20])
+            response_cache.set(key, entry, len(body))
+        body, mimetype, etag = entry
+        response = current_app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['ANONYMOUS_CACHE_SECONDS']
+        # Logged-in visitors get something else at the same URL
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    return wrapped
+
+
+# --- Fingerprinted static files ---
+
+_digests = {}                           # path -> (mtime, size, digest)
+
+
+def static_digest(filename):
+    """Short content hash of a file under the static folder, or None if missing."""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _digests.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(path, 'rb') as f:
+        digest = hashlib.md5(f.read()).hexdigest()[:12]
+    _digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def _fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) gains ?v=<content hash>, so a changed
+    # file gets a new URL and unchanged ones can be cached for good
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        digest = static_digest(values['filename'])
+        if digest:
+            values['v'] = digest
+
+
+def _static_cache_headers(response):
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and request.args.get('v') == static_digest(request.view_args['filename'])):
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['STATIC_MAX_AGE']
+        response.cache_control.immutable = True
+    return response
+
+
+def init_page_cache(app):
+    """Size the caches and register the template global and static URL hooks."""
+    fragment_cache.maxbytes = app.config['FRAGMENT_CACHE_BYTES']
+    response_cache.maxbytes = app.config['RESPONSE_CACHE_BYTES']
+    app.jinja_env.globals['cached'] = cached_fragment
+    app.url_defaults(_fingerprint_static_urls)
+    app.after_request(_static_cache_headers)
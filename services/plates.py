@@ -0,0 +1,128 @@
+import bisect
+import threading
+from itertools import islice
+
+from models import db
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation, normalize_plate
+from models.reservation_archive import ReservationArchive
+from models.lot_occupancy import LotOccupancy
+from models.shards import each_lot_shard, gather
+from services.archive import merge_newest_first
+
+
+class PlateIndex:
+    """Process-local sorted list of the plates with an active reservation.
+
+    Serves prefix searches for gate-operator autocomplete with a binary
+    search instead of a LIKE scan. Every change to a lot's reservations bumps
+    its ``LotOccupancy.version``, so each search first reads the versions
+    (one small query per shard) and reloads only the lots that moved on,
+    whether this process or another one changed them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lots = {}          # lot_id -> [(plate, lot_id, reservation_id, slot_number, start_time)]
+        self._versions = {}      # lot_id -> LotOccupancy.version when loaded
+        self._entries = []       # every lot's entries, sorted by plate
+
+    def search(self, prefix, limit=10):
+        """Active stays whose plate starts with ``prefix``, in plate order."""
+        prefix = normalize_plate(prefix)
+        self._refresh(LotOccupancy.versions())
+        with self._lock:
+            entries = self._entries
+        start = bisect.bisect_left(entries, (prefix,))
+        matches = []
+        for plate, lot_id, reservation_id, slot_number, start_time in islice(entries, start, None):
+            if not plate.startswith(prefix) or len(matches) == limit:
+                break
+            matches.append({'vehicle_number': plate, 'lot_id': lot_id, 'reservation_id': reservation_id,
+                            'slot_number': slot_number, 'start_time': start_time.isoformat()})
+        return matches
+
+    def _refresh(self, versions):
+        with self._lock:
+            stale = sorted(lot_id for lot_id, version in versions.items() if self._versions.get(lot_id) != version)
+            gone = [lot_id for lot_id in self._versions if lot_id not in versions]
+        if not stale and not gone:
+            return
+        loaded = {lot_id: [] for lot_id in stale}
+        for part in each_lot_shard(stale, self._load):
+            for entry in part:
+                loaded[entry[1]].append(entry)
+        with self._lock:
+            for lot_id in gone:
+                self._lots.pop(lot_id, None)
+                self._versions.pop(lot_id, None)
+            for lot_id, entries in loaded.items():
+                self._lots[lot_id] = entries
+                self._versions[lot_id] = versions[lot_id]
+            self._entries = sorted(entry for entries in self._lots.values() for entry in entries)
+
+    @staticmethod
+    def _load(lot_ids):
+        return db.session.query(
+            Reservation.vehicle_number, ParkingSlot.lot_id, Reservation.id, ParkingSlot.slot_number,
+            Reservation.start_time
+        ).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id).filter(
+            Reservation.status == 'active', ParkingSlot.lot_id.in_(lot_ids)
+        ).all()
+
+
+active_plates = PlateIndex()
+
+
+def vehicle_stays(vehicle_number, limit=20):
+    """A vehicle's active stay (or None) and its ``limit`` most recent stays, live and archived.
+
+    Both come from ``ix_reservation_vehicle_start`` and its archive twin,
+    read in every shard and merged newest first.
+    """
+    plate = normalize_plate(vehicle_number)
+
+    def recent():
+        live = _live_stays(plate)
+        archived = db.session.query(
+            ReservationArchive.id, ReservationArchive.status, ReservationArchive.start_time,
+            ReservationArchive.end_time, ReservationArchive.cost, ReservationArchive.lot_id,
+            ReservationArchive.slot_number, ParkingLot.name.label('lot_name')
+        ).outerjoin(ParkingLot, ReservationArchive.lot_id == ParkingLot.id).filter(
+            ReservationArchive.vehicle_number == plate
+        )
+        return [
+            live.order_by(Reservation.start_time.desc(), Reservation.id.desc()).limit(limit).all(),
+            archived.order_by(ReservationArchive.start_time.desc(), ReservationArchive.id.desc()).limit(limit).all(),
+        ]
+
+    history = [_stay(row) for row in merge_newest_first(*gather(recent), limit=limit)]
+    active = next((stay for stay in history if stay['status'] == 'active'), None)
+    if active is None and len(history) == limit:
+        # Older than the page (unusual); look it up directly
+        rows = gather(lambda: _live_stays(plate).filter(Reservation.status == 'active').all())
+        active = _stay(rows[0]) if rows else None
+    return plate, active, history
+
+
+def _live_stays(plate):
+    return db.session.query(
+        Reservation.id, Reservation.status, Reservation.start_time, Reservation.end_time, Reservation.cost,
+        ParkingSlot.lot_id, ParkingSlot.slot_number, ParkingLot.name.label('lot_name')
+    ).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id).join(
+        ParkingLot, ParkingSlot.lot_id == ParkingLot.id
+    ).filter(Reservation.vehicle_number == plate)
+
+
+def _stay(row):
+    return {
+        'reservation_id': row.id,
+        'status': row.status,
+        'lot_id': row.lot_id,
+        'lot_name': row.lot_name,
+        'slot_number': row.slot_number,
+        'start_time': row.start_time.isoformat(),
+        'end_time': row.end_time.isoformat() if row.end_time else None,
+        'cost': row.cost,
+    }
@@ -0,0 +1,338 @@
+import csv
+import re
+from collections import Counter
+from datetime import datetime
+
+from models import db
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.lot_occupancy import LotOccupancy, slot_deltas, reservation_deltas
+from models.analytics import LotHourlyOccupancy, LotDailyRevenue
+from models.shards import use_shard, each_lot_shard, new_lot_shards, is_sharded, lot_shard, drop_lot
+from services.availability import availability_index, record_slot_change
+from services.archive import copy_to_archive
+from services.schedule import record_lot_change
+from services.nearby import parse_coordinates, lot_locator
+
+_RANGE_RE = re.compile(r'^(?P<prefix>.*?)(?P<start>\d+)\s*\.\.\s*(?P<end_prefix>.*?)(?P<end>\d+)$')
+# Statuses an admin can give a range of slots at once
+BULK_SLOT_STATUSES = ('available', 'maintenance')
+# Stays that keep their slot from being deleted: parked, or not yet paid for
+UNSETTLED_STATUSES = ('active', 'completed')
+
+class ProvisioningError(ValueError):
+    """Raised when a slot range or CSV import is invalid; nothing is written."""
+
+
+def expand_slot_range(spec):
+    """Expand ``'L1-001..L1-500'`` into slot numbers; ``'A1;A2'`` lists them.
+
+    The width of the start number is kept, so ``L1-001..L1-010`` yields
+    ``L1-001`` ... ``L1-010``.
+    """
+    spec = (spec or '').strip()
+    if not spec:
+        return []
+    if '..' not in spec:
+        return [part.strip() for part in re.split(r'[;,\s]+', spec) if part.strip()]
+
+    match = _RANGE_RE.match(spec)
+    if not match or match['prefix'] != (match['end_prefix'] or match['prefix']):
+        raise ProvisioningError(f'Invalid slot range "{spec}". Use e.g. L1-001..L1-500.')
+    start, end = int(match['start']), int(match['end'])
+    if end < start:
+        raise ProvisioningError(f'Invalid slot range "{spec}": end is before start.')
+    width = len(match['start'])
+    return [f"{match['prefix']}{n:0{width}d}" for n in range(start, end + 1)]
+
+
+def _add_slots(lot, slot_numbers, existing_count, existing_numbers):
+    """Validate and queue one lot's new slots; returns (rows, skipped)."""
+    too_long = next((number for number in slot_numbers if len(number) > 20), None)
+    if too_long:
+        raise ProvisioningError(f'Slot number "{too_long}" is longer than 20 characters.')
+    new_numbers = list(dict.fromkeys(n for n in slot_numbers if n not in existing_numbers))
+    skipped = len(slot_numbers) - len(new_numbers)
+
+    if lot.maximum_number_of_spots is not None and existing_count + len(new_numbers) > lot.maximum_number_of_spots:
+        raise ProvisioningError(
+            f'Adding {len(new_numbers)} slots would exceed the maximum capacity of '
+            f'{lot.maximum_number_of_spots} spots for "{lot.name}" ({existing_count} already exist).'
+        )
+    rows = [{'lot_id': lot.id, 'slot_number': number, 'status': 'available'} for number in new_numbers]
+    return rows, skipped
+
+
+def _insert_slots(rows_by_lot):
+    rows = [row for lot_rows in rows_by_lot.values() for row in lot_rows]
+    if rows:
+        # A list of parameter dicts runs as a single executemany
+        db.session.execute(db.insert(ParkingSlot), rows)
+    for lot_id, lot_rows in rows_by_lot.items():
+        LotOccupancy.slot_changed(lot_id, None, 'available', count=len(lot_rows))
+        record_lot_change(db.session, lot_id)
+
+
+def _existing_slots(lot_ids):
+    """Slot numbers already present per lot, in one query per shard."""
+    existing = {lot_id: set() for lot_id in lot_ids}
+
+    def read(ids):
+        return db.session.query(ParkingSlot.lot_id, ParkingSlot.slot_number).filter(ParkingSlot.lot_id.in_(ids)).all()
+
+    for rows in each_lot_shard(lot_ids, read):
+        for lot_id, number in rows:
+            existing[lot_id].add(number)
+    return existing
+
+
+def bulk_add_slots(lot, slot_numbers):
+    """Add many slots to one lot in a single transaction.
+
+    Run it in the lot's shard. Slot numbers that already exist are skipped.
+    Returns (added, skipped).
+    """
+    existing = _existing_slots([lot.id])[lot.id]
+    try:
+        rows, skipped = _add_slots(lot, slot_numbers, len(existing), existing)
+        _insert_slots({lot.id: rows})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    availability_index.invalidate([lot.id])
+    return len(rows), skipped
+
+
+def _parse_lot_row(row, line):
+    try:
+        price = float(row['price']) if row.get('price') else None
+        max_spots = int(row['maximum_number_of_spots']) if row.get('maximum_number_of_spots') else None
+    except ValueError:
+        raise ProvisioningError(f'Line {line}: invalid price or maximum_number_of_spots.')
+    try:
+        latitude, longitude = parse_coordinates(row.get('latitude'), row.get('longitude'))
+    except ValueError:
+        raise ProvisioningError(f'Line {line}: latitude and longitude must both be given, in degrees.')
+    if max_spots is not None and max_spots < 0:
+        raise ProvisioningError(f'Line {line}: maximum_number_of_spots cannot be negative.')
+    if not row.get('location'):
+        raise ProvisioningError(f'Line {line}: location is required for a new lot.')
+    return {
+        'name': row['name'],
+        'location': row['location'],
+        'price': price,
+        'address': row.get('address') or None,
+        'pin_code': row.get('pin_code') or None,
+        'maximum_number_of_spots': max_spots,
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+
+
+def import_lots_csv(stream):
+    """Create lots and slots from CSV in one transaction (one per database when sharded).
+
+    Columns: name, location, price, address, pin_code,
+    maximum_number_of_spots, latitude, longitude, slots. ``slots`` takes a range such as
+    ``L1-001..L1-500`` or a ``;``-separated list. Several rows may name the
+    same lot to add more ranges; lot details are taken from its first row and
+    ignored for lots that already exist. Returns (lots_created, slots_added,
+    slots_skipped).
+    """
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or 'name' not in reader.fieldnames:
+        raise ProvisioningError('CSV must have a header row with at least a "name" column.')
+
+    lot_rows, slot_numbers = {}, {}
+    for line, row in enumerate(reader, start=2):
+        row = {key: (value or '').strip() for key, value in row.items() if key}
+        if not row.get('name'):
+            raise ProvisioningError(f'Line {line}: lot name is required.')
+        lot_rows.setdefault(row['name'], (row, line))
+        slot_numbers.setdefault(row['name'], []).extend(expand_slot_range(row.get('slots')))
+
+    try:
+        created, added, skipped = _import_lots(lot_rows, slot_numbers)
+    except Exception:
+        db.session.rollback()
+        raise
+    availability_index.invalidate()
+    return created, added, skipped
+
+
+def _import_lots(lot_rows, slot_numbers):
+    lots = {lot.name: lot for lot in ParkingLot.query.filter(ParkingLot.name.in_(list(lot_rows)))}
+    new_lots = []
+    shards = iter(new_lot_shards(sum(1 for name in lot_rows if name not in lots)))
+    for name, (row, line) in lot_rows.items():
+        if name not in lots:
+            lot = ParkingLot(**_parse_lot_row(row, line), shard=next(shards))
+            db.session.add(lot)
+            lots[name] = lot
+            new_lots.append(lot)
+    db.session.flush()
+
+    existing = _existing_slots([lot.id for lot in lots.values()])
+    rows_by_lot, skipped = {}, 0
+    for name, numbers in slot_numbers.items():
+        lot = lots[name]
+        rows, lot_skipped = _add_slots(lot, numbers, len(existing[lot.id]), existing[lot.id])
+        rows_by_lot[lot.id] = rows
+        skipped += lot_skipped
+
+    # Everything is validated. Sharded, the lots are committed first so each
+    # shard has its copy; otherwise it is all one session and one commit.
+    new_ids = {lot.id for lot in new_lots}
+    lots_by_shard = {}
+    for lot in lots.values():
+        lots_by_shard.setdefault(lot.shard, []).append(lot.id)
+    if is_sharded():
+        db.session.commit()
+    for shard, lot_ids in lots_by_shard.items():
+        with use_shard(shard):
+            db.session.add_all(LotOccupancy(lot_id=lot_id) for lot_id in lot_ids if lot_id in new_ids)
+            _insert_slots({lot_id: rows_by_lot[lot_id] for lot_id in lot_ids if lot_id in rows_by_lot})
+            db.session.commit()
+    return len(new_lots), sum(len(rows) for rows in rows_by_lot.values()), skipped
+
+
+def _selected_slots(lot_id, slot_numbers):
+    criteria = [ParkingSlot.lot_id == lot_id]
+    if slot_numbers is not None:
+        criteria.append(ParkingSlot.slot_number.in_(slot_numbers))
+    return criteria
+
+
+def set_slot_status(lot, status, slot_numbers=None):
+    """Give many of a lot's slots (all of them when ``slot_numbers`` is None) ``status``.
+
+    Run it in the lot's shard. The slots change in one UPDATE and one
+    transaction; the counters move in one update and the availability index
+    takes the changed slots at commit. Slots with a stay in progress are
+    left alone. Returns (changed, skipped).
+    """
+    if status not in BULK_SLOT_STATUSES:
+        raise ProvisioningError(f'Slots can only be set to {" or ".join(BULK_SLOT_STATUSES)} in bulk.')
+    criteria = _selected_slots(lot.id, slot_numbers)
+    in_use = db.exists().where(Reservation.slot_id == ParkingSlot.id, Reservation.status == 'active')
+    current = db.func.coalesce(ParkingSlot.status, 'available')
+    try:
+        # Bumping the version first takes the write lock, so the slots read
+        # below are still what the UPDATE finds
+        LotOccupancy.touch(lot.id)
+        slots = db.session.query(ParkingSlot.id, ParkingSlot.slot_number, current, in_use).filter(*criteria).all()
+        changed = [(slot_id, number, old) for slot_id, number, old, held in slots if not held and old != status]
+        if changed:
+            db.session.execute(db.update(ParkingSlot).where(*criteria, ~in_use, current != status).values(status=status))
+            deltas = {}
+            for old, count in Counter(old for _, _, old in changed).items():
+                slot_deltas(old, status, count, deltas)
+            LotOccupancy.apply_many({lot.id: deltas})
+            for slot_id, number, _ in changed:
+                record_slot_change(db.session, slot_id, lot.id, number, status)
+            record_lot_change(db.session, lot.id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(changed), sum(1 for *_, held in slots if held)
+
+
+def _unsettled(slot):
+    # An aliased reservation keeps the subquery from correlating with the
+    # reservation table of an enclosing DELETE
+    stay = db.aliased(Reservation)
+    return db.exists().where(stay.slot_id == slot.id, stay.status.in_(UNSETTLED_STATUSES))
+
+
+def describe_slots(slot_numbers, limit=10):
+    """Slot numbers for a message, the first ``limit`` of them."""
+    listed = ', '.join(slot_numbers[:limit])
+    return listed + (f' and {len(slot_numbers) - limit} more' if len(slot_numbers) > limit else '')
+
+
+def _remove_slots(lot_id, slot_numbers, now):
+    """Cancel, archive and delete; returns (slots, cancelled, archived, counter deltas, kept slot numbers)."""
+    criteria = _selected_slots(lot_id, slot_numbers)
+    unsettled = _unsettled(ParkingSlot)
+    kept = [number for (number,) in db.session.query(ParkingSlot.slot_number).filter(*criteria, unsettled)
+            .order_by(ParkingSlot.slot_number)]
+    criteria.append(~unsettled)
+    on_slots = Reservation.slot_id.in_(db.select(ParkingSlot.id).where(*criteria))
+
+    deltas = {}
+    slot_counts = db.session.query(db.func.coalesce(ParkingSlot.status, 'available'), db.func.count()).filter(
+        *criteria).group_by(ParkingSlot.status).all()
+    for status, count in slot_counts:
+        slot_deltas(status, None, count, deltas)
+    cancelled = db.session.query(db.func.count(Reservation.id)).filter(on_slots, Reservation.status == 'scheduled').scalar()
+    reservation_deltas('scheduled', 'cancelled', cancelled, deltas)
+
+    # What is left on these slots is settled once advance bookings are
+    # cancelled; it all moves to the archive, which keeps the lot and slot number
+    if cancelled:
+        db.session.execute(db.update(Reservation).where(on_slots, Reservation.status == 'scheduled')
+                           .values(status='cancelled', updated_at=now))
+    archived = copy_to_archive(now, *criteria)
+    db.session.execute(db.delete(Reservation).where(on_slots))
+    db.session.execute(db.delete(ParkingSlot).where(*criteria))
+    return sum(count for _, count in slot_counts), cancelled, archived, deltas, kept
+
+
+def remove_slots(lot_id, slot_numbers=None, now=None):
+    """Delete many of a lot's slots (all of them when ``slot_numbers`` is None).
+
+    Run it in the lot's shard. Slots with a vehicle parked or a stay not yet
+    paid for are kept, so nothing owed is lost. On the others, advance
+    bookings are cancelled and every reservation is archived, so the
+    history survives. It is all a handful of set-based statements in one
+    transaction, however many rows are affected. Returns (slots,
+    reservations cancelled, reservations archived, numbers of the slots kept).
+    """
+    now = now or datetime.utcnow()
+    try:
+        # Write lock first, as in set_slot_status()
+        LotOccupancy.touch(lot_id)
+        slots, cancelled, archived, deltas, kept = _remove_slots(lot_id, slot_numbers, now)
+        LotOccupancy.apply_many({lot_id: deltas})
+        record_lot_change(db.session, lot_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    availability_index.invalidate([lot_id])
+    return slots, cancelled, archived, kept
+
+
+def remove_lot(lot_id, now=None):
+    """Delete a lot with its slots, counters and rollups, archiving its reservations.
+
+    The lot's shard is emptied the way ``remove_slots`` does it, in one
+    transaction, then the lot is dropped from the catalogue and the other
+    shards. Raises ProvisioningError, changing nothing, while any slot has a
+    vehicle parked or a stay not yet paid for. Returns (slots, reservations
+    cancelled, reservations archived).
+    """
+    now = now or datetime.utcnow()
+    with use_shard(lot_shard(lot_id)):
+        try:
+            LotOccupancy.touch(lot_id)
+            slots, cancelled, archived, _, kept = _remove_slots(lot_id, None, now)
+            if kept:
+                raise ProvisioningError(
+                    f'{len(kept)} slots have a vehicle parked or a stay awaiting payment ({describe_slots(kept)}); '
+                    f'release and settle them first.')
+            for model in (LotOccupancy, LotHourlyOccupancy, LotDailyRevenue):
+                db.session.execute(db.delete(model).where(model.lot_id == lot_id))
+            # The shard's copy of the lot; unless sharded, the lot itself
+            db.session.execute(db.delete(ParkingLot).where(ParkingLot.id == lot_id))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    drop_lot(lot_id)
+    availability_index.invalidate([lot_id])
+    lot_locator.invalidate()
+    return slots, cancelled, archived
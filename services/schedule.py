@@ -0,0 +1,269 @@
+import bisect
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db
+from models.slot import ParkingSlot
+from models.reservation import Reservation, HOLDING_STATUSES
+from models.lot_occupancy import LotOccupancy, VERSION_CHANGES_KEY
+from models.shards import use_shard, lot_shard
+from services.availability import reservation_lot
+
+WINDOW_FORMATS = ('%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M')
+
+
+def parse_window(start, end, now, max_days, max_hours):
+    """Parse form/query strings into an advance booking window (start, end).
+
+    Times are in the app's clock (UTC, like every stored time). Raises
+    ValueError with a message for the user if a time is malformed, the
+    window is empty or in the past, starts more than ``max_days`` ahead or is
+    longer than ``max_hours``.
+    """
+    start, end = _parse_time(start), _parse_time(end)
+    if end <= start:
+        raise ValueError('The end time must be after the start time.')
+    if start < now - timedelta(minutes=1):
+        raise ValueError('The start time is in the past.')
+    if start > now + timedelta(days=max_days):
+        raise ValueError(f'Bookings can be made at most {max_days} days ahead.')
+    if end - start > timedelta(hours=max_hours):
+        raise ValueError(f'A booking can be at most {max_hours} hours long.')
+    return start, end
+
+
+def _parse_time(value):
+    value = (value or '').strip()
+    for fmt in WINDOW_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError('Start and end must be given as YYYY-MM-DDTHH:MM.')
+
+
+class _SlotBookings:
+    __slots__ = ('number', 'maintenance', 'active', 'starts', 'ends')
+
+    def __init__(self, number, status):
+        self.number = number
+        # The only slot status that matters here; occupied/available follow the stays
+        self.maintenance = status == 'maintenance'
+        self.active = None       # (start_time, end_time or None) of the stay in progress
+        self.starts = []         # advance bookings, sorted and never overlapping
+        self.ends = []
+
+    def free(self, start, end, now):
+        if self.maintenance:
+            return False
+        if self.active is not None:
+            active_start, active_end = self.active
+            # Held until released, which past its booked end (or without one) could be any time
+            if active_start < end and (active_end is None or active_end <= now or active_end > start):
+                return False
+        # Only the last booking starting before ``end`` can reach past ``start``
+        i = bisect.bisect_left(self.starts, end)
+        return i == 0 or self.ends[i - 1] <= start
+
+    def copy(self):
+        slot = _SlotBookings(self.number, None)
+        slot.maintenance, slot.active, slot.starts, slot.ends = self.maintenance, self.active, list(self.starts), list(self.ends)
+        return slot
+
+    # Changes are applied idempotently: a lot loaded while a commit was
+    # landing may already include it when the commit's hook arrives
+
+    def hold(self, status, start, end):
+        if status == 'active':
+            self.active = (start, end)
+            return
+        i = bisect.bisect_left(self.starts, start)
+        if i == len(self.starts) or self.starts[i] != start:
+            self.starts.insert(i, start)
+            self.ends.insert(i, end)
+
+    def release(self, status, start):
+        if status == 'active':
+            if self.active is not None and self.active[0] == start:
+                self.active = None
+            return
+        i = bisect.bisect_left(self.starts, start)
+        if i < len(self.starts) and self.starts[i] == start:
+            del self.starts[i], self.ends[i]
+
+
+class SlotSchedule:
+    """Process-local interval index of every slot's bookings, per lot.
+
+    Each slot keeps its stay in progress and its advance bookings' windows as
+    parallel sorted lists. The booking engine never lets two bookings of a
+    slot overlap, so whether a slot is free for a window is one bisect, and
+    a lot with S slots and R bookings answers in O(S log R) without touching
+    the reservation table.
+
+    A lot is loaded on first use. This process's commits are applied to it
+    from the session hooks: ORM changes are picked up on flush, and bulk
+    statements queue theirs with ``record_booking_change`` (or
+    ``record_lot_change`` to have the lot reloaded). Each read costs one
+    primary-key lookup of the lot's ``LotOccupancy.version``. The commit
+    hook moves the cached version along with the versions its own
+    transaction wrote, so the lot is only reloaded when the version moved
+    for another reason, such as a write from another process. Booking
+    itself still probes the database under the write lock, so a stale read
+    can only offer a slot that then turns out taken.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lots = {}          # lot_id -> (LotOccupancy.version, {slot_id: _SlotBookings})
+
+    def free_slots(self, lot_id, start, end, now=None):
+        """(slot_id, slot_number, advance bookings) of the lot's slots free for all of [start, end)."""
+        now = now or datetime.utcnow()
+        return [(slot_id, slot.number, len(slot.starts))
+                for slot_id, slot in self._lot(lot_id).items() if slot.free(start, end, now)]
+
+    def _lot(self, lot_id):
+        # Read before loading, so a change committed mid-load leaves the
+        # recorded version behind and the next read reloads
+        version = LotOccupancy.versions([lot_id]).get(lot_id)
+        with self._lock:
+            cached = self._lots.get(lot_id)
+            if version is None:
+                self._lots.pop(lot_id, None)
+                return {}
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        slots = self._load(lot_id)
+        with self._lock:
+            self._lots[lot_id] = (version, slots)
+        return slots
+
+    def _apply(self, changes, moved):
+        by_lot = defaultdict(list)
+        for change in changes:
+            by_lot[change[1]].append(change)
+        with self._lock:
+            for lot_id, (before, after) in moved.items():
+                lot_changes = by_lot.pop(lot_id, [])
+                cached = self._lots.get(lot_id)
+                if cached is None:
+                    continue
+                # Another write came in between the load and this commit
+                if cached[0] != before or any(change[0] == 'reload' for change in lot_changes):
+                    del self._lots[lot_id]
+                    continue
+                # Copied, never changed in place: readers hold the old dict
+                slots = dict(cached[1])
+                for kind, _, slot_id, *args in lot_changes:
+                    if kind == 'slot':
+                        number, status = args
+                        slot = slots[slot_id] = slots[slot_id].copy() if slot_id in slots else _SlotBookings(number, status)
+                        slot.maintenance = status == 'maintenance'
+                    elif kind == 'slot_deleted':
+                        slots.pop(slot_id, None)
+                    elif slot_id in slots:
+                        slot = slots[slot_id] = slots[slot_id].copy()
+                        status, start, end = args
+                        if kind == 'hold':
+                            slot.hold(status, start, end)
+                        else:
+                            slot.release(status, start)
+                self._lots[lot_id] = (after, slots)
+            # Changes without a version move to check them against
+            for lot_id in by_lot:
+                self._lots.pop(lot_id, None)
+
+    @staticmethod
+    def _load(lot_id):
+        with use_shard(lot_shard(lot_id)):
+            slots = {
+                slot_id: _SlotBookings(number, status)
+                for slot_id, number, status in db.session.query(
+                    ParkingSlot.id, ParkingSlot.slot_number, ParkingSlot.status
+                ).filter(ParkingSlot.lot_id == lot_id).order_by(ParkingSlot.id)
+            }
+            bookings = db.session.query(
+                Reservation.slot_id, Reservation.status, Reservation.start_time, Reservation.end_time
+            ).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id).filter(
+                ParkingSlot.lot_id == lot_id, Reservation.status.in_(HOLDING_STATUSES)
+            ).order_by(Reservation.start_time)
+            for slot_id, status, start_time, end_time in bookings:
+                slot = slots[slot_id]
+                if status == 'active':
+                    slot.active = (start_time, end_time)
+                else:
+                    slot.starts.append(start_time)
+                    slot.ends.append(end_time)
+        return slots
+
+
+slot_schedule = SlotSchedule()
+
+
+_CHANGES_KEY = 'schedule_changes'
+
+
+def record_booking_change(session, lot_id, slot_id, old_status, new_status, start_time, end_time):
+    """Queue a reservation status change made outside the ORM (e.g. a bulk UPDATE)."""
+    changes = session.info.setdefault(_CHANGES_KEY, [])
+    if old_status in HOLDING_STATUSES:
+        changes.append(('release', lot_id, slot_id, old_status, start_time, end_time))
+    if new_status in HOLDING_STATUSES:
+        changes.append(('hold', lot_id, slot_id, new_status, start_time, end_time))
+
+
+def record_lot_change(session, lot_id):
+    """Have the lot reloaded after a change too broad to describe, such as bulk slot edits."""
+    session.info.setdefault(_CHANGES_KEY, []).append(('reload', lot_id))
+
+
+def _before(attr):
+    history = attr.history
+    return history.deleted[0] if history.deleted else attr.value
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault(_CHANGES_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, ParkingSlot):
+            changes.append(('slot', obj.lot_id, obj.id, obj.slot_number, obj.status or 'available'))
+        elif isinstance(obj, Reservation) and (obj.status or 'active') in HOLDING_STATUSES:
+            record_booking_change(session, reservation_lot(session, obj), obj.slot_id, None, obj.status or 'active',
+                                  obj.start_time, obj.end_time)
+    for obj in session.dirty:
+        if isinstance(obj, ParkingSlot) and inspect(obj).attrs.status.history.has_changes():
+            changes.append(('slot', obj.lot_id, obj.id, obj.slot_number, obj.status or 'available'))
+        elif isinstance(obj, Reservation):
+            attrs = inspect(obj).attrs
+            if attrs.status.history.has_changes():
+                lot_id = reservation_lot(session, obj)
+                record_booking_change(session, lot_id, obj.slot_id, _before(attrs.status), None,
+                                      _before(attrs.start_time), _before(attrs.end_time))
+                record_booking_change(session, lot_id, obj.slot_id, None, obj.status,
+                                      obj.start_time, obj.end_time)
+    for obj in session.deleted:
+        if isinstance(obj, ParkingSlot):
+            changes.append(('slot_deleted', obj.lot_id, obj.id))
+        elif isinstance(obj, Reservation) and (obj.status or 'active') in HOLDING_STATUSES:
+            record_booking_change(session, reservation_lot(session, obj), obj.slot_id, obj.status or 'active', None,
+                                  obj.start_time, obj.end_time)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    moved = session.info.pop(VERSION_CHANGES_KEY, None)
+    if changes or moved:
+        slot_schedule._apply(changes or [], moved or {})
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
+    session.info.pop(VERSION_CHANGES_KEY, None)
@@ -0,0 +1,178 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+from models import db
+from models.user import User
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.lot_occupancy import LotOccupancy
+from models.analytics import AnalyticsWatermark
+from models.user_summary import UserSummary
+from models.shards import use_shard, new_lot_shards, sync_replicas
+from services.availability import availability_index
+from services.nearby import lot_locator
+from services.tariff import Tariff
+
+SEED_PASSWORD = 'password'
+# Seeded lots are scattered around this point (central Mumbai)
+SEED_CENTRE = (19.0760, 72.8777)
+SEED_SPREAD_DEGREES = 0.08
+LOCATIONS = ('City Centre', 'Airport', 'Railway Station', 'Mall', 'Hospital', 'Stadium', 'Tech Park', 'Old Town')
+PRICES = (20.0, 30.0, 40.0, 50.0, 60.0, 80.0)
+MAINTENANCE_SHARE = 0.03
+# Status mix of past stays
+HISTORY_STATUSES = ('paid', 'completed', 'cancelled')
+HISTORY_WEIGHTS = (0.75, 0.15, 0.10)
+CHUNK_SIZE = 10000
+
+
+def _insert(model, rows):
+    for i in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(db.insert(model), rows[i:i + CHUNK_SIZE])
+
+
+def _vehicle_number(rng):
+    letters = 'ABCDEFGHJKLMNPRSTUVWXYZ'
+    return (f'{rng.choice(("MH", "KA", "DL", "TN", "GJ"))}{rng.randint(1, 50):02d}'
+            f'{rng.choice(letters)}{rng.choice(letters)}{rng.randint(1, 9999):04d}')
+
+
+def seed_demo_data(users=100, lots=10, slots_per_lot=50, reservations=5000, occupancy=0.35,
+                   days=90, seed=42, tariff=None, now=None):
+    """Fill the database with reproducible synthetic users, lots, slots and stays.
+
+    Everything is written with executemany inserts: users and lots in one
+    transaction, then each shard's slots and stays in one transaction per
+    shard. Past stays are spread over the last ``days`` days and costed with ``tariff``;
+    ``occupancy`` of the slots get an active stay that started within the
+    last day, and a few others are put under maintenance. Seeded users log in
+    with ``SEED_PASSWORD``. Names continue from existing rows, so seeding
+    twice adds more data. Returns the number of rows created per table.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow().replace(microsecond=0)
+    tariff = tariff or Tariff()
+
+    try:
+        first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+        password = generate_password_hash(SEED_PASSWORD, method='pbkdf2:sha256')
+        _insert(User, [
+            {'name': f'Seed User {n}', 'email': f'user{n}@seed.example', 'password': password, 'role': 'user'}
+            for n in range(first_user, first_user + users)
+        ])
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.id >= first_user)]
+
+        first_lot = (db.session.query(db.func.max(ParkingLot.id)).scalar() or 0) + 1
+        # Own generator so adding coordinates leaves the rest of the data unchanged
+        geo = random.Random(seed)
+        shards = iter(new_lot_shards(lots))
+        lot_rows = [{
+            'name': f'Seed Lot {n}',
+            'location': rng.choice(LOCATIONS),
+            'price': rng.choice(PRICES),
+            'address': f'{rng.randint(1, 400)} Seed Road',
+            'pin_code': f'{rng.randint(110001, 855126)}',
+            'maximum_number_of_spots': slots_per_lot,
+            'latitude': geo.gauss(SEED_CENTRE[0], SEED_SPREAD_DEGREES),
+            'longitude': geo.gauss(SEED_CENTRE[1], SEED_SPREAD_DEGREES),
+            'shard': next(shards),
+        } for n in range(first_lot, first_lot + lots)]
+        _insert(ParkingLot, lot_rows)
+        lot_prices = dict(db.session.query(ParkingLot.id, ParkingLot.price).filter(ParkingLot.id >= first_lot))
+        lot_shards = dict(db.session.query(ParkingLot.id, ParkingLot.shard).filter(ParkingLot.id >= first_lot))
+        lot_ids = sorted(lot_prices)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Bulk inserts bypass the hooks that copy users and lots into the shards
+    sync_replicas()
+
+    slot_rows = []
+    for lot_id in lot_ids:
+        for n in range(1, slots_per_lot + 1):
+            draw = rng.random()
+            status = 'occupied' if draw < occupancy else \
+                'maintenance' if draw < occupancy + MAINTENANCE_SHARE else 'available'
+            slot_rows.append({'lot_id': lot_id, 'slot_number': f'S-{n:04d}', 'status': status})
+
+    def insert_slots(shard_rows):
+        first_slot = (db.session.query(db.func.max(ParkingSlot.id)).scalar() or 0) + 1
+        _insert(ParkingSlot, shard_rows)
+        return db.session.query(ParkingSlot.id, ParkingSlot.lot_id, ParkingSlot.status).filter(
+            ParkingSlot.id >= first_slot).order_by(ParkingSlot.id).all()
+
+    slots = []
+    for shard in sorted(set(lot_shards.values())):
+        with use_shard(shard):
+            try:
+                slots += insert_slots([row for row in slot_rows if lot_shards[row['lot_id']] == shard])
+            except Exception:
+                db.session.rollback()
+                raise
+    slots.sort(key=lambda slot: (slot.lot_id, slot.id))
+
+    rows = []
+    if slots and user_ids:
+        for _ in range(reservations):
+            slot_id, lot_id, _status = rng.choice(slots)
+            # Mostly short stays, with a long tail of all-day and overnight ones
+            duration = timedelta(minutes=int(min(rng.lognormvariate(4.8, 0.8), 3 * 1440)))
+            start = now - timedelta(days=days) + timedelta(seconds=rng.randint(0, days * 86400))
+            start = min(start, now - duration)
+            end = start + duration
+            status = rng.choices(HISTORY_STATUSES, HISTORY_WEIGHTS)[0]
+            if status == 'cancelled':
+                end, updated = None, min(start + timedelta(minutes=rng.randint(1, 120)), now)
+            else:
+                updated = end
+            rows.append({'user_id': rng.choice(user_ids), 'slot_id': slot_id, 'lot_id': lot_id,
+                         'vehicle_number': _vehicle_number(rng), 'start_time': start,
+                         'end_time': end, 'status': status, 'updated_at': updated})
+        for slot_id, lot_id, status in slots:
+            if status == 'occupied':
+                start = now - timedelta(minutes=rng.randint(1, 1440))
+                rows.append({'user_id': rng.choice(user_ids), 'slot_id': slot_id, 'lot_id': lot_id,
+                             'vehicle_number': _vehicle_number(rng), 'start_time': start,
+                             'end_time': None, 'status': 'active', 'updated_at': start})
+
+    billed = [row for row in rows if row['status'] in ('paid', 'completed')]
+    if billed:
+        costs = tariff.costs(
+            np.array([row['start_time'] for row in billed], dtype='datetime64[us]'),
+            np.array([row['end_time'] for row in billed], dtype='datetime64[us]'),
+            np.array([np.nan if lot_prices[row['lot_id']] is None else lot_prices[row['lot_id']]
+                      for row in billed], dtype=float),
+        )
+        for row, cost in zip(billed, costs):
+            row['cost'] = float(cost)
+    for row in rows:
+        row.setdefault('cost', None)
+    rows.sort(key=lambda row: row['start_time'])
+
+    def insert_stays(shard):
+        _insert(Reservation, [{key: value for key, value in row.items() if key != 'lot_id'}
+                              for row in rows if lot_shards[row['lot_id']] == shard])
+        # The new stays carry historic updated_at values the incremental
+        # analytics refresh would skip; make its next run a full one.
+        db.session.query(AnalyticsWatermark).delete()
+        # Likewise for per-user totals, which are rebuilt on next read
+        db.session.query(UserSummary).delete()
+        db.session.commit()
+
+    for shard in sorted(set(lot_shards.values())):
+        with use_shard(shard):
+            try:
+                insert_stays(shard)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    LotOccupancy.rebuild()
+    availability_index.invalidate()
+    lot_locator.invalidate()
+    return {'users': users, 'lots': lots, 'slots': len(slot_rows), 'reservations': len(rows)}
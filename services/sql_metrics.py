@@ -0,0 +1,163 @@
+import logging
+import re
+import threading
+import time
+import warnings
+from collections import Counter
+from functools import partial
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+logger = logging.getLogger('parking.sql')
+
+# IN lists are expanded to one placeholder per value; collapse them so
+# "IN (?, ?, ?)" and "IN (?, ?)" count as the same shape.
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_PARAM_LIST = re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+
+
+class RepeatedQueryWarning(UserWarning):
+    """One request ran the same statement shape more than SQL_REPEAT_THRESHOLD times."""
+
+
+class RepeatedQueryError(AssertionError):
+    """Raised instead of the warning when SQL_REPEAT_RAISE is set (e.g. in tests)."""
+
+
+def statement_shape(statement):
+    """Reduce a SQL statement to its shape: literals and IN lists become ``?``."""
+    shape = _PARAM_LIST.sub('(?)', statement)
+    shape = _LITERAL.sub('?', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+class _RequestQueries:
+    """Queries seen while serving the current request (kept on ``flask.g``)."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = 0
+        self.shapes = Counter()
+
+
+class SQLMetrics:
+    """Per-endpoint query counts, DB time and repeated statement shapes.
+
+    Totals are process-local and kept since start-up or the last ``reset()``.
+    """
+
+    def __init__(self, repeat_threshold=10):
+        self.repeat_threshold = repeat_threshold
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, queries):
+        shape, repeats = queries.shapes.most_common(1)[0] if queries.shapes else (None, 0)
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                'endpoint': endpoint, 'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db_seconds': 0.0, 'max_db_seconds': 0.0, 'slow_queries': 0,
+                'repeated_requests': 0, 'worst_repeats': 0, 'worst_shape': None,
+            })
+            stats['requests'] += 1
+            stats['queries'] += queries.count
+            stats['max_queries'] = max(stats['max_queries'], queries.count)
+            stats['db_seconds'] += queries.seconds
+            stats['max_db_seconds'] = max(stats['max_db_seconds'], queries.seconds)
+            stats['slow_queries'] += queries.slow
+            if repeats > self.repeat_threshold:
+                stats['repeated_requests'] += 1
+            if repeats > stats['worst_repeats']:
+                stats['worst_repeats'], stats['worst_shape'] = repeats, shape
+
+    def snapshot(self):
+        """Per-endpoint stats, busiest (by total DB time) first."""
+        with self._lock:
+            rows = [dict(stats) for stats in self._endpoints.values()]
+        for row in rows:
+            row['avg_queries'] = row['queries'] / row['requests']
+            row['avg_db_ms'] = 1000 * row['db_seconds'] / row['requests']
+        return sorted(rows, key=lambda row: row['db_seconds'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+sql_metrics = SQLMetrics()
+
+
+def _endpoint():
+    return request.endpoint or request.path
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def _after_cursor_execute(config, conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    slow = elapsed * 1000 >= config['SQL_SLOW_QUERY_MS']
+    in_request = has_request_context()
+    if slow:
+        logger.warning('slow query %.1f ms [%s]: %s', elapsed * 1000,
+                       _endpoint() if in_request else 'no request', _SPACE.sub(' ', statement)[:1000])
+    queries = g.get('sql_queries') if in_request else None
+    if queries is not None:
+        queries.count += 1
+        queries.seconds += elapsed
+        queries.slow += slow
+        queries.shapes[statement_shape(statement)] += 1
+
+
+def _start_request():
+    g.sql_queries = _RequestQueries()
+
+
+def _check_repeats(config, response):
+    queries = g.get('sql_queries')
+    if queries is None or not queries.shapes:
+        return response
+    shape, repeats = queries.shapes.most_common(1)[0]
+    if repeats > config['SQL_REPEAT_THRESHOLD']:
+        message = (f'{_endpoint()} ran the same statement {repeats} times '
+                   f'(threshold {config["SQL_REPEAT_THRESHOLD"]}), likely an N+1: {shape[:300]}')
+        if config['SQL_REPEAT_RAISE']:
+            raise RepeatedQueryError(message)
+        warnings.warn(message, RepeatedQueryWarning, stacklevel=2)
+        logger.warning(message)
+    return response
+
+
+def _finish_request(exc):
+    # Runs after streamed responses have finished, so their queries count too
+    queries = g.pop('sql_queries', None)
+    if queries is not None:
+        sql_metrics.record(_endpoint(), queries)
+
+
+def init_sql_metrics(app):
+    """Hook query timing into every engine and per-request bookkeeping into the app."""
+    if not app.config.get('SQL_METRICS_ENABLED', True):
+        return
+    sql_metrics.repeat_threshold = app.config['SQL_REPEAT_THRESHOLD']
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', partial(_after_cursor_execute, app.config))
+            event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(partial(_check_repeats, app.config))
+    app.teardown_request(_finish_request)
@@ -0,0 +1,155 @@
+import math
+
+from models import db
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.shards import each_shard
+
+BILLED_STATUSES = ('completed', 'paid')
+# numpy is imported inside the functions that use it so that starting the
+# app (and every CLI command) does not pay for it; see wsgi.py for preloading.
+
+
+class Tariff:
+    """Turns parking intervals into costs, one at a time or as NumPy arrays.
+
+    cost = price/hr * (billable hours + sum of (multiplier - 1) * hours that
+    fall inside each time-of-day tier), then the minimum charge and currency
+    rounding are applied. Billable hours are the duration rounded up to
+    ``rounding_minutes`` (0 bills the exact duration). With the defaults this
+    is exactly ``price * duration_hours``.
+    """
+
+    def __init__(self, rounding_minutes=0, minimum_charge=0.0, tiers=(), cost_decimals=None):
+        self.rounding_minutes = rounding_minutes
+        self.minimum_charge = minimum_charge
+        self.cost_decimals = cost_decimals
+        # (start_hour, end_hour, multiplier); windows crossing midnight are split
+        self.tiers = []
+        for start_hour, end_hour, multiplier in tiers:
+            if start_hour < end_hour:
+                self.tiers.append((start_hour, end_hour, multiplier))
+            else:
+                self.tiers.append((start_hour, 24, multiplier))
+                self.tiers.append((0, end_hour, multiplier))
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            rounding_minutes=config.get('TARIFF_ROUNDING_MINUTES', 0),
+            minimum_charge=config.get('TARIFF_MINIMUM_CHARGE', 0.0),
+            tiers=config.get('TARIFF_TIERS', ()),
+            cost_decimals=config.get('TARIFF_COST_DECIMALS'),
+        )
+
+    def cost(self, start_time, end_time, price):
+        """Cost of one stay. A lot without a price costs 0."""
+        if price is None:
+            return 0.0
+        import numpy as np
+        costs = self.costs(
+            np.array([start_time], dtype='datetime64[us]'),
+            np.array([end_time], dtype='datetime64[us]'),
+            np.array([price], dtype=float),
+        )
+        return float(costs[0])
+
+    def costs(self, start_times, end_times, prices):
+        """Vectorised cost of many stays.
+
+        ``start_times``/``end_times`` are datetime64 arrays and ``prices`` a
+        float array in which NaN marks a lot without a price (cost 0).
+        """
+        import numpy as np
+        start_times = start_times.astype('datetime64[us]')
+        end_times = end_times.astype('datetime64[us]')
+        hours = (end_times - start_times) / np.timedelta64(1, 'h')
+        hours = np.maximum(hours, 0.0)
+
+        if self.rounding_minutes:
+            step = self.rounding_minutes / 60.0
+            # Tolerate float noise so an exact multiple is not bumped up a step
+            hours = np.ceil(hours / step - 1e-9) * step
+            end_times = start_times + (hours * 3600e6).astype('timedelta64[us]')
+
+        billable = hours.copy()
+        for start_hour, end_hour, multiplier in self.tiers:
+            inside = self._hours_in_window(end_times, start_hour, end_hour) - \
+                self._hours_in_window(start_times, start_hour, end_hour)
+            billable += (multiplier - 1.0) * inside
+
+        costs = np.nan_to_num(prices * billable, nan=0.0)
+        if self.minimum_charge:
+            costs = np.where(np.isnan(prices), 0.0, np.maximum(costs, self.minimum_charge))
+        if self.cost_decimals is not None:
+            costs = np.round(costs, self.cost_decimals)
+        return costs
+
+    @staticmethod
+    def _hours_in_window(times, start_hour, end_hour):
+        """Hours spent inside [start_hour, end_hour) of each day from the epoch to ``times``."""
+        import numpy as np
+        days = times.astype('datetime64[D]')
+        hour_of_day = (times - days) / np.timedelta64(1, 'h')
+        whole_days = (days - np.datetime64('1970-01-01', 'D')) / np.timedelta64(1, 'D')
+        return whole_days * (end_hour - start_hour) + np.clip(hour_of_day - start_hour, 0, end_hour - start_hour)
+
+
+def _billed_reservations(lot_id, chunk_size):
+    """Yield completed/paid reservations in lists of up to ``chunk_size`` rows."""
+    query = db.select(
+        Reservation.id, Reservation.start_time, Reservation.end_time, ParkingLot.price, Reservation.cost
+    ).join(ParkingSlot, Reservation.slot_id == ParkingSlot.id).join(
+        ParkingLot, ParkingSlot.lot_id == ParkingLot.id
+    ).where(Reservation.status.in_(BILLED_STATUSES))
+    if lot_id:
+        query = query.where(ParkingSlot.lot_id == lot_id)
+    result = db.session.execute(query.order_by(Reservation.id).execution_options(yield_per=chunk_size))
+    return result.partitions()
+
+
+def audit_costs(tariff, lot_id=None, apply=False, chunk_size=50000, tolerance=0.005, sample_size=20):
+    """Recompute stored costs of completed/paid reservations in batches.
+
+    In dry-run mode (the default) nothing is written and the returned report
+    lists how many stored costs differ from the tariff and by how much. With
+    ``apply=True`` the differing rows are updated by primary key with a
+    single executemany per shard after its rows have been read.
+    """
+    import numpy as np
+    report = {'checked': 0, 'different': 0, 'stored_total': 0.0, 'recomputed_total': 0.0, 'samples': []}
+
+    def audit_shard():
+        updates = []
+        for chunk in _billed_reservations(lot_id, chunk_size):
+            ids = np.array([row[0] for row in chunk])
+            start_times = np.array([row[1] for row in chunk], dtype='datetime64[us]')
+            end_times = np.array([row[2] for row in chunk], dtype='datetime64[us]')
+            prices = np.array([math.nan if row[3] is None else row[3] for row in chunk], dtype=float)
+            stored = np.array([math.nan if row[4] is None else row[4] for row in chunk], dtype=float)
+
+            recomputed = tariff.costs(start_times, end_times, prices)
+            differs = np.isnan(stored) | (np.abs(recomputed - np.nan_to_num(stored)) > tolerance)
+
+            report['checked'] += len(chunk)
+            report['different'] += int(differs.sum())
+            report['stored_total'] += float(np.nansum(stored))
+            report['recomputed_total'] += float(recomputed.sum())
+            for i in np.flatnonzero(differs)[:max(0, sample_size - len(report['samples']))]:
+                report['samples'].append({
+                    'id': int(ids[i]),
+                    'stored': None if np.isnan(stored[i]) else float(stored[i]),
+                    'recomputed': float(recomputed[i]),
+                })
+            if apply:
+                updates.extend({'id': int(i), 'cost': float(c)} for i, c in zip(ids[differs], recomputed[differs]))
+
+        if apply and updates:
+            # Rows were streamed with yield_per; write only once reading is done
+            db.session.execute(db.update(Reservation), updates)
+            db.session.commit()
+
+    each_shard(audit_shard, lot_id=lot_id)
+    report['applied'] = apply
+    return report
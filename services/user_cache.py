@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db
+from models.user import User
+
+# Columns copied into SessionUser; a change to any of them (or to the
+# password) drops the cached entry.
+CACHED_COLUMNS = ('id', 'name', 'email', 'role')
+_INVALIDATING = CACHED_COLUMNS + ('password',)
+
+
+class SessionUser(UserMixin):
+    """Detached, read-only copy of a ``User`` used as ``current_user``.
+
+    It carries only what the templates and permission checks read, so it is
+    safe to share between requests and threads. Load the ``User`` row when
+    relationships or the password hash are needed.
+    """
+
+    def __init__(self, id, name, email, role):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.role = role
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def __repr__(self):
+        return f'<SessionUser {self.email}>'
+
+
+class UserCache:
+    """Bounded LRU of SessionUser records with a time-to-live.
+
+    Entries expire after ``ttl`` seconds so other processes' changes are
+    picked up; changes committed in this process invalidate the entry at
+    once through the session hooks below.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()    # user_id -> (expires_at, SessionUser or None)
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def configure(self, maxsize, ttl):
+        with self._lock:
+            self.maxsize, self.ttl = maxsize, ttl
+            self._entries.clear()
+
+    def get(self, user_id):
+        """Return the SessionUser for ``user_id``, or None if there is no such user."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        row = db.session.execute(
+            db.select(*(getattr(User, column) for column in CACHED_COLUMNS)).where(User.id == user_id)
+        ).first()
+        user = SessionUser(*row) if row else None
+        if self.maxsize and self.ttl:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, user)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return user
+
+    def invalidate(self, user_id=None):
+        """Drop one user's entry, or every entry when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'lookups': lookups,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                # user_loader runs once per authenticated request and a hit
+                # replaces exactly one SELECT
+                'queries_saved': self.hits,
+                'queries_saved_per_request': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+user_cache = UserCache()
+
+_CHANGED_KEY = 'user_cache_changed'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_user_changes(session, flush_context):
+    changed = [
+        obj.id for obj in session.dirty
+        if isinstance(obj, User) and any(inspect(obj).attrs[column].history.has_changes() for column in _INVALIDATING)
+    ]
+    changed += [obj.id for obj in session.deleted if isinstance(obj, User)]
+    if changed:
+        session.info.setdefault(_CHANGED_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users(session):
+    for user_id in session.info.pop(_CHANGED_KEY, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,146 @@
+"""Concurrent requests against the booking engine and the release/pay routes.
+
+Each test races several threads on the same rows of a file-backed SQLite
+database and checks that exactly one of them won, and that the per-lot
+counters and per-user totals still match a rebuild from the tables.
+Run from the project root with ``python -m pytest``.
+"""
+import threading
+
+import pytest
+
+from app import create_app
+from models import db
+from models.user import User
+from models.lot import ParkingLot
+from models.slot import ParkingSlot
+from models.reservation import Reservation
+from models.lot_occupancy import LotOccupancy, COUNTER_COLUMNS
+from models.user_summary import UserSummary
+from services.booking import claim_slot, claim_any_slot, SlotUnavailable
+
+THREADS = 8
+PASSWORD = 'race'
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp('races') / 'races.db'
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    with app.app_context():
+        db.create_all()
+        for i in range(THREADS):
+            user = User(name=f'racer{i}', email=f'racer{i}@example.com', role='user')
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def _new_lot(app, name, slots):
+    with app.app_context():
+        lot = ParkingLot(name=name, location='Test', price=60.0)
+        lot.slots = [ParkingSlot(slot_number=f'{name}-{i}', status='available') for i in range(slots)]
+        db.session.add(lot)
+        db.session.commit()
+        LotOccupancy.rebuild()
+        return lot.id, [slot.id for slot in lot.slots]
+
+
+def _user_ids(app):
+    with app.app_context():
+        return [user_id for (user_id,) in db.session.query(User.id).filter(User.role == 'user').order_by(User.id)]
+
+
+def _race(calls):
+    """Run the callables at once, one thread each; returns their results (or raised exceptions)."""
+    start = threading.Barrier(len(calls))
+    results = [None] * len(calls)
+
+    def run(i, call):
+        start.wait()
+        try:
+            results[i] = call()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _in_context(app, fn, *args):
+    def call():
+        with app.app_context():
+            try:
+                return fn(*args).id
+            finally:
+                db.session.remove()
+    return call
+
+
+def _assert_counters_match_rebuild(app):
+    with app.app_context():
+        kept = {lot.id: {c: getattr(o, c) for c in COUNTER_COLUMNS} for lot, o in LotOccupancy.for_lots()}
+        LotOccupancy.rebuild()
+        rebuilt = {lot.id: {c: getattr(o, c) for c in COUNTER_COLUMNS} for lot, o in LotOccupancy.for_lots()}
+    assert kept == rebuilt
+
+
+def test_one_slot_claimed_by_many_threads_is_booked_once(app):
+    _, (slot_id,) = _new_lot(app, 'One', 1)
+    users = _user_ids(app)
+    results = _race([_in_context(app, claim_slot, slot_id, user_id, f'MH01ONE{n:03d}')
+                     for n, user_id in enumerate(users)])
+
+    assert sum(isinstance(result, int) for result in results) == 1
+    assert all(isinstance(result, (int, SlotUnavailable)) for result in results), results
+    with app.app_context():
+        assert Reservation.query.filter_by(slot_id=slot_id, status='active').count() == 1
+    _assert_counters_match_rebuild(app)
+
+
+def test_any_free_slot_hands_each_slot_out_once(app):
+    lot_id, slot_ids = _new_lot(app, 'Any', 3)
+    users = _user_ids(app)
+    results = _race([_in_context(app, claim_any_slot, lot_id, user_id, f'MH01ANY{n:03d}')
+                     for n, user_id in enumerate(users)])
+
+    assert sum(isinstance(result, int) for result in results) == len(slot_ids)
+    with app.app_context():
+        active = [slot_id for (slot_id,) in db.session.query(Reservation.slot_id).filter(
+            Reservation.slot_id.in_(slot_ids), Reservation.status == 'active')]
+    assert sorted(active) == sorted(slot_ids)
+    _assert_counters_match_rebuild(app)
+
+
+def test_double_release_and_payment_count_once(app):
+    _, (slot_id,) = _new_lot(app, 'Pay', 1)
+    user_id = _user_ids(app)[0]
+    with app.app_context():
+        reservation_id = claim_slot(slot_id, user_id, 'MH01PAY001').id
+        email = db.session.get(User, user_id).email
+        UserSummary.for_user(user_id)
+        db.session.commit()
+
+    clients = []
+    for _ in range(4):
+        client = app.test_client()
+        client.post('/auth/login', data={'email': email, 'password': PASSWORD})
+        clients.append(client)
+    _race([lambda c=c: c.get(f'/release_slot/{reservation_id}') for c in clients])
+    _race([lambda c=c: c.post(f'/pay/{reservation_id}') for c in clients])
+
+    with app.app_context():
+        assert db.session.get(Reservation, reservation_id).status == 'paid'
+        summary = db.session.get(UserSummary, user_id)
+        kept = (summary.reservations, summary.hours, summary.spend)
+        db.session.delete(summary)
+        db.session.flush()
+        rebuilt = UserSummary.rebuild(user_id)
+        assert kept == pytest.approx((rebuilt.reservations, rebuilt.hours, rebuilt.spend))
+        db.session.rollback()
+    _assert_counters_match_rebuild(app)
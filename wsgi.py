@@ -0,0 +1,23 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Builds the app with APP_CONFIG (default 'production') and without the
+management commands or Flask-Migrate. With BOOTSTRAP_ON_START=1 the schema
+and first admin are brought up to date here, once, before workers fork.
+"""
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('APP_CONFIG', 'production'), cli=False)
+
+if app.config['BOOTSTRAP_ON_START']:
+    from services.bootstrap import bootstrap
+    for line in bootstrap(app):
+        print(line, flush=True)
+
+# Billing and analytics import numpy on first use. Loading it here means a
+# preloading server imports it once in the master, and the forked workers
+# share those pages instead of each importing its own copy.
+import numpy  # noqa: E402,F401